@@ -0,0 +1,167 @@
+import os
+import re
+import json
+import time
+import asyncio
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from tokens import estimate_tokens
+from usage import UsageScope, current_usage_scope, usage_split
+
+BATCH_ITEM_MARKER = "### item "
+_ITEM_SPLIT = re.compile(r"^\s*### item (\d+)\s*$", re.MULTILINE)
+
+
+class BatchItemError(Exception):
+    """The batched response had no usable result for this item"""
+
+
+def build_batch_prompt(contexts: List[str]) -> str:
+    """Combine several analysis prompts into one multi-item request"""
+    items = "\n".join(f"{BATCH_ITEM_MARKER}{index}\n{context}" for index, context in enumerate(contexts))
+    return f"""
+        以下の {len(contexts)} 件の会話をそれぞれ独立に分析してください。
+        結果は入力と同じ順序の JSON 配列で出力し、各要素には "item" (番号) と
+        user_performance_score, communication_effectiveness, stress_management,
+        suggestions, improvement_areas を含めてください。
+
+{items}
+        """
+
+
+def split_batch_prompt(prompt: str) -> List[str]:
+    """Item prompts of a multi-item request, in order"""
+    parts = _ITEM_SPLIT.split(prompt)
+    # parts = [前置き, 番号, 本文, 番号, 本文, ...]
+    return [parts[i + 1] for i in range(1, len(parts) - 1, 2)]
+
+
+def parse_batch_response(text: str, size: int) -> List[Optional[Dict[str, Any]]]:
+    """Per-item analyses from a batched response; ``None`` where an item is unusable"""
+    results: List[Optional[Dict[str, Any]]] = [None] * size
+    try:
+        parsed = json.loads(text)
+    except ValueError:
+        return results
+    if isinstance(parsed, dict):
+        parsed = parsed.get("items")
+    if not isinstance(parsed, list):
+        return results
+    for position, item in enumerate(parsed):
+        if not isinstance(item, dict) or "user_performance_score" not in item:
+            continue
+        index = item.get("item", position)
+        if isinstance(index, int) and 0 <= index < size and results[index] is None:
+            results[index] = {key: value for key, value in item.items() if key != "item"}
+    return results
+
+
+class AnalysisBatcher:
+    """Collects concurrent analysis prompts into multi-item agent calls
+
+    A batch is sent when ``max_items`` prompts are waiting or ``window``
+    seconds after the first one arrived. Items the batched response does
+    not answer properly raise ``BatchItemError`` so the caller can retry
+    them individually. The usage of a batched call is split across the
+    submitters' usage scopes in proportion to their prompt sizes.
+    """
+
+    def __init__(self, call: Callable[[str], Awaitable[str]], max_items: int = None, window: float = None):
+        self.call = call
+        self.max_items = max_items or int(os.getenv("ANALYSIS_BATCH_MAX_ITEMS", "8"))
+        self.window = window or float(os.getenv("ANALYSIS_BATCH_WINDOW_MS", "20")) / 1000
+        self._pending: List[Tuple[str, asyncio.Future, float, UsageScope]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: Set[asyncio.Task] = set()
+
+        self.batches = 0
+        self.items = 0
+        self.batch_sizes: Dict[int, int] = {}
+        self.batch_failures = 0
+        self.item_fallbacks = 0
+        self._waits = deque(maxlen=1000)
+
+    async def submit(self, context: str) -> str:
+        """Queue one analysis prompt and wait for its response text"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((context, future, time.perf_counter(), current_usage_scope()))
+        if len(self._pending) >= self.max_items:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        # 待機中にキャンセルされた項目は送らない
+        batch = [entry for entry in self._pending if not entry[1].done()]
+        self._pending = []
+        if batch:
+            task = asyncio.create_task(self._run_batch(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run_batch(self, batch: List[Tuple[str, asyncio.Future, float, UsageScope]]) -> None:
+        started = time.perf_counter()
+        for _, _, enqueued_at, _ in batch:
+            self._waits.append(started - enqueued_at)
+        self.batches += 1
+        self.items += len(batch)
+        self.batch_sizes[len(batch)] = self.batch_sizes.get(len(batch), 0) + 1
+
+        # このタスクはフラッシュを起こした依頼元のスコープを引き継ぐので、使用量は明示的に按分する
+        with usage_split([(scope, estimate_tokens(context)) for context, _, _, scope in batch]):
+            await self._send(batch)
+
+    async def _send(self, batch: List[Tuple[str, asyncio.Future, float, UsageScope]]) -> None:
+        if len(batch) == 1:
+            context, future, _, _ = batch[0]
+            try:
+                result = await self.call(context)
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+                return
+            if not future.done():
+                future.set_result(result)
+            return
+
+        try:
+            text = await self.call(build_batch_prompt([context for context, _, _, _ in batch]))
+            results = parse_batch_response(str(text), len(batch))
+        except Exception:
+            self.batch_failures += 1
+            results = [None] * len(batch)
+
+        for (_, future, _, _), result in zip(batch, results):
+            if future.done():
+                continue
+            if result is None:
+                self.item_fallbacks += 1
+                future.set_exception(BatchItemError("No usable result for batched item"))
+            else:
+                future.set_result(json.dumps(result, ensure_ascii=False))
+
+    def get_stats(self) -> Dict[str, Any]:
+        waits = sorted(self._waits)
+        return {
+            "max_items": self.max_items,
+            "window_ms": round(self.window * 1000, 3),
+            "batches": self.batches,
+            "items": self.items,
+            "mean_batch_size": round(self.items / self.batches, 2) if self.batches else None,
+            "batch_sizes": dict(sorted(self.batch_sizes.items())),
+            # 待ち時間ウィンドウによって増えたレイテンシ
+            "added_wait_ms": {
+                "mean": round(sum(waits) / len(waits) * 1000, 3),
+                "p99": round(waits[max(0, int(len(waits) * 0.99) - 1)] * 1000, 3),
+                "max": round(waits[-1] * 1000, 3),
+            } if waits else None,
+            "calls_saved": self.items - self.batches,
+            "batch_failures": self.batch_failures,
+            "item_fallbacks": self.item_fallbacks,
+        }
@@ -0,0 +1,130 @@
+import os
+import time
+import uuid
+import asyncio
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+
+from shared_state import StateBackend, MemoryStateBackend
+
+
+class TicketStatus:
+    PENDING = "pending"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+    FINISHED = (COMPLETED, FAILED)
+
+
+class AnalysisTickets:
+    """Analyses that finish after the boss reply of a two-phase turn was returned
+
+    The analysis runs on the worker that issued the ticket; its record
+    lives in the shared state backend so any worker can answer polls.
+    """
+
+    PREFIX = "ticket:"
+
+    def __init__(self, backend: StateBackend = None, ttl: float = None, poll_interval: float = 0.2):
+        self.backend = backend or MemoryStateBackend()
+        self.ttl = ttl or float(os.getenv("ANALYSIS_TICKET_TTL_SECONDS", "600"))
+        self.poll_interval = poll_interval
+        # このワーカーで実行中の分析のみ保持する
+        self._pending: Dict[str, asyncio.Event] = {}
+        self._records: Dict[str, Dict[str, Any]] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+        self.issued = 0
+        self.completed = 0
+        self.failed = 0
+        self._delays = deque(maxlen=1000)
+
+    async def issue(self, run: Callable[[], Awaitable[Dict[str, Any]]]) -> str:
+        """Start ``run`` in the background and return the ticket for its result"""
+        ticket = uuid.uuid4().hex
+        record = {
+            "ticket": ticket,
+            "status": TicketStatus.PENDING,
+            "created_at": time.time(),
+            "finished_at": None,
+            "result": None,
+            "error": None,
+        }
+        self._pending[ticket] = asyncio.Event()
+        self._records[ticket] = record
+        await self.backend.set(self.PREFIX + ticket, record, self.ttl)
+        task = asyncio.create_task(self._run(ticket, run))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        self.issued += 1
+        return ticket
+
+    async def _run(self, ticket: str, run: Callable[[], Awaitable[Dict[str, Any]]]) -> None:
+        record = self._records[ticket]
+        try:
+            record["result"] = await run()
+            record["status"] = TicketStatus.COMPLETED
+            self.completed += 1
+        except asyncio.CancelledError:
+            record["status"] = TicketStatus.FAILED
+            record["error"] = "cancelled"
+            self.failed += 1
+            raise
+        except Exception as e:
+            record["status"] = TicketStatus.FAILED
+            record["error"] = str(e)
+            self.failed += 1
+        finally:
+            record["finished_at"] = time.time()
+            self._delays.append(record["finished_at"] - record["created_at"])
+            try:
+                await self.backend.set(self.PREFIX + ticket, record, self.ttl)
+            finally:
+                self._records.pop(ticket, None)
+                self._pending.pop(ticket).set()
+
+    async def get(self, ticket: str) -> Optional[Dict[str, Any]]:
+        """Look up a ticket record"""
+        record = self._records.get(ticket)
+        if record is not None:
+            return dict(record)
+        return await self.backend.get(self.PREFIX + ticket)
+
+    async def wait(self, ticket: str, timeout: float) -> Optional[Dict[str, Any]]:
+        """Wait up to ``timeout`` seconds for the analysis to finish and return its record"""
+        done = self._pending.get(ticket)
+        if done is not None:
+            try:
+                await asyncio.wait_for(done.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+            return await self.get(ticket)
+
+        # 他のワーカーが発行したチケットは共有ストアをポーリングする
+        deadline = time.monotonic() + timeout
+        while True:
+            record = await self.get(ticket)
+            if record is None or record["status"] in TicketStatus.FINISHED:
+                return record
+            if time.monotonic() >= deadline:
+                return record
+            await asyncio.sleep(self.poll_interval)
+
+    async def stop(self) -> None:
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def get_stats(self) -> Dict[str, Any]:
+        delays = sorted(self._delays)
+        return {
+            "issued": self.issued,
+            "pending": len(self._pending),
+            "completed": self.completed,
+            "failed": self.failed,
+            # 上司の応答を返してから分析が揃うまでの時間
+            "analysis_delay_ms": {
+                "p50": round(delays[len(delays) // 2] * 1000, 1),
+                "p99": round(delays[max(0, int(len(delays) * 0.99) - 1)] * 1000, 1),
+            } if delays else None,
+        }
@@ -0,0 +1,314 @@
+"""Performance benchmarks for the ADK backend
+
+Usage:
+    python benchmark.py workers --max-workers 4 --requests 2000 --concurrency 64 [--users 50]
+    python benchmark.py startup --runs 5 [--warmup]
+    python benchmark.py replay --cassette agent_cassette.jsonl [--latency-scale 0] [--compare previous.json]
+"""
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import subprocess
+from typing import Any, Dict, List, Tuple
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+SAMPLE_REQUEST: Dict[str, Any] = {
+    "boss_persona": {
+        "id": "demanding_perfectionist",
+        "name": "田中課長",
+        "description": "完璧主義で要求が厳しい上司。高い成果を期待する。",
+        "difficulty": 7,
+        "stress_triggers": ["ミス", "効率の悪さ", "言い訳"],
+        "communication_style": "直接的で厳格",
+    },
+    "user_state": {"stress_level": "中", "confidence": 65, "engagement": 80},
+    "user_message": "申し訳ございません、プロジェクトの進捗が予定より少し遅れています。詳細な対策を検討中です。",
+    "context": "月次進捗会議での報告",
+}
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(workers: int, extra_env: Dict[str, str] = None) -> Tuple[subprocess.Popen, str]:
+    """Launch main.py as a subprocess and return (process, base_url)"""
+    port = _free_port()
+    env = dict(os.environ)
+    env.update({
+        "PORT": str(port),
+        "HOST": "127.0.0.1",
+        "DEBUG": "false",
+        "WORKERS": str(workers),
+        "STATE_BACKEND": env.get("STATE_BACKEND", "sqlite"),
+        "STATE_SQLITE_PATH": os.path.join(BACKEND_DIR, f".bench-state-{port}.db"),
+        # 負荷はすべて同じIPから送るので、レート制限を外して 429 を計測しないようにする
+        "RATE_LIMITS": "",
+        "USER_RATE_LIMITS": "",
+    })
+    env.update(extra_env or {})
+    process = subprocess.Popen(
+        [sys.executable, "main.py"],
+        cwd=BACKEND_DIR,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    return process, f"http://127.0.0.1:{port}"
+
+
+def stop_server(process: subprocess.Popen, base_url: str) -> None:
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+    port = base_url.rsplit(":", 1)[1]
+    for suffix in ("", "-wal", "-shm"):
+        path = os.path.join(BACKEND_DIR, f".bench-state-{port}.db{suffix}")
+        if os.path.exists(path):
+            os.remove(path)
+
+
+async def wait_until_up(base_url: str, path: str = "/", timeout: float = 30.0) -> float:
+    """Poll ``path`` until it returns 200; return the elapsed seconds"""
+    started = time.perf_counter()
+    async with httpx.AsyncClient() as client:
+        while time.perf_counter() - started < timeout:
+            try:
+                response = await client.get(base_url + path)
+                if response.status_code == 200:
+                    return time.perf_counter() - started
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.05)
+    raise RuntimeError(f"Server at {base_url} did not become available")
+
+
+async def run_load(base_url: str, total: int, concurrency: int, users: int = 0) -> Dict[str, Any]:
+    """Send ``total`` training requests with ``concurrency`` clients
+
+    With ``users`` the requests carry one of that many user and session
+    ids, so every turn also updates progress and suggestions in the shared
+    state backend. Without it turns do not touch the state backend.
+    """
+    latencies: List[float] = []
+    errors = 0
+    statuses: Dict[int, int] = {}
+    remaining = iter(range(total))
+
+    def payload(index: int) -> Dict[str, Any]:
+        if not users:
+            return SAMPLE_REQUEST
+        return {**SAMPLE_REQUEST, "user_id": f"bench-{index % users}", "session_id": f"bench-{index % users}"}
+
+    async def client_loop(client: httpx.AsyncClient):
+        nonlocal errors
+        for index in remaining:
+            started = time.perf_counter()
+            response = await client.post(f"{base_url}/api/training/process", json=payload(index))
+            latencies.append(time.perf_counter() - started)
+            if response.status_code != 200:
+                errors += 1
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=60) as client:
+        started = time.perf_counter()
+        cpu_started = time.process_time()
+        await asyncio.gather(*(client_loop(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+        client_cpu = time.process_time() - cpu_started
+
+    if errors:
+        # 失敗したリクエストを含むスループットは意味がないので結果として扱わない
+        raise RuntimeError(f"{errors} of {total} requests failed (status codes: {statuses})")
+
+    latencies.sort()
+    return {
+        "requests": total,
+        "errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(total / elapsed, 1),
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 2),
+        "p99_ms": round(latencies[int(len(latencies) * 0.99) - 1] * 1000, 2),
+        # 負荷生成側が使ったCPU (1.0 でコア1つを使い切っている)
+        "client_cpu_share": round(client_cpu / elapsed, 2),
+    }
+
+
+async def bench_workers(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    """Throughput scaling from 1 to N uvicorn workers
+
+    The load generator runs on the same machine, so worker counts that
+    leave no core for it (workers + 1 > CPU count) measure CPU contention
+    rather than scaling; they are flagged in the output.
+    """
+    cpus = os.cpu_count() or 1
+    results = []
+    for workers in range(1, args.max_workers + 1):
+        process, base_url = start_server(workers)
+        try:
+            await wait_until_up(base_url)
+            # ウォームアップ
+            await run_load(base_url, min(100, args.requests), args.concurrency, args.users)
+            result = await run_load(base_url, args.requests, args.concurrency, args.users)
+        finally:
+            stop_server(process, base_url)
+        result["workers"] = workers
+        result["oversubscribed"] = workers + 1 > cpus
+        results.append(result)
+        print(json.dumps(result))
+
+    baseline = results[0]["throughput_rps"]
+    print("\nworkers  rps       speedup  p50_ms   p99_ms   client_cpu")
+    for result in results:
+        print(
+            f"{result['workers']:<8} {result['throughput_rps']:<9} "
+            f"{result['throughput_rps'] / baseline:<8.2f} {result['p50_ms']:<8} {result['p99_ms']:<8} "
+            f"{result['client_cpu_share']}{'  (oversubscribed)' if result['oversubscribed'] else ''}"
+        )
+    if any(result["oversubscribed"] for result in results):
+        print(f"\n⚠️  {cpus} CPU(s): rows marked oversubscribed share cores with the load generator")
+    return results
+
+
+async def bench_startup(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    """Time to /live, time to /ready and first-request latency of a fresh process"""
+    extra_env = {"WARMUP_ON_STARTUP": "true" if args.warmup else "false"}
+    results = []
+    for run in range(args.runs):
+        process, base_url = start_server(1, extra_env)
+        try:
+            live_s = await wait_until_up(base_url, "/live")
+            ready_s = await wait_until_up(base_url, "/ready")
+            async with httpx.AsyncClient(timeout=60) as client:
+                request_started = time.perf_counter()
+                await client.post(f"{base_url}/api/training/process", json=SAMPLE_REQUEST)
+                first_ms = (time.perf_counter() - request_started) * 1000
+                request_started = time.perf_counter()
+                await client.post(f"{base_url}/api/training/process", json=SAMPLE_REQUEST)
+                second_ms = (time.perf_counter() - request_started) * 1000
+                lifecycle = (await client.get(f"{base_url}/ready")).json()
+        finally:
+            stop_server(process, base_url)
+        result = {
+            "run": run,
+            "spawn_to_live_ms": round(live_s * 1000, 2),
+            "live_to_ready_ms": round(ready_s * 1000, 2),
+            "first_request_ms": round(first_ms, 2),
+            "second_request_ms": round(second_ms, 2),
+            "server_startup_ms": lifecycle["startup_ms"],
+            "server_time_to_ready_ms": lifecycle["time_to_ready_ms"],
+        }
+        results.append(result)
+        print(json.dumps(result))
+    return results
+
+
+async def bench_replay(args: argparse.Namespace) -> Dict[str, Any]:
+    """Replay recorded traffic through process_training_interaction in-process"""
+    os.environ.update({
+        "AGENT_CASSETTE_MODE": "replay",
+        "AGENT_CASSETTE_PATH": args.cassette,
+        "REPLAY_LATENCY_SCALE": str(args.latency_scale),
+        "STATE_BACKEND": "memory",
+    })
+    sys.path.insert(0, BACKEND_DIR)
+    from adk_system import VirtualBossADKSystem
+    from models import TrainingRequest
+
+    system = VirtualBossADKSystem()
+    requests = [TrainingRequest(**payload) for payload in system.cassette.requests] * args.repeat
+    if not requests:
+        raise SystemExit(f"No recorded requests in {args.cassette}")
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies: List[float] = []
+
+    async def run_one(request):
+        async with semaphore:
+            started = time.perf_counter()
+            await system.process_training_interaction(
+                boss_persona=request.boss_persona,
+                user_state=request.user_state,
+                user_message=request.user_message,
+                context=request.context,
+                user_id=request.user_id,
+                session_id=request.session_id,
+            )
+            latencies.append(time.perf_counter() - started)
+
+    cpu_started = time.process_time()
+    wall_started = time.perf_counter()
+    await asyncio.gather(*(run_one(request) for request in requests))
+    wall = time.perf_counter() - wall_started
+    cpu = time.process_time() - cpu_started
+
+    latencies.sort()
+    result = {
+        "turns": len(requests),
+        "wall_s": round(wall, 3),
+        "cpu_ms_per_turn": round(cpu / len(requests) * 1000, 3),
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 2),
+        "p99_ms": round(latencies[max(0, int(len(latencies) * 0.99) - 1)] * 1000, 2),
+        "replay_hits": sum(agent.hits for agent in system.agents),
+        "replay_misses": sum(agent.misses for agent in system.agents),
+    }
+    print(json.dumps(result))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f)
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+        for metric in ("cpu_ms_per_turn", "p50_ms", "p99_ms"):
+            change = (result[metric] - previous[metric]) / previous[metric] * 100 if previous[metric] else 0.0
+            print(f"{metric:<16} {previous[metric]:>10} -> {result[metric]:>10} ({change:+.1f}%)")
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    workers = subparsers.add_parser("workers", help="throughput scaling across worker counts")
+    # 負荷生成用に1コア残す
+    workers.add_argument("--max-workers", type=int, default=max(1, (os.cpu_count() or 2) - 1))
+    workers.add_argument("--requests", type=int, default=2000)
+    workers.add_argument("--concurrency", type=int, default=64)
+    workers.add_argument("--users", type=int, default=0,
+                         help="spread requests over this many user/session ids (exercises the state backend)")
+    workers.set_defaults(func=bench_workers)
+
+    startup = subparsers.add_parser("startup", help="startup time and first-request latency")
+    startup.add_argument("--runs", type=int, default=5)
+    startup.add_argument("--warmup", action="store_true", help="enable WARMUP_ON_STARTUP")
+    startup.set_defaults(func=bench_startup)
+
+    replay = subparsers.add_parser("replay", help="replay recorded traffic offline")
+    replay.add_argument("--cassette", default="agent_cassette.jsonl")
+    replay.add_argument("--latency-scale", type=float, default=0.0,
+                        help="multiplier for recorded latencies (0 = CPU only)")
+    replay.add_argument("--repeat", type=int, default=1)
+    replay.add_argument("--concurrency", type=int, default=16)
+    replay.add_argument("--output", help="write the result JSON to this file")
+    replay.add_argument("--compare", help="previous result JSON to compare against")
+    replay.set_defaults(func=bench_replay)
+
+    args = parser.parse_args()
+    asyncio.run(args.func(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+import os
+import json
+import time
+import random
+import asyncio
+import hashlib
+from typing import Any, Dict, List, Optional
+
+from tokens import AgentText, estimate_tokens
+
+
+class CassetteMissError(Exception):
+    """Raised in replay mode when no recording matches the prompt"""
+
+
+def prompt_hash(agent_id: str, prompt: str) -> str:
+    return hashlib.sha256(f"{agent_id}\0{prompt}".encode("utf-8")).hexdigest()[:32]
+
+
+class Cassette:
+    """JSON Lines file of recorded agent calls and training requests
+
+    Each line is either ``{"type": "call", ...}`` (prompt hash, response,
+    observed latency, token counts) or ``{"type": "request", ...}`` (a
+    training request payload, so traffic can be replayed offline).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._calls: Dict[str, List[Dict[str, Any]]] = {}
+        self._by_agent: Dict[str, List[Dict[str, Any]]] = {}
+        self._cursor: Dict[str, int] = {}
+        self.requests: List[Dict[str, Any]] = []
+
+    @classmethod
+    def load(cls, path: str) -> "Cassette":
+        cassette = cls(path)
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if record["type"] == "call":
+                    cassette._calls.setdefault(record["hash"], []).append(record)
+                    cassette._by_agent.setdefault(record["agent_id"], []).append(record)
+                elif record["type"] == "request":
+                    cassette.requests.append(record["payload"])
+        return cassette
+
+    def append(self, record: Dict[str, Any]) -> None:
+        # 1行ずつ追記してフラッシュ (マルチワーカーでも行単位で混ざらない)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def next_call(self, key: str) -> Optional[Dict[str, Any]]:
+        """Recorded call for the prompt hash; repeated prompts cycle through recordings"""
+        records = self._calls.get(key)
+        if not records:
+            return None
+        index = self._cursor.get(key, 0)
+        self._cursor[key] = index + 1
+        return records[index % len(records)]
+
+    def any_call(self, agent_id: str) -> Optional[Dict[str, Any]]:
+        records = self._by_agent.get(agent_id)
+        return random.choice(records) if records else None
+
+
+class RecordingAgent:
+    """Transparently wraps an agent and records every call to a cassette"""
+
+    def __init__(self, agent, cassette: Cassette):
+        self._agent = agent
+        self._cassette = cassette
+        self.agent_id = agent.agent_id
+        self.model_name = agent.model_name
+        self.system_instruction = agent.system_instruction
+
+    def load(self) -> None:
+        self._agent.load()
+
+    async def agenerate(self, prompt: str) -> str:
+        started = time.perf_counter()
+        response = await self._agent.agenerate(prompt)
+        latency_ms = (time.perf_counter() - started) * 1000
+        text = str(response)
+        self._cassette.append({
+            "type": "call",
+            "hash": prompt_hash(self.agent_id, prompt),
+            "agent_id": self.agent_id,
+            "response": text,
+            "latency_ms": round(latency_ms, 3),
+            "input_tokens": getattr(
+                response, "input_tokens",
+                estimate_tokens(self.system_instruction) + estimate_tokens(prompt)
+            ),
+            "output_tokens": getattr(response, "output_tokens", estimate_tokens(text)),
+        })
+        return response
+
+
+class ReplayAgent:
+    """Serves recorded responses with the recorded (optionally scaled) latency"""
+
+    def __init__(self, agent_id: str, model_name: str, system_instruction: str,
+                 cassette: Cassette, latency_scale: float = None, on_miss: str = None):
+        self.agent_id = agent_id
+        self.model_name = model_name
+        self.system_instruction = system_instruction
+        self._cassette = cassette
+        self.latency_scale = (
+            latency_scale if latency_scale is not None
+            else float(os.getenv("REPLAY_LATENCY_SCALE", "1.0"))
+        )
+        self.on_miss = on_miss or os.getenv("REPLAY_ON_MISS", "any")
+        self.hits = 0
+        self.misses = 0
+
+    def load(self) -> None:
+        """Nothing to load for replay"""
+
+    async def agenerate(self, prompt: str) -> str:
+        record = self._cassette.next_call(prompt_hash(self.agent_id, prompt))
+        if record is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+            # on_miss=any: 同じエージェントの別の録音で代用する
+            record = self._cassette.any_call(self.agent_id) if self.on_miss == "any" else None
+            if record is None:
+                raise CassetteMissError(f"No recording for {self.agent_id} prompt")
+
+        delay = record["latency_ms"] / 1000 * self.latency_scale
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return AgentText(record["response"], record["input_tokens"], record["output_tokens"])
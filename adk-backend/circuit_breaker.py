@@ -0,0 +1,120 @@
+import os
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Tuple
+
+
+class CircuitState:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the model while the breaker is open"""
+
+
+class CircuitBreaker:
+    """Per-agent circuit breaker driven by error rate and slow-call rate
+
+    closed → open when, over the recent window, the error rate or slow-call
+    rate exceeds its threshold. After ``open_seconds`` the breaker becomes
+    half-open and admits a limited number of rate-limited probe calls; a
+    successful probe closes it, a failed one opens it again.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.window = int(os.getenv("CIRCUIT_WINDOW", "20"))
+        self.min_calls = int(os.getenv("CIRCUIT_MIN_CALLS", "10"))
+        self.error_rate_threshold = float(os.getenv("CIRCUIT_ERROR_RATE", "50"))
+        self.slow_call_seconds = float(os.getenv("CIRCUIT_SLOW_CALL_SECONDS", "10"))
+        self.slow_call_rate_threshold = float(os.getenv("CIRCUIT_SLOW_CALL_RATE", "80"))
+        self.open_seconds = float(os.getenv("CIRCUIT_OPEN_SECONDS", "30"))
+        self.half_open_max_probes = int(os.getenv("CIRCUIT_HALF_OPEN_MAX_PROBES", "1"))
+        self.probe_interval = float(os.getenv("CIRCUIT_PROBE_INTERVAL_SECONDS", "5"))
+
+        self.state = CircuitState.CLOSED
+        # (失敗したか, 遅延したか) の直近の結果
+        self._outcomes: Deque[Tuple[bool, bool]] = deque(maxlen=self.window)
+        self._opened_at = 0.0
+        self._last_probe_at = 0.0
+        self._probes_in_flight = 0
+
+        self.rejected = 0
+        self.times_opened = 0
+
+    def before_call(self) -> bool:
+        """Admit or reject a call; returns True if the call is a half-open probe"""
+        now = time.monotonic()
+        if self.state == CircuitState.OPEN:
+            if now - self._opened_at < self.open_seconds:
+                self.rejected += 1
+                raise CircuitOpenError(f"Circuit for {self.name} is open")
+            self.state = CircuitState.HALF_OPEN
+
+        if self.state == CircuitState.HALF_OPEN:
+            if (self._probes_in_flight >= self.half_open_max_probes
+                    or now - self._last_probe_at < self.probe_interval):
+                self.rejected += 1
+                raise CircuitOpenError(f"Circuit for {self.name} is half-open")
+            self._probes_in_flight += 1
+            self._last_probe_at = now
+            return True
+
+        return False
+
+    def record_success(self, duration: float, is_probe: bool) -> None:
+        slow = duration >= self.slow_call_seconds
+        if is_probe:
+            self._probes_in_flight -= 1
+            if slow:
+                self._open()
+            else:
+                self._close()
+            return
+        self._outcomes.append((False, slow))
+        self._evaluate()
+
+    def record_failure(self, duration: float, is_probe: bool) -> None:
+        if is_probe:
+            self._probes_in_flight -= 1
+            self._open()
+            return
+        self._outcomes.append((True, duration >= self.slow_call_seconds))
+        self._evaluate()
+
+    def release(self, is_probe: bool) -> None:
+        """Forget a call that was cancelled before it produced an outcome"""
+        if is_probe:
+            self._probes_in_flight -= 1
+
+    def _evaluate(self) -> None:
+        if self.state != CircuitState.CLOSED or len(self._outcomes) < self.min_calls:
+            return
+        total = len(self._outcomes)
+        error_rate = sum(1 for failed, _ in self._outcomes if failed) / total * 100
+        slow_rate = sum(1 for _, slow in self._outcomes if slow) / total * 100
+        if error_rate >= self.error_rate_threshold or slow_rate >= self.slow_call_rate_threshold:
+            self._open()
+
+    def _open(self) -> None:
+        if self.state != CircuitState.OPEN:
+            self.times_opened += 1
+        self.state = CircuitState.OPEN
+        self._opened_at = time.monotonic()
+
+    def _close(self) -> None:
+        self.state = CircuitState.CLOSED
+        self._outcomes.clear()
+
+    def to_dict(self) -> Dict[str, Any]:
+        total = len(self._outcomes)
+        return {
+            "state": self.state,
+            "error_rate": round(sum(1 for failed, _ in self._outcomes if failed) / total * 100, 1) if total else 0.0,
+            "slow_call_rate": round(sum(1 for _, slow in self._outcomes if slow) / total * 100, 1) if total else 0.0,
+            "window_calls": total,
+            "rejected": self.rejected,
+            "times_opened": self.times_opened,
+        }
@@ -0,0 +1,81 @@
+import math
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional, Union
+
+# 期限内に収めるために適用した縮退の種類
+SHORT_BOSS_REPLY = "short_boss_reply"
+LOCAL_BOSS_REPLY = "local_boss_reply"
+LOCAL_ANALYSIS = "local_analysis"
+
+
+def parse_deadline_ms(value: Union[str, float, None]) -> Optional[float]:
+    """Budget in milliseconds from X-Request-Deadline or deadline_ms; ValueError when malformed"""
+    if value is None or not str(value).strip():
+        return None
+    budget = float(value)
+    if not math.isfinite(budget) or budget <= 0:
+        raise ValueError("deadline must be a positive number of milliseconds")
+    return budget
+
+
+class TurnDeadline:
+    """Remaining time budget of one training turn
+
+    The client sends its budget in milliseconds, measured from when the
+    request is received, so client and server clocks never need to agree.
+    Degradations applied to finish within the budget are collected in
+    ``degradations`` in the order they were applied.
+    """
+
+    def __init__(self, budget_ms: float, started: float = None):
+        self.budget = budget_ms / 1000
+        self.started = started or time.monotonic()
+        self.expires_at = self.started + self.budget
+        self.degradations: List[str] = []
+
+    def remaining(self) -> float:
+        return self.expires_at - time.monotonic()
+
+    def degrade(self, name: str) -> None:
+        if name not in self.degradations:
+            self.degradations.append(name)
+
+
+class DeadlineStats:
+    """Per-process counters for turns that carried a deadline"""
+
+    def __init__(self):
+        self.turns = 0
+        self.met = 0
+        self.missed = 0
+        self.degraded = 0
+        self.by_degradation: Dict[str, int] = {}
+        self._overruns_ms = deque(maxlen=1000)
+
+    def record(self, deadline: TurnDeadline) -> None:
+        self.turns += 1
+        remaining = deadline.remaining()
+        if remaining >= 0:
+            self.met += 1
+        else:
+            self.missed += 1
+            self._overruns_ms.append(-remaining * 1000)
+        if deadline.degradations:
+            self.degraded += 1
+        for name in deadline.degradations:
+            self.by_degradation[name] = self.by_degradation.get(name, 0) + 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        overruns = sorted(self._overruns_ms)
+        return {
+            "turns": self.turns,
+            "met": self.met,
+            "missed": self.missed,
+            "degraded": self.degraded,
+            "by_degradation": dict(self.by_degradation),
+            "overrun_ms": {
+                "p50": round(overruns[len(overruns) // 2], 1),
+                "max": round(overruns[-1], 1),
+            } if overruns else None,
+        }
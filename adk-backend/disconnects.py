@@ -0,0 +1,71 @@
+import os
+import asyncio
+from typing import Any, Awaitable, Callable, Dict
+
+
+class ClientDisconnectedError(Exception):
+    """The client went away before the response was ready"""
+
+
+async def wait_for_disconnect(receive: Callable[[], Awaitable[Dict[str, Any]]]) -> None:
+    """Return when the ASGI receive channel reports ``http.disconnect``"""
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return
+
+
+class DisconnectMonitor:
+    """Cancels request work when the client disconnects
+
+    HTTP handlers run their work through ``run``, which races it against
+    the ``http.disconnect`` message of the request. Cancelling the work
+    task propagates into every agent call it awaits (hedged attempts,
+    scheduler waits, batched analysis items), and the handlers' own
+    cleanup cancels background work started for the request. Streaming
+    and WebSocket endpoints report their disconnects with ``record``.
+    Set ``CANCEL_ON_DISCONNECT=false`` to always finish the work.
+    """
+
+    def __init__(self, enabled: bool = None):
+        self.enabled = enabled if enabled is not None else (
+            os.getenv("CANCEL_ON_DISCONNECT", "true").lower() == "true"
+        )
+        self.by_endpoint: Dict[str, Dict[str, int]] = {}
+
+    def record(self, endpoint: str, cancelled: bool = False) -> None:
+        counts = self.by_endpoint.setdefault(endpoint, {"disconnects": 0, "cancelled": 0})
+        counts["disconnects"] += 1
+        if cancelled:
+            counts["cancelled"] += 1
+
+    async def run(self, request, endpoint: str, work: Awaitable[Any]) -> Any:
+        """Await ``work``; cancel it and raise ClientDisconnectedError if the client leaves first"""
+        if not self.enabled:
+            return await work
+
+        task = asyncio.ensure_future(work)
+        watcher = asyncio.create_task(wait_for_disconnect(request.receive))
+        try:
+            await asyncio.wait({task, watcher}, return_when=asyncio.FIRST_COMPLETED)
+            if task.done() or watcher.cancelled() or watcher.exception() is not None:
+                return await task
+        finally:
+            watcher.cancel()
+            # サーバー停止などでハンドラ自体が取り消された場合も処理を残さない
+            task.cancel()
+
+        self.record(endpoint, cancelled=True)
+        # キャンセル時の後始末 (先読みの破棄など) が終わるまで待つ
+        await asyncio.wait({task})
+        if not task.cancelled():
+            task.exception()
+        raise ClientDisconnectedError(f"Client disconnected from {endpoint}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "disconnects": sum(counts["disconnects"] for counts in self.by_endpoint.values()),
+            "cancelled": sum(counts["cancelled"] for counts in self.by_endpoint.values()),
+            "by_endpoint": {endpoint: dict(counts) for endpoint, counts in self.by_endpoint.items()},
+        }
@@ -0,0 +1,215 @@
+import os
+import time
+import asyncio
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+from scheduler import Priority, current_priority
+
+
+class LatencyTracker:
+    """Sliding window of recent call latencies (seconds) with percentile lookup"""
+
+    def __init__(self, window: int = None):
+        self.window = window or int(os.getenv("AGENT_LATENCY_WINDOW", "200"))
+        self._samples: Deque[float] = deque(maxlen=self.window)
+        self._sorted: Optional[List[float]] = None
+
+    def record(self, seconds: float) -> None:
+        self._samples.append(seconds)
+        self._sorted = None
+
+    @property
+    def count(self) -> int:
+        return len(self._samples)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """Nearest-rank percentile (q in 0-100); None without samples"""
+        if not self._samples:
+            return None
+        if self._sorted is None:
+            self._sorted = sorted(self._samples)
+        index = min(len(self._sorted) - 1, max(0, int(round(q / 100 * len(self._sorted))) - 1))
+        return self._sorted[index]
+
+    def to_dict(self) -> Dict[str, Any]:
+        def ms(value: Optional[float]) -> Optional[float]:
+            return round(value * 1000, 2) if value is not None else None
+
+        return {
+            "samples": self.count,
+            "p50_ms": ms(self.percentile(50)),
+            "p95_ms": ms(self.percentile(95)),
+            "p99_ms": ms(self.percentile(99)),
+        }
+
+
+class AdaptiveTimeout:
+    """Per-agent timeout derived from the observed latency distribution"""
+
+    def __init__(self, latency: LatencyTracker):
+        self.latency = latency
+        self.default = float(os.getenv("AGENT_TIMEOUT_DEFAULT_SECONDS", "30"))
+        self.minimum = float(os.getenv("AGENT_TIMEOUT_MIN_SECONDS", "2"))
+        self.maximum = float(os.getenv("AGENT_TIMEOUT_MAX_SECONDS", "60"))
+        self.percentile = float(os.getenv("AGENT_TIMEOUT_PERCENTILE", "99"))
+        self.multiplier = float(os.getenv("AGENT_TIMEOUT_MULTIPLIER", "2.0"))
+        self.min_samples = int(os.getenv("AGENT_LATENCY_MIN_SAMPLES", "20"))
+
+    def current(self) -> float:
+        # サンプルが少ないうちは固定のデフォルト値を使う
+        if self.latency.count < self.min_samples:
+            return self.default
+        observed = self.latency.percentile(self.percentile) * self.multiplier
+        return min(self.maximum, max(self.minimum, observed))
+
+
+class Hedger:
+    """Fires a duplicate call when the first one is slower than the hedge percentile
+
+    The number of hedges is capped at ``budget_percent`` of the calls in the
+    recent window. Whichever attempt finishes first wins; the loser is cancelled.
+    """
+
+    def __init__(self, latency: LatencyTracker, percentile: float = None, budget_percent: float = None):
+        self.latency = latency
+        self.percentile = percentile or float(os.getenv("HEDGE_PERCENTILE", "95"))
+        self.budget_percent = budget_percent or float(os.getenv("HEDGE_BUDGET_PERCENT", "10"))
+        self.min_samples = int(os.getenv("AGENT_LATENCY_MIN_SAMPLES", "20"))
+
+        # 直近の呼び出しでヘッジを発行したかどうか (予算計算用)
+        self._recent: Deque[bool] = deque(maxlen=latency.window)
+        self.calls = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.primary_wins = 0
+        self.budget_denied = 0
+
+    def _hedge_delay(self) -> Optional[float]:
+        if self.latency.count < self.min_samples:
+            return None
+        return self.latency.percentile(self.percentile)
+
+    def _within_budget(self) -> bool:
+        window_calls = max(len(self._recent), 1)
+        return (sum(self._recent) + 1) / window_calls * 100 <= self.budget_percent
+
+    async def call(self, attempt: Callable[[], Awaitable[Any]]) -> Any:
+        """Run ``attempt`` and hedge it once if it exceeds the hedge delay"""
+        self.calls += 1
+        delay = self._hedge_delay()
+        primary = asyncio.ensure_future(attempt())
+        if delay is None:
+            self._recent.append(False)
+            return await primary
+
+        tasks = {primary}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if done:
+                self._recent.append(False)
+                return primary.result()
+
+            if not self._within_budget():
+                self.budget_denied += 1
+                self._recent.append(False)
+                return await primary
+
+            self._recent.append(True)
+            self.hedges += 1
+            hedge = asyncio.ensure_future(attempt())
+            tasks.add(hedge)
+
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self.hedge_wins += 1
+                        else:
+                            self.primary_wins += 1
+                        return task.result()
+                # 両方失敗した場合は最後の例外をそのまま送出する
+                if not tasks:
+                    return done.pop().result()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "primary_wins_after_hedge": self.primary_wins,
+            "hedge_win_rate": round(self.hedge_wins / self.hedges, 3) if self.hedges else None,
+            "budget_denied": self.budget_denied,
+            # ヘッジによる追加呼び出しの割合 (= 追加コスト)
+            "extra_call_percent": round(self.hedges / self.calls * 100, 2) if self.calls else 0.0,
+            "hedge_delay_ms": round(self._hedge_delay() * 1000, 2) if self._hedge_delay() else None,
+        }
+
+
+class AgentCallPolicy:
+    """Latency tracking, adaptive timeout and optional hedging for one agent
+
+    Background calls (speculation, pool refills, probes, prefetches) run
+    under different prompts and load, so they are tracked separately and
+    never hedged; the interactive distribution drives hedging and the
+    deadline budgets.
+    """
+
+    def __init__(self, agent_id: str, hedging: bool = False):
+        self.agent_id = agent_id
+        self.latency = LatencyTracker()
+        self.timeout = AdaptiveTimeout(self.latency)
+        self.background_latency = LatencyTracker()
+        self.background_timeout = AdaptiveTimeout(self.background_latency)
+        self.hedger = Hedger(self.latency) if hedging else None
+        self.timeouts = 0
+
+    async def run(self, attempt: Callable[[], Awaitable[Any]]) -> Any:
+        """Run one logical call under the adaptive timeout (and hedging if enabled)"""
+        background = current_priority.get() == Priority.BACKGROUND
+        latency = self.background_latency if background else self.latency
+        # 完了していない試行の開始時刻
+        in_flight: Dict[object, float] = {}
+
+        async def timed_attempt():
+            key = object()
+            in_flight[key] = time.perf_counter()
+            try:
+                result = await attempt()
+            except Exception:
+                in_flight.pop(key, None)
+                raise
+            latency.record(time.perf_counter() - in_flight.pop(key))
+            return result
+
+        timeout = (self.background_timeout if background else self.timeout).current()
+        runner = self.hedger.call(timed_attempt) if self.hedger and not background else timed_attempt()
+        try:
+            return await asyncio.wait_for(runner, timeout=timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise
+        except asyncio.CancelledError:
+            # 呼び出し元の都合 (切断など) で取り消された時間はモデルの遅さを表さない
+            in_flight.clear()
+            raise
+        finally:
+            # 負けたヘッジやタイムアウトで打ち切った試行も、少なくともここまでの時間はかかっていた
+            # (記録しないと速かった試行だけが残り、分布が低く偏る)
+            now = time.perf_counter()
+            for started in in_flight.values():
+                latency.record(now - started)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "latency": self.latency.to_dict(),
+            "timeout_s": round(self.timeout.current(), 3),
+            "background_latency": self.background_latency.to_dict(),
+            "background_timeout_s": round(self.background_timeout.current(), 3),
+            "timeouts": self.timeouts,
+            "hedging": self.hedger.to_dict() if self.hedger else None,
+        }
@@ -0,0 +1,146 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+from shared_state import StateBackend, MemoryStateBackend
+
+
+class IdempotencyConflictError(Exception):
+    """The idempotency key was already used with a different request payload"""
+
+
+class IdempotencyInProgressError(Exception):
+    """The original request is still running on another worker"""
+
+
+def request_fingerprint(payload: Any) -> str:
+    """Stable hash of the request payload, used to detect a key reused for another request"""
+    encoded = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+class _InFlight:
+    __slots__ = ("fingerprint", "task")
+
+    def __init__(self, fingerprint: str, task: asyncio.Task):
+        self.fingerprint = fingerprint
+        self.task = task
+
+
+class IdempotencyStore:
+    """Runs each (scope, Idempotency-Key) once and replays the stored response to retries
+
+    The key is claimed in the shared state backend, so a retry that lands on
+    another worker waits for the original (polling up to ``wait`` seconds)
+    instead of computing again. Retries on the same worker attach to the
+    in-flight task directly. Responses are kept for ``ttl`` seconds; a claim
+    whose worker died expires after ``lock_ttl`` seconds.
+    """
+
+    PREFIX = "idem:"
+    IN_PROGRESS = "in_progress"
+    COMPLETED = "completed"
+
+    def __init__(self, backend: StateBackend = None, ttl: float = None, lock_ttl: float = None,
+                 wait: float = None, poll_interval: float = 0.2):
+        self.backend = backend or MemoryStateBackend()
+        self.ttl = ttl or float(os.getenv("IDEMPOTENCY_TTL_SECONDS", "3600"))
+        self.lock_ttl = lock_ttl or float(os.getenv("IDEMPOTENCY_LOCK_SECONDS", "120"))
+        self.wait = wait or float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "30"))
+        self.poll_interval = poll_interval
+        self._in_flight: Dict[str, _InFlight] = {}
+
+        self.requests = 0
+        self.computed = 0
+        self.replayed = 0
+        self.attached = 0
+        self.conflicts = 0
+        self.in_progress_timeouts = 0
+
+    def _storage_key(self, scope: str, key: str) -> str:
+        # 任意長のキーをそのまま保存せず、ユーザーごとに別の名前空間にする
+        return self.PREFIX + hashlib.sha256(f"{scope}\0{key}".encode("utf-8")).hexdigest()
+
+    async def run(self, scope: str, key: str, fingerprint: str,
+                  compute: Callable[[], Awaitable[Dict[str, Any]]]) -> Tuple[Dict[str, Any], bool]:
+        """Stored or computed response for the key; the flag is True unless this call computed it
+
+        ``compute`` returns ``{"status_code", "body", "headers"}``. Only
+        responses below 500 are stored, so failed requests can be retried.
+        """
+        self.requests += 1
+        storage_key = self._storage_key(scope, key)
+        while True:
+            entry = self._in_flight.get(storage_key)
+            if entry is not None:
+                if entry.fingerprint != fingerprint:
+                    self.conflicts += 1
+                    raise IdempotencyConflictError("Idempotency-Key was used with a different request")
+                self.attached += 1
+                return await asyncio.shield(entry.task), True
+
+            claim = {"status": self.IN_PROGRESS, "fingerprint": fingerprint, "created_at": time.time()}
+            if await self.backend.add(storage_key, claim, self.lock_ttl):
+                break
+
+            record = await self._wait_for_other_worker(storage_key, fingerprint)
+            if record is not None:
+                self.replayed += 1
+                return record["response"], True
+            # 元のリクエストが失敗したか期限切れになったので、このリクエストで計算し直す
+
+        task = asyncio.create_task(self._compute(storage_key, fingerprint, compute))
+        self._in_flight[storage_key] = _InFlight(fingerprint, task)
+        self.computed += 1
+        # クライアントが切断しても再試行が結果を受け取れるように処理は続ける
+        return await asyncio.shield(task), False
+
+    async def _wait_for_other_worker(self, storage_key: str, fingerprint: str) -> Any:
+        deadline = time.monotonic() + self.wait
+        while True:
+            record = await self.backend.get(storage_key)
+            if record is None:
+                return None
+            if record["fingerprint"] != fingerprint:
+                self.conflicts += 1
+                raise IdempotencyConflictError("Idempotency-Key was used with a different request")
+            if record["status"] == self.COMPLETED:
+                return record
+            if time.monotonic() >= deadline:
+                self.in_progress_timeouts += 1
+                raise IdempotencyInProgressError("The original request is still in progress")
+            await asyncio.sleep(self.poll_interval)
+
+    async def _compute(self, storage_key: str, fingerprint: str,
+                       compute: Callable[[], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+        try:
+            response = await compute()
+            if response["status_code"] >= 500:
+                await self.backend.delete(storage_key)
+            else:
+                await self.backend.set(
+                    storage_key,
+                    {"status": self.COMPLETED, "fingerprint": fingerprint, "response": response},
+                    self.ttl,
+                )
+            return response
+        except BaseException:
+            await self.backend.delete(storage_key)
+            raise
+        finally:
+            self._in_flight.pop(storage_key, None)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "computed": self.computed,
+            # 再試行のうちモデルを呼ばずに済んだもの
+            "replayed": self.replayed,
+            "attached_in_flight": self.attached,
+            "conflicts": self.conflicts,
+            "in_progress_timeouts": self.in_progress_timeouts,
+            "in_flight": len(self._in_flight),
+        }
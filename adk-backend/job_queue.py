@@ -0,0 +1,230 @@
+import os
+import time
+import uuid
+import json
+import asyncio
+import hashlib
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from shared_state import StateBackend, MemoryStateBackend
+from offload import Offloader
+from scheduler import Priority, scheduling
+
+
+class JobStatus:
+    QUEUED = "queued"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+    FINISHED = (COMPLETED, FAILED)
+
+
+class QueueFullError(Exception):
+    """Raised when the job queue cannot accept more pending work"""
+
+
+class AnalysisJob:
+    """A single session analysis job owned by this worker process"""
+
+    __slots__ = (
+        "job_id",
+        "fingerprint",
+        "interactions",
+        "status",
+        "result",
+        "error",
+        "created_at",
+        "started_at",
+        "finished_at",
+        "done",
+    )
+
+    def __init__(self, fingerprint: str, interactions: List[Dict[str, Any]]):
+        self.job_id = uuid.uuid4().hex
+        self.fingerprint = fingerprint
+        self.interactions = interactions
+        self.status = JobStatus.QUEUED
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.done = asyncio.Event()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.job_id,
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+def fingerprint_interactions(interactions: List[Dict[str, Any]]) -> str:
+    """Stable hash of the session content used for deduplication"""
+    payload = json.dumps(interactions, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class AnalysisJobQueue:
+    """In-process worker pool for session analysis with TTL-bounded results
+
+    Jobs run on the worker that accepted them, but their records live in the
+    shared state backend so any worker can answer polls and deduplicate.
+    """
+
+    JOB_PREFIX = "job:"
+    FINGERPRINT_PREFIX = "jobfp:"
+
+    def __init__(
+        self,
+        runner: Callable[[List[Dict[str, Any]]], Awaitable[Dict[str, Any]]],
+        backend: StateBackend = None,
+        concurrency: int = None,
+        result_ttl: float = None,
+        max_pending: int = None,
+        poll_interval: float = 0.5,
+        offloader: Offloader = None,
+    ):
+        self.runner = runner
+        self.offloader = offloader or Offloader(kind="none")
+        self.backend = backend or MemoryStateBackend()
+        self.concurrency = concurrency or int(os.getenv("ANALYSIS_JOB_CONCURRENCY", "2"))
+        self.result_ttl = result_ttl or float(os.getenv("ANALYSIS_JOB_TTL_SECONDS", "600"))
+        self.max_pending = max_pending or int(os.getenv("ANALYSIS_JOB_MAX_PENDING", "100"))
+        self.poll_interval = poll_interval
+
+        self._queue: asyncio.Queue = asyncio.Queue()
+        # このワーカーで実行中・待機中のジョブのみ保持する
+        self._jobs: Dict[str, AnalysisJob] = {}
+        self._workers: List[asyncio.Task] = []
+
+    def start(self) -> None:
+        """Start the worker tasks"""
+        if self._workers:
+            return
+        self._workers = [
+            asyncio.create_task(self._worker(), name=f"analysis-job-worker-{i}")
+            for i in range(self.concurrency)
+        ]
+
+    async def stop(self) -> None:
+        """Cancel the worker tasks"""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def submit(self, interactions: List[Dict[str, Any]]) -> Tuple[Dict[str, Any], bool]:
+        """Enqueue a job, or return the existing job for identical session content"""
+        # 大きなセッションの JSON エンコードはイベントループの外で行う
+        fingerprint = await self.offloader.run(
+            "session_fingerprint", fingerprint_interactions, interactions, items=len(interactions)
+        )
+        existing = await self._find_reusable(fingerprint)
+        if existing is not None:
+            return existing, True
+
+        if self._queue.qsize() >= self.max_pending:
+            raise QueueFullError("Analysis job queue is full")
+
+        job = AnalysisJob(fingerprint, interactions)
+        fingerprint_key = self.FINGERPRINT_PREFIX + fingerprint
+        if not await self.backend.add(fingerprint_key, job.job_id, self.result_ttl):
+            # 他のワーカーが同時に同じ内容を登録した
+            existing = await self._find_reusable(fingerprint)
+            if existing is not None:
+                return existing, True
+            await self.backend.set(fingerprint_key, job.job_id, self.result_ttl)
+
+        self._jobs[job.job_id] = job
+        await self._save(job)
+        self._queue.put_nowait(job)
+        return job.to_dict(), False
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Look up a job record by id"""
+        job = self._jobs.get(job_id)
+        if job is not None:
+            return job.to_dict()
+        return await self.backend.get(self.JOB_PREFIX + job_id)
+
+    async def wait(self, job_id: str, timeout: float) -> Optional[Dict[str, Any]]:
+        """Wait up to ``timeout`` seconds for the job to finish and return its record"""
+        job = self._jobs.get(job_id)
+        if job is not None:
+            try:
+                await asyncio.wait_for(job.done.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+            return job.to_dict()
+
+        # 他のワーカーが所有するジョブは共有ストアをポーリングする
+        deadline = time.monotonic() + timeout
+        while True:
+            record = await self.get(job_id)
+            if record is None or record["status"] in JobStatus.FINISHED:
+                return record
+            if time.monotonic() >= deadline:
+                return record
+            await asyncio.sleep(self.poll_interval)
+
+    def get_stats(self) -> Dict[str, Any]:
+        counts: Dict[str, int] = {}
+        for job in self._jobs.values():
+            counts[job.status] = counts.get(job.status, 0) + 1
+        return {
+            "concurrency": self.concurrency,
+            "pending": self._queue.qsize(),
+            "jobs": counts,
+        }
+
+    async def _find_reusable(self, fingerprint: str) -> Optional[Dict[str, Any]]:
+        job_id = await self.backend.get(self.FINGERPRINT_PREFIX + fingerprint)
+        if job_id is None:
+            return None
+        record = await self.get(job_id)
+        if record is None or record["status"] == JobStatus.FAILED:
+            return None
+        return record
+
+    async def _save(self, job: AnalysisJob) -> None:
+        await self.backend.set(self.JOB_PREFIX + job.job_id, job.to_dict(), self.result_ttl)
+
+    async def _worker(self) -> None:
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._run(job)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job: AnalysisJob) -> None:
+        job.status = JobStatus.RUNNING
+        job.started_at = time.time()
+        await self._save(job)
+        try:
+            # 利用者が依頼した分析なので同期の分析と同じクラスで実行する
+            # (入れ子のスコープは優先度を下げる方向にしか変えられないため、ここで決める)
+            with scheduling(Priority.ANALYTICS, user=f"job:{job.job_id}"):
+                result = await self.runner(job.interactions)
+            job.result = result
+            # get_session_analytics はエラー時も dict を返すので status で判定する
+            job.status = JobStatus.FAILED if result.get("status") == "error" else JobStatus.COMPLETED
+        except asyncio.CancelledError:
+            job.status = JobStatus.FAILED
+            job.error = "cancelled"
+            raise
+        except Exception as e:
+            job.status = JobStatus.FAILED
+            job.error = str(e)
+        finally:
+            job.finished_at = time.time()
+            job.interactions = []
+            await self._save(job)
+            self._jobs.pop(job.job_id, None)
+            job.done.set()
@@ -0,0 +1,77 @@
+import os
+import time
+from typing import Any, Dict, Optional
+
+# モジュール読み込み時刻 (プロセス起動時刻の近似値)
+PROCESS_STARTED = time.time()
+
+
+class WarmupState:
+    DISABLED = "disabled"
+    PENDING = "pending"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+
+class AppLifecycle:
+    """Tracks initialization, warmup and startup latency for readiness probes"""
+
+    def __init__(self):
+        self.warmup_enabled = os.getenv("WARMUP_ON_STARTUP", "false").lower() == "true"
+        self.warmup_probe_models = os.getenv("WARMUP_PROBE_MODELS", "false").lower() == "true"
+        self.warmup_state = WarmupState.PENDING if self.warmup_enabled else WarmupState.DISABLED
+        self.warmup_result: Optional[Dict[str, Any]] = None
+        self.init_error: Optional[str] = None
+
+        self.startup_completed_at: Optional[float] = None
+        self.initialized_at: Optional[float] = None
+        self.ready_at: Optional[float] = None
+        self.first_request_ms: Optional[float] = None
+
+    def mark_startup_complete(self) -> None:
+        self.startup_completed_at = time.time()
+
+    def mark_initialized(self) -> None:
+        self.initialized_at = time.time()
+        self.init_error = None
+        self._update_ready()
+
+    def mark_init_failed(self, error: str) -> None:
+        self.init_error = error
+
+    def mark_warmup(self, state: str, result: Dict[str, Any] = None) -> None:
+        self.warmup_state = state
+        self.warmup_result = result
+        self._update_ready()
+
+    def record_request(self, duration_ms: float) -> None:
+        if self.first_request_ms is None:
+            self.first_request_ms = round(duration_ms, 2)
+
+    @property
+    def is_ready(self) -> bool:
+        if self.initialized_at is None:
+            return False
+        # ウォームアップが失敗してもライブ生成で応答できるので ready とする
+        return self.warmup_state not in (WarmupState.PENDING, WarmupState.RUNNING)
+
+    def _update_ready(self) -> None:
+        if self.ready_at is None and self.is_ready:
+            self.ready_at = time.time()
+
+    def to_dict(self) -> Dict[str, Any]:
+        def since_start(timestamp: Optional[float]) -> Optional[float]:
+            return round((timestamp - PROCESS_STARTED) * 1000, 2) if timestamp else None
+
+        return {
+            "ready": self.is_ready,
+            "warmup": self.warmup_state,
+            "warmup_result": self.warmup_result,
+            "init_error": self.init_error,
+            "startup_ms": since_start(self.startup_completed_at),
+            "initialized_ms": since_start(self.initialized_at),
+            "time_to_ready_ms": since_start(self.ready_at),
+            "first_request_ms": self.first_request_ms,
+            "uptime_s": round(time.time() - PROCESS_STARTED, 1),
+        }
@@ -0,0 +1,219 @@
+import os
+from collections import deque
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Tuple
+
+from models import AnalysisResult, BossPersona
+from personas import get_persona
+
+# カテゴリ別の語彙 (MockLlmAgent の採点ルールと同じ観点)
+LEXICON: Dict[str, Tuple[str, ...]] = {
+    "politeness": ("ます", "です", "ございます", "いたします", "恐れ入りますが", "お願いいたします"),
+    "hedging": ("と思います", "かもしれません", "たぶん", "おそらく", "一応", "なんとなく"),
+    "concreteness": ("具体的", "詳細", "計画", "対策", "期限", "までに", "スケジュール"),
+    "apology": ("申し訳", "すみません", "失礼しました", "ご迷惑"),
+}
+TRIGGER_CATEGORY = "stress_trigger"
+
+
+class CompiledLexicon:
+    """Aho-Corasick automaton over the lexicon words, scanned one character at a time"""
+
+    def __init__(self, words: Iterable[Tuple[str, str]]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[Tuple[Tuple[str, str], ...]] = [()]
+        for word, category in words:
+            if word:
+                self._insert(word, category)
+        self._build_failure_links()
+
+    def _insert(self, word: str, category: str) -> None:
+        state = 0
+        for char in word:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(())
+            state = next_state
+        self._out[state] += ((word, category),)
+
+    def _build_failure_links(self) -> None:
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                self._fail[next_state] = target if target != next_state else 0
+                self._out[next_state] += self._out[self._fail[next_state]]
+
+    def step(self, state: int, char: str) -> int:
+        goto, fail = self._goto, self._fail
+        while state and char not in goto[state]:
+            state = fail[state]
+        return goto[state].get(char, 0)
+
+    def matches(self, state: int) -> Tuple[Tuple[str, str], ...]:
+        return self._out[state]
+
+
+@lru_cache(maxsize=128)
+def compile_lexicon(triggers: Tuple[str, ...] = ()) -> CompiledLexicon:
+    """Lexicon automaton with the persona's stress triggers, cached per trigger set"""
+    words = [(word, category) for category, entries in LEXICON.items() for word in entries]
+    words += [(trigger, TRIGGER_CATEGORY) for trigger in triggers]
+    return CompiledLexicon(words)
+
+
+def persona_triggers(persona: BossPersona) -> Tuple[str, ...]:
+    triggers = persona.stress_triggers or persona.stressTriggers
+    if not triggers:
+        registered = get_persona(persona.id)
+        triggers = registered["stress_triggers"] if registered else []
+    return tuple(triggers)
+
+
+class DraftScorer:
+    """Incremental lexicon scores of a draft that is being typed
+
+    The automaton state and the matches ending at each character are kept
+    per position, so appended text is scanned from where the previous
+    draft ended and edits roll back only to the first changed character.
+    """
+
+    def __init__(self, lexicon: CompiledLexicon, max_chars: int = None):
+        self.lexicon = lexicon
+        self.max_chars = max_chars or int(os.getenv("DRAFT_MAX_CHARS", "2000"))
+        self.text = ""
+        self._states: List[int] = [0]
+        self._matches: List[Tuple[Tuple[str, str], ...]] = []
+        self.counts: Dict[str, int] = {}
+        self.hits: Dict[Tuple[str, str], int] = {}
+
+    def update(self, draft: str) -> int:
+        """Rescore for the new draft; returns the number of characters scanned"""
+        draft = draft[:self.max_chars]
+        if draft.startswith(self.text):
+            prefix = len(self.text)
+        else:
+            prefix = 0
+            limit = min(len(draft), len(self.text))
+            while prefix < limit and draft[prefix] == self.text[prefix]:
+                prefix += 1
+            self._rollback(prefix)
+
+        state = self._states[-1]
+        for char in draft[prefix:]:
+            state = self.lexicon.step(state, char)
+            found = self.lexicon.matches(state)
+            for word, category in found:
+                self.counts[category] = self.counts.get(category, 0) + 1
+                self.hits[category, word] = self.hits.get((category, word), 0) + 1
+            self._states.append(state)
+            self._matches.append(found)
+        self.text = draft
+        return len(draft) - prefix
+
+    def _rollback(self, length: int) -> None:
+        for found in self._matches[length:]:
+            for word, category in found:
+                self.counts[category] -= 1
+                self.hits[category, word] -= 1
+        del self._matches[length:]
+        del self._states[length + 1:]
+
+    def scores(self) -> Dict[str, Any]:
+        politeness = self.counts.get("politeness", 0)
+        hedging = self.counts.get("hedging", 0)
+        concreteness = self.counts.get("concreteness", 0)
+        # MockLlmAgent と同じ加減点で推定スコアを出す
+        estimate = 72
+        estimate += 10 if politeness else -5
+        estimate += 8 if len(self.text) > 30 and concreteness else -3
+        estimate += -5 if hedging else 2
+        triggers = {
+            word: count for (category, word), count in self.hits.items()
+            if category == TRIGGER_CATEGORY and count
+        }
+        return {
+            "length": len(self.text),
+            "politeness": politeness,
+            "hedging": hedging,
+            "concreteness": concreteness,
+            "apology": self.counts.get("apology", 0),
+            "stress_triggers": triggers,
+            "estimated_score": max(30, min(95, estimate)),
+        }
+
+
+def score_message(persona: BossPersona, message: str) -> Dict[str, Any]:
+    """One-shot local scores for a complete message"""
+    scorer = DraftScorer(compile_lexicon(persona_triggers(persona)))
+    scorer.update(message)
+    return scorer.scores()
+
+
+def local_analysis(persona: BossPersona, message: str) -> AnalysisResult:
+    """Model-free analysis from the lexicon scores, for turns without time for analysis_agent"""
+    scores = score_message(persona, message)
+    estimate = scores["estimated_score"]
+    triggers = sum(scores["stress_triggers"].values())
+    suggestions, areas = [], []
+    if not scores["politeness"]:
+        suggestions.append("丁寧な表現を意識してください")
+        areas.append("敬語")
+    if not scores["concreteness"]:
+        suggestions.append("具体的な計画や期限を示しましょう")
+        areas.append("具体性")
+    if scores["hedging"]:
+        suggestions.append("曖昧な表現を避けて自信を持って伝えましょう")
+        areas.append("自信の向上")
+    for word in scores["stress_triggers"]:
+        suggestions.append(f"「{word}」は上司のストレス要因です。言い換えを検討してください")
+    return AnalysisResult(
+        user_performance_score=estimate,
+        communication_effectiveness=max(40, min(90, estimate)),
+        stress_management=max(35, min(85, estimate - 5 * triggers)),
+        suggestions=suggestions or ["この調子で継続してください"],
+        improvement_areas=areas or ["更なる向上"],
+    )
+
+
+class LiveDraftStats:
+    """Per-process counters for the live draft channel"""
+
+    def __init__(self):
+        self.connections = 0
+        self.active = 0
+        self.drafts_received = 0
+        self.drafts_scored = 0
+        self.chars_scanned = 0
+        self._score_us = deque(maxlen=1000)
+
+    def record(self, scanned: int, elapsed: float) -> None:
+        self.drafts_scored += 1
+        self.chars_scanned += scanned
+        self._score_us.append(elapsed * 1e6)
+
+    def to_dict(self) -> Dict[str, Any]:
+        timings = sorted(self._score_us)
+        return {
+            "connections": self.connections,
+            "active": self.active,
+            "drafts_received": self.drafts_received,
+            "drafts_scored": self.drafts_scored,
+            # デバウンスで間引かれた下書きの数
+            "drafts_coalesced": self.drafts_received - self.drafts_scored,
+            "chars_scanned": self.chars_scanned,
+            "score_us": {
+                "p50": round(timings[len(timings) // 2], 1),
+                "p99": round(timings[max(0, int(len(timings) * 0.99) - 1)], 1),
+            } if timings else None,
+        }
@@ -0,0 +1,136 @@
+import random
+from typing import Dict, List, Optional, Tuple
+
+from models import BossPersona, BossResponse, StressLevel
+from personas import BOSS_PERSONAS
+
+# 難易度別の上司応答フレーズ集 (MockLlmAgent と共用)
+DIFFICULTY_PHRASEBANK: Dict[str, Tuple[str, ...]] = {
+    "strict": (
+        "その程度の対応では不十分ですね。もっと具体的な改善策を考えてください。",
+        "なぜそのような判断に至ったのか、論理的に説明してもらえますか？",
+        "期待していたレベルに達していません。再検討が必要です。",
+        "詳細な分析が不足しています。データに基づいた提案をしてください。",
+    ),
+    "supportive": (
+        "なるほど、いい視点ですね。その方向で進めてみましょう。",
+        "理解しました。何かサポートが必要でしたらお声がけください。",
+        "良い提案ですね。実行に向けて計画を立ててみてください。",
+        "順調に進んでいますね。この調子で頑張ってください。",
+    ),
+    "neutral": (
+        "なるほど、その件についてもう少し詳しく説明してもらえますか？",
+        "わかりました。では、具体的にどのような対策を考えていますか？",
+        "そうですね。今後はより注意深く進めてください。",
+        "理解しました。次回はもう少し早めに相談してくださいね。",
+    ),
+}
+
+# ペルソナ固有の言い回し (BOSS_PERSONAS の id ごと)
+PERSONA_PHRASES: Dict[str, Tuple[str, ...]] = {
+    "supportive_mentor": (
+        "焦らなくて大丈夫ですよ。一緒に整理してみましょう。",
+        "よく報告してくれましたね。次に何ができそうか考えてみましょう。",
+        "困ったことがあれば、いつでも相談してください。",
+    ),
+    "demanding_perfectionist": (
+        "結論から話してください。その上で根拠を示してください。",
+        "品質に妥協はできません。どこまで確認が済んでいるのですか？",
+        "期限と成果物の品質、両方を満たす計画を出してください。",
+    ),
+    "micromanager": (
+        "進捗は何パーセントですか？作業の内訳を細かく教えてください。",
+        "次の報告は今日の夕方にお願いします。途中経過も共有してください。",
+        "その判断をする前に、必ず私に確認してくださいね。",
+    ),
+    "visionary_leader": (
+        "その取り組みは、会社の中長期のビジョンとどうつながりますか？",
+        "目の前の課題だけでなく、一年後の姿から逆算して考えてみましょう。",
+        "面白い視点ですね。もっと大胆なアイデアも聞かせてください。",
+    ),
+}
+
+# ストレス要因に触れたときの応答テンプレート
+TRIGGER_TEMPLATES: Dict[str, Tuple[str, ...]] = {
+    "strict": (
+        "「{trigger}」は見過ごせません。原因と再発防止策を説明してください。",
+        "また「{trigger}」ですか。同じことを繰り返さないための具体策は？",
+    ),
+    "supportive": (
+        "「{trigger}」については次から気をつけましょう。何か原因がありましたか？",
+        "「{trigger}」は誰にでもあることです。ただ、対策は一緒に考えましょう。",
+    ),
+    "neutral": (
+        "「{trigger}」の件は気になりますね。状況を詳しく教えてください。",
+        "「{trigger}」が続くと困ります。どう改善するつもりですか？",
+    ),
+}
+
+BUCKET_STATE: Dict[str, Tuple[str, StressLevel]] = {
+    "strict": ("厳格", StressLevel.HIGH),
+    "supportive": ("満足", StressLevel.LOW),
+    "neutral": ("普通", StressLevel.MEDIUM),
+}
+
+DIFFICULTY_LABELS = {"初級": 2, "中級": 5, "上級": 8}
+
+
+def difficulty_level(difficulty) -> int:
+    """Convert a persona difficulty ("中級" or 1-10) to a number"""
+    if isinstance(difficulty, int):
+        return difficulty
+    if difficulty in DIFFICULTY_LABELS:
+        return DIFFICULTY_LABELS[difficulty]
+    try:
+        return int(difficulty)
+    except (TypeError, ValueError):
+        return 5
+
+
+def difficulty_bucket(level: int) -> str:
+    if level >= 7:
+        return "strict"
+    if level <= 3:
+        return "supportive"
+    return "neutral"
+
+
+class LocalReplyGenerator:
+    """Template-based, persona-consistent boss replies without any model call"""
+
+    def __init__(self, seed: int = None):
+        self._random = random.Random(seed)
+        self._registry = {persona["id"]: persona for persona in BOSS_PERSONAS}
+
+    def _triggers(self, persona: BossPersona) -> List[str]:
+        triggers = persona.stress_triggers or persona.stressTriggers
+        if not triggers and persona.id in self._registry:
+            triggers = self._registry[persona.id]["stress_triggers"]
+        return triggers or []
+
+    def find_trigger(self, persona: BossPersona, message: str) -> Optional[str]:
+        """Return the first stress trigger mentioned in the message, if any"""
+        for trigger in self._triggers(persona):
+            if trigger and trigger in message:
+                return trigger
+        return None
+
+    def generate(self, persona: BossPersona, message: str = "", hint: str = None) -> BossResponse:
+        """Produce a reply in the persona's voice, reacting to stress triggers"""
+        bucket = difficulty_bucket(difficulty_level(persona.difficulty))
+        trigger = self.find_trigger(persona, message) if message else None
+
+        if trigger:
+            text = self._random.choice(TRIGGER_TEMPLATES[bucket]).format(trigger=trigger)
+            emotional_state, stress_level = "不満", StressLevel.HIGH
+        else:
+            phrases = PERSONA_PHRASES.get(persona.id, ()) + DIFFICULTY_PHRASEBANK[bucket]
+            text = self._random.choice(phrases)
+            emotional_state, stress_level = BUCKET_STATE[bucket]
+
+        return BossResponse(
+            message=text,
+            emotional_state=emotional_state,
+            stress_level=stress_level,
+            next_scenario_hint=hint,
+        )
@@ -0,0 +1,120 @@
+import os
+import sys
+import time
+import asyncio
+import logging
+import threading
+import traceback
+from collections import deque
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+LAG_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+
+class LoopLagMonitor:
+    """Measures event-loop lag and captures the stack of callbacks that block it
+
+    A task sleeps ``interval`` seconds and records how late it wakes up into
+    a histogram. A watchdog thread notices when that task has not run for
+    longer than ``threshold`` and logs the event loop thread's current stack,
+    which is the callback blocking the loop.
+    """
+
+    def __init__(self, interval: float = None, threshold: float = None):
+        self.enabled = os.getenv("LOOP_MONITOR_ENABLED", "true").lower() == "true"
+        self.interval = interval or float(os.getenv("LOOP_LAG_INTERVAL_MS", "100")) / 1000
+        self.threshold = threshold or float(os.getenv("LOOP_LAG_THRESHOLD_MS", "250")) / 1000
+        self.buckets = [0] * (len(LAG_BUCKETS_MS) + 1)
+        self.samples = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.stalls = 0
+        self.recent_stalls = deque(maxlen=10)
+        self._heartbeat = time.monotonic()
+        self._loop_thread: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stop = threading.Event()
+        self._watchdog: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if not self.enabled or self._task is not None:
+            return
+        self._loop_thread = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._task = asyncio.create_task(self._measure())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self) -> None:
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def record(self, lag_ms: float) -> None:
+        index = 0
+        while index < len(LAG_BUCKETS_MS) and lag_ms > LAG_BUCKETS_MS[index]:
+            index += 1
+        self.buckets[index] += 1
+        self.samples += 1
+        self.total_ms += lag_ms
+        self.max_ms = max(self.max_ms, lag_ms)
+
+    async def _measure(self) -> None:
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self._heartbeat = now
+            self.record(max(0.0, (now - expected) * 1000))
+
+    def _watch(self) -> None:
+        reported = None
+        while not self._stop.wait(self.interval):
+            heartbeat = self._heartbeat
+            blocked = time.monotonic() - heartbeat - self.interval
+            if blocked < self.threshold or reported == heartbeat:
+                continue
+            # 同じ停止につき1回だけスタックを記録する
+            reported = heartbeat
+            frame = sys._current_frames().get(self._loop_thread)
+            stack = "".join(traceback.format_stack(frame)) if frame is not None else ""
+            self.stalls += 1
+            self.recent_stalls.append({
+                "at": time.time(),
+                "blocked_ms": round(blocked * 1000, 1),
+                "stack": stack[-4000:],
+            })
+            logger.warning("Event loop blocked for %.0fms; loop thread stack:\n%s", blocked * 1000, stack)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """Upper bound of the histogram bucket containing the q-th percentile"""
+        if not self.samples:
+            return None
+        target = q / 100 * self.samples
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if seen >= target:
+                return float(LAG_BUCKETS_MS[index]) if index < len(LAG_BUCKETS_MS) else self.max_ms
+        return self.max_ms
+
+    def to_dict(self) -> Dict[str, Any]:
+        histogram = {f"le_{bound}ms": count for bound, count in zip(LAG_BUCKETS_MS, self.buckets)}
+        histogram[f"gt_{LAG_BUCKETS_MS[-1]}ms"] = self.buckets[-1]
+        return {
+            "enabled": self.enabled,
+            "samples": self.samples,
+            "mean_lag_ms": round(self.total_ms / self.samples, 3) if self.samples else None,
+            "p99_lag_ms": self.percentile(99),
+            "max_lag_ms": round(self.max_ms, 3),
+            "histogram": histogram,
+            "stalls": self.stalls,
+            "recent_stalls": list(self.recent_stalls),
+        }
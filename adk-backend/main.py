@@ -1,19 +1,47 @@
 import os
+import json
+import time
+import hmac
+import hashlib
 import asyncio
-from typing import Dict, Any
-from fastapi import FastAPI, HTTPException
+import contextvars
+from typing import Dict, Any, Optional
+from fastapi import FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
 from dotenv import load_dotenv
 
 from models import (
     TrainingRequest,
     TrainingResponse,
+    OpeningRequest,
+    OpeningResponse,
     TestRequest,
     TestResponse,
     BossPersona,
     UserState,
 )
 from adk_system import VirtualBossADKSystem
+from job_queue import AnalysisJobQueue, JobStatus, QueueFullError
+from analysis_tickets import TicketStatus
+from personas import BOSS_PERSONAS, OPENING_SCENARIOS, get_persona
+from lifecycle import AppLifecycle, WarmupState
+from circuit_breaker import CircuitState
+from prober import ProbeStatus
+from rate_limiter import RateLimiter, MemoryBucketStore, SharedBucketStore
+from shared_state import create_state_backend
+from profiler import Profiler, ProfilerBusyError
+from loop_monitor import LoopLagMonitor
+from usage import RequestUsage, usage_scope
+from live_scorer import DraftScorer, LiveDraftStats, compile_lexicon, persona_triggers
+from disconnects import ClientDisconnectedError, DisconnectMonitor
+from deadlines import TurnDeadline, parse_deadline_ms
+from idempotency import (
+    IdempotencyStore,
+    IdempotencyConflictError,
+    IdempotencyInProgressError,
+    request_fingerprint,
+)
 
 # Load environment variables
 load_dotenv()
@@ -25,7 +53,209 @@ app = FastAPI(
     version="1.0.0",
 )
 
-# Configure CORS
+# ADK system is created lazily on first use (or by the startup warmup)
+adk_system = None
+analysis_jobs = None
+idempotency = None
+lifecycle = AppLifecycle()
+profiler = Profiler()
+loop_monitor = LoopLagMonitor()
+live_draft_stats = LiveDraftStats()
+disconnects = DisconnectMonitor()
+
+# 切断したクライアントへの応答 (nginx の慣例に合わせて 499)
+CLIENT_CLOSED_REQUEST = 499
+
+
+def get_adk_system() -> Optional[VirtualBossADKSystem]:
+    """Return the ADK system, initializing it on first use"""
+    global adk_system, analysis_jobs, idempotency
+    if adk_system is None:
+        try:
+            system = VirtualBossADKSystem()
+            jobs = AnalysisJobQueue(
+                system.get_session_analytics,
+                backend=system.state_backend,
+                offloader=system.offloader,
+            )
+            # 初回リクエストの中で初期化された場合でも、常駐タスクにそのリクエストの
+            # 使用量スコープ・優先度などの contextvars を引き継がせない
+            contextvars.Context().run(start_background_workers, system, jobs)
+            idempotency = IdempotencyStore(backend=system.state_backend)
+            adk_system, analysis_jobs = system, jobs
+            lifecycle.mark_initialized()
+            print("✅ Google ADK system initialized successfully")
+        except Exception as e:
+            # 次のリクエストで再度初期化を試みる
+            lifecycle.mark_init_failed(str(e))
+            print(f"❌ Failed to initialize ADK system: {e}")
+    return adk_system
+
+
+def start_background_workers(system: VirtualBossADKSystem, jobs: AnalysisJobQueue) -> None:
+    """Start the job workers, connectivity prober and opening pool"""
+    jobs.start()
+    system.prober.start()
+    system.opening_pool.start(
+        [BossPersona(**persona) for persona in BOSS_PERSONAS], OPENING_SCENARIOS
+    )
+
+
+async def run_warmup():
+    """Initialize the system and prime model clients in the background"""
+    lifecycle.mark_warmup(WarmupState.RUNNING)
+    system = get_adk_system()
+    if system is None:
+        lifecycle.mark_warmup(WarmupState.FAILED, {"error": lifecycle.init_error})
+        return
+    try:
+        result = await system.warmup(
+            BOSS_PERSONAS, probe_models=lifecycle.warmup_probe_models
+        )
+        lifecycle.mark_warmup(WarmupState.COMPLETED, result)
+        print(f"🔥 Warmup completed in {result['duration_ms']}ms")
+    except Exception as e:
+        lifecycle.mark_warmup(WarmupState.FAILED, {"error": str(e)})
+        print(f"⚠️  Warmup failed: {e}")
+
+
+async def initialize_in_background():
+    """Initialize the system after startup so the opening pool starts filling right away"""
+    # 初期化は同期処理なので、起動完了を先に済ませてから行う
+    await asyncio.sleep(0)
+    get_adk_system()
+
+
+@app.on_event("startup")
+async def startup_event():
+    """Start serving immediately; heavy initialization runs in the background
+
+    Without warmup the system is still initialized right after startup
+    when the opening pool is enabled, so the pool is filled before the
+    first session instead of by it.
+    """
+    if lifecycle.warmup_enabled:
+        asyncio.create_task(run_warmup())
+    elif os.getenv("OPENING_POOL_ENABLED", "true").lower() == "true":
+        asyncio.create_task(initialize_in_background())
+    profiler.start_continuous()
+    loop_monitor.start()
+    lifecycle.mark_startup_complete()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop background workers"""
+    profiler.stop()
+    await loop_monitor.stop()
+    if analysis_jobs:
+        await analysis_jobs.stop()
+    if adk_system:
+        await adk_system.prober.stop()
+        await adk_system.opening_pool.stop()
+        await adk_system.analysis_tickets.stop()
+        await adk_system.state_backend.close()
+        adk_system.offloader.shutdown()
+
+
+# Rate limiting (RATE_LIMIT_STORE=shared keeps buckets in the shared state backend)
+rate_limiter = RateLimiter(
+    store=SharedBucketStore(create_state_backend())
+    if os.getenv("RATE_LIMIT_STORE", "memory") == "shared"
+    else MemoryBucketStore()
+)
+
+
+def rate_limit_key(request: Request) -> str:
+    """Identify the client: API key, then IP
+
+    ``X-User-Id`` / ``X-Session-Id`` are unauthenticated and can be rotated
+    freely, so they never replace this key (see ``rate_limit_user_key``).
+    """
+    api_key = request.headers.get("x-api-key")
+    if api_key:
+        # メトリクスにAPIキーそのものを出さない
+        return "key:" + hashlib.sha256(api_key.encode()).hexdigest()[:12]
+    return f"ip:{request.client.host if request.client else 'unknown'}"
+
+
+def rate_limit_user_key(request: Request) -> Optional[str]:
+    """User or session named by the client, for the additional per-user limit"""
+    user_id = request.headers.get("x-user-id")
+    if user_id:
+        return f"user:{user_id}"
+    session_id = request.headers.get("x-session-id")
+    if session_id:
+        return f"session:{session_id}"
+    return None
+
+
+@app.middleware("http")
+async def enforce_rate_limit(request: Request, call_next):
+    """Apply per-endpoint token-bucket limits and attach rate-limit headers"""
+    rule = rate_limiter.rule_for(request.url.path)
+    if rule is None or request.method == "OPTIONS":
+        return await call_next(request)
+
+    decision = await rate_limiter.check(rule, rate_limit_key(request))
+    user_rule = rate_limiter.user_rule_for(request.url.path)
+    user_key = rate_limit_user_key(request)
+    if decision.allowed and user_rule is not None and user_key is not None:
+        # ユーザー単位の制限はクライアント単位の制限に加えて適用する
+        user_decision = await rate_limiter.check(user_rule, user_key)
+        if not user_decision.allowed or user_decision.remaining < decision.remaining:
+            decision = user_decision
+    if not decision.allowed:
+        return JSONResponse(
+            status_code=429,
+            content={"detail": "Rate limit exceeded. Please retry later."},
+            headers=decision.headers(),
+        )
+
+    response = await call_next(request)
+    response.headers.update(decision.headers())
+    return response
+
+
+@app.middleware("http")
+async def track_first_request(request: Request, call_next):
+    """Measure the latency of the first API request after startup"""
+    if lifecycle.first_request_ms is not None or not request.url.path.startswith("/api/"):
+        return await call_next(request)
+    started = time.perf_counter()
+    response = await call_next(request)
+    lifecycle.record_request((time.perf_counter() - started) * 1000)
+    return response
+
+
+@app.middleware("http")
+async def account_token_usage(request: Request, call_next):
+    """Attribute agent token usage to the endpoint and report it in X-Token-Usage"""
+    if not request.url.path.startswith("/api/"):
+        return await call_next(request)
+    request_usage = RequestUsage()
+    with usage_scope(endpoint=request.url.path, request=request_usage):
+        response = await call_next(request)
+    response.headers["X-Token-Usage"] = request_usage.header()
+    if request_usage.budget_exceeded:
+        response.headers["X-Token-Budget-Exceeded"] = "true"
+    return response
+
+
+@app.middleware("http")
+async def profile_route_requests(request: Request, call_next):
+    """Mark requests on the route of a running request-scoped profile capture"""
+    session = profiler.request_started(request.url.path)
+    if session is None:
+        return await call_next(request)
+    try:
+        return await call_next(request)
+    finally:
+        session.request_finished()
+
+
+# Configure CORS (added last so it is the outermost layer: responses produced by the
+# middlewares above, such as 429 from the rate limiter, also get CORS headers)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=[
@@ -35,22 +265,74 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[
+        "RateLimit-Limit",
+        "RateLimit-Remaining",
+        "RateLimit-Reset",
+        "Retry-After",
+        "X-Token-Usage",
+        "X-Token-Budget-Exceeded",
+        "X-Degradations",
+        "Idempotent-Replayed",
+    ],
 )
 
-# Initialize ADK system
-adk_system = None
 
+def require_admin(request: Request) -> None:
+    """Admin endpoints exist only when ADMIN_TOKEN is set and require it in X-Admin-Token"""
+    token = os.getenv("ADMIN_TOKEN")
+    if not token:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not hmac.compare_digest(request.headers.get("x-admin-token", ""), token):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+
+def profile_response(session, format: str):
+    """Collapsed stacks (flamegraph.pl / speedscope input) or a JSON summary"""
+    if format == "json":
+        return session.to_dict()
+    return PlainTextResponse(
+        session.collapsed(),
+        headers={
+            "Content-Disposition": f'attachment; filename="profile-{int(session.started_at)}.collapsed"',
+            "X-Profile-Samples": str(session.samples),
+        },
+    )
 
-@app.on_event("startup")
-async def startup_event():
-    """Initialize the ADK system on startup"""
-    global adk_system
+
+@app.post("/admin/profile")
+async def capture_profile(
+    request: Request,
+    seconds: float = 10,
+    route: Optional[str] = None,
+    requests: int = 0,
+    interval_ms: Optional[float] = None,
+    format: str = "collapsed",
+):
+    """Sample the event loop for ``seconds``, or during the next ``requests`` requests on ``route``"""
+    require_admin(request)
+    if requests > 0 and not route:
+        raise HTTPException(status_code=400, detail="route is required with requests")
     try:
-        adk_system = VirtualBossADKSystem()
-        print("✅ Google ADK system initialized successfully")
-    except Exception as e:
-        print(f"❌ Failed to initialize ADK system: {e}")
-        # Continue without ADK for graceful degradation
+        session = await profiler.capture_profile(
+            seconds=seconds if requests <= 0 else None,
+            route=route,
+            requests=requests,
+            interval_ms=interval_ms,
+        )
+    except ProfilerBusyError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return profile_response(session, format)
+
+
+@app.get("/admin/profile/continuous")
+async def get_continuous_profile(request: Request, format: str = "collapsed", reset: bool = False):
+    """Profile collected by the continuous sampler (PROFILER_ENABLED=true)"""
+    require_admin(request)
+    session = profiler.reset_continuous() if reset else profiler.continuous
+    if session is None:
+        raise HTTPException(status_code=404, detail="Continuous profiling is disabled")
+    return profile_response(session, format)
 
 
 @app.get("/")
@@ -64,13 +346,55 @@ async def root():
     }
 
 
+@app.get("/live")
+async def liveness_probe():
+    """Liveness probe: the process is up and serving"""
+    return {"status": "alive"}
+
+
+@app.get("/ready")
+async def readiness_probe(force: bool = False):
+    """Readiness probe: the ADK system is initialized and warmup has finished
+
+    Model connectivity is reported from the cached background probes but
+    does not affect readiness, since turns fall back to local replies.
+    """
+    system = get_adk_system()
+    status_code = 200 if lifecycle.is_ready else 503
+    return JSONResponse(
+        status_code=status_code,
+        content={
+            "status": "ready" if lifecycle.is_ready else "not_ready",
+            **lifecycle.to_dict(),
+            "connectivity": await system.prober.probe(force=force) if system else None,
+        },
+    )
+
+
 @app.get("/health")
-async def health_check():
-    """Detailed health check"""
+async def health_check(force: bool = False):
+    """Detailed health check (model connectivity from the cached probes; ``force`` probes now)"""
+    system = get_adk_system()
+    circuit_breakers = system.get_circuit_states() if system else {}
+    connectivity = await system.prober.probe(force=force) if system else None
+    if system is None:
+        status = "unhealthy"
+    elif not lifecycle.is_ready:
+        status = "starting"
+    elif any(state != CircuitState.CLOSED for state in circuit_breakers.values()) or \
+            connectivity["status"] in (ProbeStatus.FAILED, ProbeStatus.DEGRADED):
+        # モデル側障害中はフォールバック応答で動作している
+        status = "degraded"
+    else:
+        status = "healthy"
+
     return {
-        "status": "healthy",
-        "google_adk": "available" if adk_system else "unavailable",
+        "status": status,
+        "google_adk": "available" if system else "unavailable",
         "timestamp": asyncio.get_event_loop().time(),
+        "lifecycle": lifecycle.to_dict(),
+        "circuit_breakers": circuit_breakers,
+        "connectivity": connectivity,
         "environment": {
             "project_id": os.getenv("GOOGLE_CLOUD_PROJECT", "not_set"),
             "region": os.getenv("GEMINI_REGION", "us-central1"),
@@ -79,57 +403,356 @@ async def health_check():
     }
 
 
+@app.get("/metrics")
+async def get_metrics():
+    """Runtime metrics for agents and background workers"""
+    system = get_adk_system()
+    if system is None:
+        raise HTTPException(
+            status_code=503, detail="Google ADK system not available"
+        )
+
+    return {
+        **system.get_metrics(),
+        "analysis_jobs": analysis_jobs.get_stats(),
+        "rate_limits": rate_limiter.get_stats(),
+        "profiler": profiler.get_stats(),
+        "event_loop": loop_monitor.to_dict(),
+        "live_drafts": live_draft_stats.to_dict(),
+        "disconnects": disconnects.get_stats(),
+        "idempotency": idempotency.get_stats(),
+    }
+
+
 @app.post("/api/training/process", response_model=TrainingResponse)
-async def process_training_interaction(request: TrainingRequest):
-    """Process a training interaction using Google ADK"""
+async def process_training_interaction(
+    request: TrainingRequest, http_request: Request, http_response: Response, mode: str = "sync"
+):
+    """Process a training interaction using Google ADK
+
+    With ``mode=two_phase`` the boss reply is returned as soon as it is
+    ready together with an ``analysis_ticket``; the analysis and updated
+    user state follow via ``/api/training/analysis/{ticket}``.
+
+    If the client disconnects first, the outstanding agent calls are
+    cancelled instead of being awaited to completion. With a time budget
+    (``X-Request-Deadline`` header or ``deadline_ms``, milliseconds) the
+    turn degrades to fit it and lists what it did in ``degradations``
+    and ``X-Degradations``. Requests with an ``Idempotency-Key`` header
+    run once per user and key; retries get the same response.
+    """
+    received_at = time.monotonic()
+    try:
+        budget_ms = parse_deadline_ms(http_request.headers.get("x-request-deadline", request.deadline_ms))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid deadline: {e}")
+    deadline = TurnDeadline(budget_ms, started=received_at) if budget_ms else None
 
-    if not adk_system:
+    if not get_adk_system():
         raise HTTPException(
             status_code=503,
             detail="Google ADK system not available. Please check configuration.",
         )
 
-    try:
-        response = await adk_system.process_training_interaction(
+    process = (
+        adk_system.process_training_interaction_two_phase
+        if mode == "two_phase"
+        else adk_system.process_training_interaction
+    )
+
+    def run_turn():
+        return process(
             boss_persona=request.boss_persona,
             user_state=request.user_state,
             user_message=request.user_message,
             context=request.context,
+            user_id=request.user_id,
+            session_id=request.session_id,
+            deadline=deadline,
         )
+
+    idempotency_key = http_request.headers.get("idempotency-key")
+    if idempotency_key:
+        return await process_idempotently(http_request, request, mode, idempotency_key, run_turn)
+
+    try:
+        response = await disconnects.run(http_request, "/api/training/process", run_turn())
+        headers = {"X-Degradations": ",".join(response.degradations)} if response.degradations else {}
+        if mode == "two_phase":
+            # response_model (TrainingResponse) とは形が違うのでそのまま返す
+            return JSONResponse(content=response.model_dump(mode="json"), headers=headers)
+        http_response.headers.update(headers)
         return response
 
+    except ClientDisconnectedError:
+        return Response(status_code=CLIENT_CLOSED_REQUEST)
     except Exception as e:
         raise HTTPException(
             status_code=500, detail=f"Training processing failed: {str(e)}"
         )
 
 
+async def process_idempotently(http_request: Request, request: TrainingRequest, mode: str,
+                               idempotency_key: str, run_turn) -> JSONResponse:
+    """Run the turn once per (user, Idempotency-Key) and replay its response to retries"""
+    if len(idempotency_key) > 255:
+        raise HTTPException(status_code=400, detail="Idempotency-Key is too long")
+
+    async def compute() -> Dict[str, Any]:
+        try:
+            response = await run_turn()
+        except Exception as e:
+            return {
+                "status_code": 500,
+                "body": {"detail": f"Training processing failed: {str(e)}"},
+                "headers": {},
+            }
+        headers = {"X-Degradations": ",".join(response.degradations)} if response.degradations else {}
+        return {"status_code": 200, "body": response.model_dump(mode="json"), "headers": headers}
+
+    # 再試行ごとに変わりうる残り時間は同一性の判定に含めない
+    fingerprint = request_fingerprint(
+        {"mode": mode, "request": request.model_dump(mode="json", exclude={"deadline_ms"})}
+    )
+    scope = f"user:{request.user_id}" if request.user_id else rate_limit_key(http_request)
+    try:
+        stored, replayed = await idempotency.run(scope, idempotency_key, fingerprint, compute)
+    except IdempotencyConflictError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except IdempotencyInProgressError as e:
+        raise HTTPException(status_code=409, detail=str(e), headers={"Retry-After": "1"})
+
+    headers = dict(stored["headers"])
+    if replayed:
+        headers["Idempotent-Replayed"] = "true"
+    return JSONResponse(status_code=stored["status_code"], content=stored["body"], headers=headers)
+
+
+@app.post("/api/training/opening", response_model=OpeningResponse)
+async def open_training_session(request: OpeningRequest, http_request: Request):
+    """First boss line of a session, served from the pre-generated pool when possible
+
+    Falls back to generating it live (``source: "live"``) when the pool
+    for the persona and scenario is empty.
+    """
+    if not get_adk_system():
+        raise HTTPException(
+            status_code=503,
+            detail="Google ADK system not available. Please check configuration.",
+        )
+    try:
+        persona = resolve_persona(request.model_dump())
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+    try:
+        boss, source = await disconnects.run(
+            http_request,
+            "/api/training/opening",
+            adk_system.open_session(
+                persona,
+                context=request.context,
+                user_id=request.user_id,
+                session_id=request.session_id,
+            ),
+        )
+        return OpeningResponse(boss_response=boss, source=source)
+
+    except ClientDisconnectedError:
+        return Response(status_code=CLIENT_CLOSED_REQUEST)
+    except Exception as e:
+        raise HTTPException(
+            status_code=500, detail=f"Opening generation failed: {str(e)}"
+        )
+
+
+@app.get("/api/training/analysis/{ticket}")
+async def get_turn_analysis(ticket: str, wait_ms: int = 0):
+    """Analysis of a two-phase turn (``status`` is pending until it is ready)"""
+
+    if not get_adk_system():
+        raise HTTPException(
+            status_code=503, detail="Google ADK system not available"
+        )
+
+    # 分析中の場合は wait_ms まで待つ (上限 10 秒)
+    if wait_ms > 0:
+        record = await adk_system.analysis_tickets.wait(ticket, timeout=min(wait_ms, 10000) / 1000)
+    else:
+        record = await adk_system.analysis_tickets.get(ticket)
+    if record is None:
+        raise HTTPException(status_code=404, detail=f"Analysis ticket not found: {ticket}")
+    return record
+
+
+@app.get("/api/training/analysis/{ticket}/events")
+async def stream_turn_analysis(ticket: str):
+    """Receive the analysis of a two-phase turn via Server-Sent Events"""
+
+    record = await adk_system.analysis_tickets.get(ticket) if get_adk_system() else None
+    if record is None:
+        raise HTTPException(status_code=404, detail=f"Analysis ticket not found: {ticket}")
+
+    async def event_stream():
+        current = record
+        try:
+            while current is not None and current["status"] not in TicketStatus.FINISHED:
+                current = await adk_system.analysis_tickets.wait(ticket, timeout=15)
+                if current is not None and current["status"] not in TicketStatus.FINISHED:
+                    yield ": keep-alive\n\n"
+        except asyncio.CancelledError:
+            disconnects.record("/api/training/analysis/events")
+            raise
+        if current is None:
+            yield "event: error\ndata: {\"detail\": \"ticket expired\"}\n\n"
+            return
+        yield f"event: result\ndata: {json.dumps(current, ensure_ascii=False)}\n\n"
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+
+@app.get("/api/training/suggestions")
+async def get_response_suggestions(session_id: str, wait_ms: int = 0):
+    """Serve suggested replies prefetched after the latest boss turn"""
+
+    if not get_adk_system():
+        raise HTTPException(
+            status_code=503, detail="Google ADK system not available"
+        )
+
+    # 生成中の場合は wait_ms まで待つ (上限 10 秒)
+    return await adk_system.suggestion_prefetcher.get(
+        session_id, wait=min(wait_ms, 10000) / 1000
+    )
+
+
+@app.get("/api/usage")
+async def get_token_usage(session_id: Optional[str] = None):
+    """Token and cost totals by agent, persona, endpoint and session"""
+
+    if not get_adk_system():
+        raise HTTPException(
+            status_code=503, detail="Google ADK system not available"
+        )
+
+    if session_id is None:
+        return adk_system.usage.get_stats()
+    usage = adk_system.usage.get_session(session_id)
+    if usage is None:
+        raise HTTPException(
+            status_code=404, detail=f"No usage recorded for session: {session_id}"
+        )
+    return usage
+
+
+@app.get("/api/users/{user_id}/progress")
+async def get_user_progress(user_id: str):
+    """Get incremental progress statistics for a user"""
+
+    if not get_adk_system():
+        raise HTTPException(
+            status_code=503, detail="Google ADK system not available"
+        )
+
+    progress = await adk_system.progress_tracker.get_progress(user_id)
+    if progress is None:
+        raise HTTPException(
+            status_code=404, detail=f"No progress recorded for user: {user_id}"
+        )
+    return progress
+
+
 @app.post("/api/training/analyze")
-async def analyze_session(session_data: Dict[str, Any]):
-    """Analyze a complete training session"""
+async def analyze_session(session_data: Dict[str, Any], http_request: Request, mode: str = "sync"):
+    """Analyze a complete training session
 
-    if not adk_system:
+    With ``mode=job`` the analysis runs on the job queue and a job id is
+    returned immediately; poll ``/api/jobs/{job_id}`` for the result.
+    """
+
+    if not get_adk_system():
         raise HTTPException(
             status_code=503, detail="Google ADK system not available"
         )
 
+    if mode == "job":
+        try:
+            job, deduplicated = await analysis_jobs.submit(
+                session_data.get("interactions", [])
+            )
+        except QueueFullError as e:
+            raise HTTPException(status_code=503, detail=str(e))
+
+        return JSONResponse(
+            status_code=202,
+            content={
+                "job_id": job["job_id"],
+                "status": job["status"],
+                "deduplicated": deduplicated,
+            },
+        )
+
     try:
-        analysis = await adk_system.get_session_analytics(
-            session_data.get("interactions", [])
+        analysis = await disconnects.run(
+            http_request,
+            "/api/training/analyze",
+            adk_system.get_session_analytics(session_data.get("interactions", [])),
         )
         return analysis
 
+    except ClientDisconnectedError:
+        return Response(status_code=CLIENT_CLOSED_REQUEST)
     except Exception as e:
         raise HTTPException(
             status_code=500, detail=f"Session analysis failed: {str(e)}"
         )
 
 
+@app.get("/api/jobs/{job_id}")
+async def get_analysis_job(job_id: str):
+    """Poll the status and result of an analysis job"""
+
+    job = await analysis_jobs.get(job_id) if get_adk_system() else None
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job not found: {job_id}")
+    return job
+
+
+@app.get("/api/jobs/{job_id}/events")
+async def stream_analysis_job(job_id: str):
+    """Subscribe to an analysis job via Server-Sent Events"""
+
+    job = await analysis_jobs.get(job_id) if get_adk_system() else None
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job not found: {job_id}")
+
+    async def event_stream():
+        record = job
+        yield f"event: status\ndata: {json.dumps({'status': record['status']})}\n\n"
+        try:
+            while record is not None and record["status"] not in JobStatus.FINISHED:
+                # プロキシのアイドルタイムアウト対策として15秒ごとに keep-alive を送る
+                record = await analysis_jobs.wait(job_id, timeout=15)
+                if record is not None and record["status"] not in JobStatus.FINISHED:
+                    yield ": keep-alive\n\n"
+        except asyncio.CancelledError:
+            # 購読者が切断した (ジョブ自体は共有されているので続行し、ポーリングで取得できる)
+            disconnects.record("/api/jobs/events")
+            raise
+        if record is None:
+            yield "event: error\ndata: {\"detail\": \"job expired\"}\n\n"
+            return
+        payload = json.dumps(record, ensure_ascii=False)
+        yield f"event: result\ndata: {payload}\n\n"
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+
 @app.post("/api/training/test", response_model=TestResponse)
-async def test_adk_connection(request: TestRequest):
-    """Test Google ADK connection"""
+async def test_adk_connection(request: TestRequest, http_request: Request, force: bool = False):
+    """Test Google ADK connection (cached probe results unless ``force=true``)"""
 
-    if not adk_system:
+    if not get_adk_system():
         return TestResponse(
             status="error",
             message="ADK system not initialized",
@@ -137,7 +760,9 @@ async def test_adk_connection(request: TestRequest):
         )
 
     try:
-        test_result = await adk_system.test_connection()
+        test_result = await disconnects.run(
+            http_request, "/api/training/test", adk_system.test_connection(force=force)
+        )
 
         return TestResponse(
             status=test_result["status"],
@@ -145,6 +770,8 @@ async def test_adk_connection(request: TestRequest):
             adk_version="1.3.0",
         )
 
+    except ClientDisconnectedError:
+        return Response(status_code=CLIENT_CLOSED_REQUEST)
     except Exception as e:
         return TestResponse(
             status="error",
@@ -153,51 +780,133 @@ async def test_adk_connection(request: TestRequest):
         )
 
 
+DRAFT_DEBOUNCE_SECONDS = float(os.getenv("DRAFT_DEBOUNCE_MS", "50")) / 1000
+WS_NORMAL_CLOSE_CODES = (1000, 1005)
+
+
+def resolve_persona(message: Dict[str, Any]) -> BossPersona:
+    """Persona from a live-channel start message (inline object or registered id)"""
+    if message.get("boss_persona"):
+        return BossPersona(**message["boss_persona"])
+    persona = get_persona(message.get("persona_id", ""))
+    if persona is None:
+        raise ValueError(f"Unknown persona: {message.get('persona_id')}")
+    return BossPersona(**persona)
+
+
+@app.websocket("/ws/training/draft")
+async def live_draft_channel(websocket: WebSocket):
+    """Score the trainee's draft while they type, without any model call
+
+    The client sends ``{"type": "start", "boss_persona": {...}}`` (or
+    ``persona_id``) and then ``{"type": "draft", "text": ...}`` on each
+    keystroke. Drafts arriving within DRAFT_DEBOUNCE_MS are coalesced and
+    only the latest is rescored, incrementally from the first changed
+    character. When the start message also carries ``session_id`` (plus
+    ``user_state`` and ``context`` as in /api/training/process), a draft
+    that stays unchanged for SPECULATION_STABLE_MS starts generating the
+    boss reply in the background. If the socket goes away without a
+    normal close (1000, or 1005 from a bare ``close()``), a speculation
+    still in flight is cancelled.
+    """
+    await websocket.accept()
+    live_draft_stats.connections += 1
+    live_draft_stats.active += 1
+    state: Dict[str, Any] = {
+        "scorer": None, "draft": None, "error": None, "turn": None, "speculated": None
+    }
+    changed = asyncio.Event()
+
+    async def receive_messages():
+        while True:
+            message = await websocket.receive_json()
+            if message.get("type") == "start":
+                try:
+                    persona = resolve_persona(message)
+                    state["scorer"] = DraftScorer(compile_lexicon(persona_triggers(persona)))
+                    state["turn"] = {
+                        "session_id": message["session_id"],
+                        "persona": persona,
+                        "user_state": UserState(**message.get("user_state", {})),
+                        "context": message.get("context"),
+                    } if message.get("session_id") else None
+                    state["speculated"] = None
+                except Exception as e:
+                    state["error"] = f"Invalid start message: {e}"
+            elif message.get("type") == "draft":
+                state["draft"] = str(message.get("text", ""))
+                live_draft_stats.drafts_received += 1
+            else:
+                state["error"] = f"Unknown message type: {message.get('type')}"
+            changed.set()
+
+    reader = asyncio.create_task(receive_messages())
+    close_code = None
+    try:
+        while True:
+            system = get_adk_system()
+            can_speculate = (
+                system is not None and system.speculator.enabled and state["turn"] is not None
+                and state["draft"] is not None and state["draft"] != state["speculated"]
+            )
+            waiter = asyncio.create_task(changed.wait())
+            done, _ = await asyncio.wait(
+                {reader, waiter},
+                timeout=system.speculator.stable_seconds if can_speculate else None,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            if reader.done():
+                waiter.cancel()
+                break
+            if not done:
+                # 下書きが一定時間変わらなければ上司の応答を先に生成しておく
+                waiter.cancel()
+                turn, draft = state["turn"], state["draft"]
+                state["speculated"] = draft
+                if system.speculate_boss_reply(
+                    turn["session_id"], turn["persona"], turn["user_state"], draft, turn["context"]
+                ):
+                    await websocket.send_json({"type": "speculation", "status": "started"})
+                continue
+            # 連続した入力をまとめて最新の下書きだけを採点する
+            await asyncio.sleep(DRAFT_DEBOUNCE_SECONDS)
+            changed.clear()
+
+            if state["error"]:
+                await websocket.send_json({"type": "error", "detail": state["error"]})
+                state["error"] = None
+            scorer, draft = state["scorer"], state["draft"]
+            if scorer is None or draft is None or draft == scorer.text:
+                continue
+            started = time.perf_counter()
+            scanned = scorer.update(draft)
+            live_draft_stats.record(scanned, time.perf_counter() - started)
+            await websocket.send_json({"type": "score", **scorer.scores()})
+    except WebSocketDisconnect as e:
+        close_code = e.code
+    finally:
+        reader.cancel()
+        if reader.done() and not reader.cancelled():
+            # 切断時の WebSocketDisconnect を回収する
+            error = reader.exception()
+            if isinstance(error, WebSocketDisconnect):
+                close_code = error.code
+        live_draft_stats.active -= 1
+
+    if close_code is not None and close_code not in WS_NORMAL_CLOSE_CODES:
+        # 送信せずに画面を離れた場合は生成中の投機を取り消す
+        session_id = state["turn"]["session_id"] if state["turn"] else None
+        cancelled = bool(session_id) and adk_system is not None and adk_system.speculator.in_flight(session_id)
+        if cancelled:
+            adk_system.speculator.discard(session_id)
+        disconnects.record("/ws/training/draft", cancelled=cancelled)
+
+
 @app.get("/api/boss-personas")
 async def get_available_boss_personas():
     """Get available boss personas for training"""
 
-    # Sample personas - in production, these might come from a database
-    personas = [
-        {
-            "id": "supportive_mentor",
-            "name": "佐藤部長",
-            "description": "サポート的で理解のある上司。新人の成長を重視する。",
-            "difficulty": 3,
-            "stress_triggers": ["遅刻", "準備不足"],
-            "communication_style": "優しく指導的",
-            "avatar_url": None,
-        },
-        {
-            "id": "demanding_perfectionist",
-            "name": "田中課長",
-            "description": "完璧主義で要求が厳しい上司。高い成果を期待する。",
-            "difficulty": 7,
-            "stress_triggers": ["ミス", "効率の悪さ", "言い訳"],
-            "communication_style": "直接的で厳格",
-            "avatar_url": None,
-        },
-        {
-            "id": "micromanager",
-            "name": "山田マネージャー",
-            "description": "細かいことまで管理したがるマイクロマネージャー。",
-            "difficulty": 8,
-            "stress_triggers": ["自主性", "報告の遅れ", "独断行動"],
-            "communication_style": "詳細指向で管理的",
-            "avatar_url": None,
-        },
-        {
-            "id": "visionary_leader",
-            "name": "鈴木役員",
-            "description": "ビジョナリーなリーダー。大局的な視点を重視する。",
-            "difficulty": 5,
-            "stress_triggers": ["短期思考", "創造性の欠如"],
-            "communication_style": "戦略的で鼓舞的",
-            "avatar_url": None,
-        },
-    ]
-
-    return {"personas": personas}
+    return {"personas": BOSS_PERSONAS}
 
 
 if __name__ == "__main__":
@@ -206,14 +915,25 @@ if __name__ == "__main__":
     port = int(os.getenv("PORT", 8000))
     host = os.getenv("HOST", "0.0.0.0")
     debug = os.getenv("DEBUG", "true").lower() == "true"
+    workers = int(os.getenv("WORKERS", os.getenv("WEB_CONCURRENCY", "1")))
+    state_backend = os.getenv("STATE_BACKEND", "memory")
+
+    if workers > 1 and state_backend == "memory":
+        print(
+            "⚠️  WORKERS > 1 with STATE_BACKEND=memory: "
+            "jobs and progress will be split across workers (use sqlite or redis)"
+        )
 
     print(f"🚀 Starting Google ADK Backend Server on {host}:{port}")
+    print(f"👷 Workers: {workers} (state backend: {state_backend})")
     print(f"📖 API Documentation: http://{host}:{port}/docs")
 
     uvicorn.run(
         "main:app",
         host=host,
         port=port,
-        reload=debug,
+        # reload はシングルプロセスでのみ利用可能
+        reload=debug and workers == 1,
+        workers=workers,
         log_level="info" if debug else "warning",
     )
@@ -52,6 +52,9 @@ class TrainingRequest(BaseModel):
     user_state: UserState
     user_message: str
     context: Optional[str] = None
+    user_id: Optional[str] = None  # 進捗統計の集計キー
+    session_id: Optional[str] = None
+    deadline_ms: Optional[float] = None  # 受信時点からの時間予算 (X-Request-Deadline と同じ)
 
 
 class BossResponse(BaseModel):
@@ -73,6 +76,26 @@ class TrainingResponse(BaseModel):
     boss_response: BossResponse
     analysis: AnalysisResult
     updated_user_state: UserState
+    degradations: List[str] = []  # 期限内に収めるために適用した縮退
+
+
+class BossFirstResponse(BaseModel):
+    boss_response: BossResponse
+    analysis_ticket: str  # /api/training/analysis/{ticket} で分析結果を取得する
+    degradations: List[str] = []
+
+
+class OpeningRequest(BaseModel):
+    boss_persona: Optional[BossPersona] = None
+    persona_id: Optional[str] = None  # boss_persona を省略した場合は登録済みペルソナの id
+    context: Optional[str] = None  # 会話の場面 (例: "月次進捗会議での報告")
+    user_id: Optional[str] = None
+    session_id: Optional[str] = None
+
+
+class OpeningResponse(BaseModel):
+    boss_response: BossResponse
+    source: str  # "pool" (事前生成) または "live" (その場で生成)
 
 
 class TestRequest(BaseModel):
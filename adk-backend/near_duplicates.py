@@ -0,0 +1,222 @@
+import os
+import re
+import random
+import hashlib
+import logging
+import unicodedata
+from collections import OrderedDict, deque
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# MinHash 用の素数 (2^61 - 1); 係数を 2^31 未満にして 32bit ハッシュとの積を uint64 に収める
+_PRIME = np.uint64((1 << 61) - 1)
+_MAX_COEFFICIENT = 1 << 31
+_NON_WORD = re.compile(r"\W+")
+_DIGITS = re.compile(r"\d+")
+
+
+def normalize_message(text: str) -> str:
+    """Fold width/case, collapse numbers and drop punctuation and whitespace"""
+    text = unicodedata.normalize("NFKC", text).lower()
+    # 日付や数値だけが違う定型文を同一視する
+    text = _DIGITS.sub("0", text)
+    return _NON_WORD.sub("", text)
+
+
+def shingles(text: str, n: int) -> List[bytes]:
+    if len(text) <= n:
+        return [text.encode("utf-8")] if text else []
+    return list({text[i:i + n].encode("utf-8") for i in range(len(text) - n + 1)})
+
+
+class NearDuplicateMatch:
+    __slots__ = ("message", "analysis", "similarity", "reuse")
+
+    def __init__(self, message: str, analysis: Dict[str, Any], similarity: float, reuse: bool = False):
+        self.message = message
+        self.analysis = analysis
+        self.similarity = similarity
+        # True のときだけ分析結果をそのまま使う (それ以外はプロンプトへのヒント)
+        self.reuse = reuse
+
+
+class NearDuplicateIndex:
+    """MinHash + LSH index of analysed user messages, per (persona, stress) scope
+
+    Signatures are ``num_perm`` MinHash values over character n-grams of the
+    normalized message; LSH bands select candidates, which are accepted when
+    the estimated Jaccard similarity reaches ``threshold``. The index is
+    local to the worker process and bounded per scope.
+
+    In ``reuse`` mode (the default) only messages that are identical after
+    normalization are matched, and their analysis is reused as is: a
+    one-character change such as できます/できません scores well above any
+    useful threshold. ``hint`` mode additionally passes near-duplicates
+    from the same owner (user or session) to the analysis prompt; hints
+    add input tokens without saving a call, so it is opt-in, and another
+    trainee's text never reaches a different trainee's prompt.
+    """
+
+    def __init__(
+        self,
+        mode: str = None,
+        threshold: float = None,
+        ngram: int = None,
+        num_perm: int = None,
+        bands: int = None,
+        max_entries: int = None,
+        audit_rate: float = None,
+        seed: int = 1,
+    ):
+        self.mode = (mode or os.getenv("NEAR_DUP_MODE", "reuse")).lower()
+        self.threshold = threshold or float(os.getenv("NEAR_DUP_THRESHOLD", "0.85"))
+        self.ngram = ngram or int(os.getenv("NEAR_DUP_NGRAM", "3"))
+        self.num_perm = num_perm or int(os.getenv("NEAR_DUP_NUM_PERM", "64"))
+        self.bands = bands or int(os.getenv("NEAR_DUP_BANDS", "16"))
+        if self.num_perm % self.bands:
+            raise ValueError("NEAR_DUP_NUM_PERM must be a multiple of NEAR_DUP_BANDS")
+        self.rows = self.num_perm // self.bands
+        self.max_entries = max_entries or int(os.getenv("NEAR_DUP_MAX_ENTRIES_PER_SCOPE", "2000"))
+        self.audit_rate = audit_rate if audit_rate is not None else float(
+            os.getenv("NEAR_DUP_AUDIT_RATE", "0.05")
+        )
+
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, _MAX_COEFFICIENT, self.num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, _MAX_COEFFICIENT, self.num_perm, dtype=np.uint64)
+        self._entries: Dict[str, "OrderedDict[int, Tuple[str, np.ndarray, Dict[str, Any], Optional[str]]]"] = {}
+        self._buckets: Dict[Tuple[str, int, bytes], List[int]] = {}
+        self._next_id = 0
+
+        self.lookups = 0
+        self.hits = 0
+        self.reused = 0
+        self.hinted = 0
+        # ヒントで増えた入力トークンと、再利用で省いた呼び出しのトークン (推定値)
+        self.hint_tokens = 0
+        self.saved_tokens = 0
+        self.hits_by_persona: Dict[str, int] = {}
+        self.audit_samples = deque(maxlen=20)
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode in ("reuse", "hint")
+
+    @staticmethod
+    def scope(persona_id: str, stress_level: Any) -> str:
+        return f"{persona_id}:{getattr(stress_level, 'value', stress_level)}"
+
+    def signature(self, message: str) -> Optional[np.ndarray]:
+        grams = shingles(normalize_message(message), self.ngram)
+        if not grams:
+            return None
+        hashes = np.fromiter(
+            (int.from_bytes(hashlib.blake2b(gram, digest_size=4).digest(), "little") for gram in grams),
+            dtype=np.uint64, count=len(grams)
+        )
+        return ((np.outer(hashes, self._a) + self._b) % _PRIME).min(axis=0)
+
+    def _band_keys(self, scope: str, signature: np.ndarray):
+        for band in range(self.bands):
+            yield scope, band, signature[band * self.rows:(band + 1) * self.rows].tobytes()
+
+    def lookup(self, scope: str, message: str, owner: str = None) -> Optional[NearDuplicateMatch]:
+        """Most similar usable prior analysis in the scope at or above the threshold
+
+        Identical (normalized) messages match across owners; other
+        near-duplicates only in ``hint`` mode and only for the same ``owner``.
+        """
+        signature = self.signature(message)
+        if signature is None:
+            return None
+        self.lookups += 1
+        entries = self._entries.get(scope, {})
+        candidates = set()
+        for key in self._band_keys(scope, signature):
+            candidates.update(self._buckets.get(key, ()))
+
+        normalized = normalize_message(message)
+        best = None
+        for entry_id in candidates:
+            prior_message, prior_signature, analysis, prior_owner = entries[entry_id]
+            similarity = float(np.count_nonzero(prior_signature == signature)) / self.num_perm
+            if similarity < self.threshold:
+                continue
+            reuse = normalize_message(prior_message) == normalized
+            if not reuse and not (self.mode == "hint" and owner is not None and prior_owner == owner):
+                continue
+            # 再利用できる一致を優先し、その中で類似度の高いものを選ぶ
+            if best is None or (reuse, similarity) > (best.reuse, best.similarity):
+                best = NearDuplicateMatch(prior_message, analysis, similarity, reuse)
+        if best is None:
+            return None
+
+        self.hits += 1
+        persona_id = scope.split(":", 1)[0]
+        self.hits_by_persona[persona_id] = self.hits_by_persona.get(persona_id, 0) + 1
+        if best.reuse:
+            self.reused += 1
+        else:
+            self.hinted += 1
+        if random.random() < self.audit_rate:
+            # 誤判定の確認用に、一致したメッセージの組をサンプリングして残す
+            sample = {
+                "scope": scope,
+                "similarity": round(best.similarity, 3),
+                "message": message,
+                "matched": best.message,
+                "mode": "reuse" if best.reuse else "hint",
+            }
+            self.audit_samples.append(sample)
+            logger.info("near-duplicate %(mode)s scope=%(scope)s similarity=%(similarity)s "
+                        "message=%(message)r matched=%(matched)r", sample)
+        return best
+
+    def record_tokens(self, hint_tokens: int = 0, saved_tokens: int = 0) -> None:
+        """Account the estimated tokens a hint added or a reuse saved"""
+        self.hint_tokens += hint_tokens
+        self.saved_tokens += saved_tokens
+
+    def add(self, scope: str, message: str, analysis: Dict[str, Any], owner: str = None) -> None:
+        """Index an agent-produced analysis for ``message`` (``owner``: user or session)"""
+        signature = self.signature(message)
+        if signature is None:
+            return
+        entries = self._entries.setdefault(scope, OrderedDict())
+        entry_id = self._next_id
+        self._next_id += 1
+        entries[entry_id] = (message, signature, analysis, owner)
+        for key in self._band_keys(scope, signature):
+            self._buckets.setdefault(key, []).append(entry_id)
+
+        # スコープごとに古いエントリから削除
+        while len(entries) > self.max_entries:
+            old_id, (_, old_signature, _, _) = entries.popitem(last=False)
+            for key in self._band_keys(scope, old_signature):
+                bucket = self._buckets.get(key)
+                if bucket is not None:
+                    bucket.remove(old_id)
+                    if not bucket:
+                        del self._buckets[key]
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "mode": self.mode,
+            "threshold": self.threshold,
+            "lookups": self.lookups,
+            "hits": self.hits,
+            "hit_rate": round(self.hits / self.lookups, 3) if self.lookups else None,
+            "reused": self.reused,
+            "hinted": self.hinted,
+            "hint_tokens": self.hint_tokens,
+            "saved_tokens": self.saved_tokens,
+            # 正なら近似重複の利用でトークンが増えている
+            "token_delta": self.hint_tokens - self.saved_tokens,
+            "hits_by_persona": dict(self.hits_by_persona),
+            "entries": sum(len(entries) for entries in self._entries.values()),
+            "scopes": len(self._entries),
+            "audit_samples": list(self.audit_samples),
+        }
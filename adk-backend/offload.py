@@ -0,0 +1,69 @@
+import os
+import json
+import asyncio
+import functools
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+
+class Offloader:
+    """Runs CPU-heavy stages in an executor when their input is large
+
+    ``OFFLOAD_EXECUTOR`` selects ``thread``, ``process`` or ``none``. Inputs
+    below ``OFFLOAD_MIN_BYTES`` (text) or ``OFFLOAD_MIN_ITEMS`` (collections)
+    run inline, where the executor hand-off would cost more than it saves.
+    With a process pool, the function and its arguments must be picklable.
+    """
+
+    def __init__(self, kind: str = None, max_workers: int = None,
+                 min_bytes: int = None, min_items: int = None):
+        self.kind = (kind or os.getenv("OFFLOAD_EXECUTOR", "thread")).lower()
+        self.max_workers = max_workers or int(os.getenv("OFFLOAD_MAX_WORKERS", "2"))
+        self.min_bytes = min_bytes or int(os.getenv("OFFLOAD_MIN_BYTES", "65536"))
+        self.min_items = min_items or int(os.getenv("OFFLOAD_MIN_ITEMS", "200"))
+        self._executor: Optional[Executor] = None
+        self.inline: Dict[str, int] = {}
+        self.offloaded: Dict[str, int] = {}
+
+    @property
+    def executor(self) -> Optional[Executor]:
+        # 初回のオフロード時に作成する (プロセスプールの起動コストを避ける)
+        if self._executor is None and self.kind in ("thread", "process"):
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix="offload"
+                )
+        return self._executor
+
+    def should_offload(self, size_bytes: int = 0, items: int = 0) -> bool:
+        return self.kind != "none" and (size_bytes >= self.min_bytes or items >= self.min_items)
+
+    async def run(self, stage: str, func: Callable, *args,
+                  size_bytes: int = 0, items: int = 0, **kwargs) -> Any:
+        """Call ``func`` inline, or in the executor when the input exceeds a threshold"""
+        if not self.should_offload(size_bytes, items):
+            self.inline[stage] = self.inline.get(stage, 0) + 1
+            return func(*args, **kwargs)
+        self.offloaded[stage] = self.offloaded.get(stage, 0) + 1
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+
+    async def loads(self, text: str) -> Any:
+        return await self.run("json_decode", json.loads, text, size_bytes=len(text))
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "executor": self.kind,
+            "max_workers": self.max_workers,
+            "min_bytes": self.min_bytes,
+            "min_items": self.min_items,
+            "inline": dict(self.inline),
+            "offloaded": dict(self.offloaded),
+        }
@@ -0,0 +1,271 @@
+import os
+import time
+import asyncio
+import hashlib
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from models import BossPersona, BossResponse
+from shared_state import StateBackend, MemoryStateBackend
+
+# context を指定しない会話の開始 (_build_boss_context の既定値と同じ)
+DEFAULT_SCENARIO = "新しい会話の開始"
+
+PoolKey = Tuple[str, str]
+
+
+def scenario_key(context: Optional[str]) -> str:
+    return (context or "").strip() or DEFAULT_SCENARIO
+
+
+class OpeningPool:
+    """Pre-generated opening boss lines per (persona, scenario), refilled in the background
+
+    Each key is kept at ``depth`` entries in the shared state backend, so
+    all workers serve from and refill one pool; a refill lease keeps two
+    workers from generating for the same key at once. Entries older than
+    ``ttl`` seconds are dropped instead of served. Taking an entry (or
+    missing) queues a refill of its key. A sweep every ``ttl / 2`` seconds
+    replaces entries that are about to expire, but only for keys requested
+    within ``demand_window`` seconds: an idle server lets its pool expire
+    instead of regenerating it forever.
+
+    Only the registered personas and configured scenarios are pooled, and
+    an entry is served only when the requested persona matches the pooled
+    one exactly. Other requests are generated live without any refill, so
+    free-text contexts cannot multiply model calls. With ``learn_after``
+    set, a key outside that set gets a pool after that many misses, up to
+    ``max_keys`` keys (least recently used keys are dropped first).
+    """
+
+    PREFIX = "opening:"
+    LEASE_PREFIX = "openinglease:"
+
+    def __init__(self, generate: Callable[[BossPersona, str, List[str]], Awaitable[BossResponse]],
+                 backend: StateBackend = None, enabled: bool = None, depth: int = None,
+                 ttl: float = None, concurrency: int = None, max_keys: int = None,
+                 scenarios: List[str] = None, learn_after: int = None, demand_window: float = None):
+        self.generate = generate
+        self.backend = backend or MemoryStateBackend()
+        self.enabled = enabled if enabled is not None else (
+            os.getenv("OPENING_POOL_ENABLED", "true").lower() == "true"
+        )
+        self.depth = depth or int(os.getenv("OPENING_POOL_DEPTH", "3"))
+        self.ttl = ttl or float(os.getenv("OPENING_POOL_TTL_SECONDS", "1800"))
+        self.concurrency = concurrency or int(os.getenv("OPENING_POOL_REFILL_CONCURRENCY", "2"))
+        self.max_keys = max_keys or int(os.getenv("OPENING_POOL_MAX_KEYS", "100"))
+        # 0 なら起動時のキー以外はプールしない
+        self.learn_after = learn_after if learn_after is not None else int(
+            os.getenv("OPENING_POOL_LEARN_AFTER_MISSES", "0")
+        )
+        # この秒数以内に要求のあったキーだけを巡回で入れ替える
+        self.demand_window = demand_window or float(
+            os.getenv("OPENING_POOL_DEMAND_WINDOW_SECONDS", str(self.ttl))
+        )
+        # 補充中のワーカーが落ちた場合に、他のワーカーが補充を引き継げるまでの秒数
+        self.lease_seconds = float(os.getenv("OPENING_POOL_LEASE_SECONDS", "120"))
+        configured = os.getenv("OPENING_POOL_SCENARIOS", "")
+        self.scenarios = scenarios or [s.strip() for s in configured.split(",") if s.strip()] or None
+
+        self._personas: "OrderedDict[PoolKey, BossPersona]" = OrderedDict()
+        self._queue: "asyncio.Queue[PoolKey]" = None
+        self._queued: Dict[PoolKey, str] = {}
+        self._unknown_misses: "OrderedDict[PoolKey, int]" = OrderedDict()
+        self._depths: Dict[PoolKey, int] = {}
+        self._tasks: List[asyncio.Task] = []
+
+        self.hits = 0
+        self.misses = 0
+        self.unpooled = 0
+        self.learned_keys = 0
+        self.expired = 0
+        self.generated = 0
+        self.duplicates = 0
+        self.failures = 0
+        self.evicted_keys = 0
+        self.lease_skips = 0
+        self.idle_skips = 0
+        # 補充のための生成呼び出しを理由別に数える (startup / taken / sweep / learned)
+        self.refill_calls: Dict[str, int] = {}
+
+    def start(self, personas: List[BossPersona], scenarios: List[str]) -> None:
+        """Seed the startup keys and start the refill workers"""
+        if not self.enabled or self._tasks:
+            return
+        self._queue = asyncio.Queue()
+        for persona in personas:
+            for scenario in self.scenarios or scenarios:
+                self._add_key((persona.id, scenario_key(scenario)), persona, "startup")
+        self._tasks = [
+            asyncio.create_task(self._worker(), name=f"opening-pool-{i}") for i in range(self.concurrency)
+        ]
+        self._tasks.append(asyncio.create_task(self._sweep(), name="opening-pool-sweep"))
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def _storage_key(self, key: PoolKey) -> str:
+        # 場面は自由入力にもなりうるので、そのままキーにしない
+        return hashlib.sha256(f"{key[0]}\0{key[1]}".encode("utf-8")).hexdigest()
+
+    def _add_key(self, key: PoolKey, persona: BossPersona, reason: str) -> None:
+        self._personas[key] = persona
+        while len(self._personas) > self.max_keys:
+            old_key, _ = self._personas.popitem(last=False)
+            self._depths.pop(old_key, None)
+            self.evicted_keys += 1
+        self._schedule(key, reason)
+
+    def _maybe_learn(self, key: PoolKey, persona: BossPersona) -> None:
+        # プール済みのキーを別内容のペルソナで作り直すことはしない (取り合いで補充が無駄になる)
+        if not self.learn_after or key in self._personas:
+            return
+        misses = self._unknown_misses.pop(key, 0) + 1
+        if misses >= self.learn_after:
+            self._add_key(key, persona, "learned")
+            self.learned_keys += 1
+            return
+        self._unknown_misses[key] = misses
+        while len(self._unknown_misses) > self.max_keys:
+            self._unknown_misses.popitem(last=False)
+
+    def _schedule(self, key: PoolKey, reason: str) -> None:
+        if self._queue is not None and key not in self._queued:
+            self._queued[key] = reason
+            self._queue.put_nowait(key)
+
+    def _fresh(self, record: Optional[Dict[str, Any]], now: float, horizon: float = 0) -> List[List[Any]]:
+        entries = (record or {}).get("entries", [])
+        cutoff = now - self.ttl + horizon
+        fresh = [entry for entry in entries if entry[0] >= cutoff]
+        self.expired += len(entries) - len(fresh)
+        return fresh
+
+    async def take(self, persona: BossPersona, context: Optional[str]) -> Optional[BossResponse]:
+        """A fresh opening line for the persona and scenario, or None when the pool is empty"""
+        if not self.enabled or self._queue is None:
+            return None
+        key = (persona.id, scenario_key(context))
+        pooled = self._personas.get(key)
+        if pooled is None or pooled != persona:
+            # プール対象外: 補充は予約せず、呼び出し側でその場で生成させる
+            self.unpooled += 1
+            self._maybe_learn(key, persona)
+            return None
+        self._personas.move_to_end(key)
+
+        now = time.time()
+        served = None
+
+        def pop(record: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+            # 競合時に再実行されることがあるので、取り出した候補は最後の実行のものを使う
+            nonlocal served
+            fresh = self._fresh(record, now)
+            served = fresh.pop(0)[1] if fresh else None
+            return {"entries": fresh, "requested_at": now}
+
+        record = await self.backend.update(self.PREFIX + self._storage_key(key), pop, self.ttl * 2)
+        self._depths[key] = len(record["entries"])
+        self._schedule(key, "taken")
+        if served is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        # 古いものから使い、補充は予約済み
+        return BossResponse(**served)
+
+    async def _worker(self) -> None:
+        while True:
+            key = await self._queue.get()
+            try:
+                await self._refill(key, self._queued.get(key, "taken"))
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                self.failures += 1
+            finally:
+                self._queued.pop(key, None)
+
+    async def _refill(self, key: PoolKey, reason: str) -> None:
+        persona = self._personas.get(key)
+        if persona is None:
+            return
+        storage_key = self._storage_key(key)
+        # 他のワーカーが同じキーを補充中なら任せる
+        if not await self.backend.add(self.LEASE_PREFIX + storage_key, time.time(), self.lease_seconds):
+            self.lease_skips += 1
+            return
+        try:
+            # 重複ばかり返ってくる場合に備えて試行回数を制限する
+            for _ in range(self.depth * 2):
+                fresh = self._fresh(await self.backend.get(self.PREFIX + storage_key), time.time())
+                self._depths[key] = len(fresh)
+                if len(fresh) >= self.depth:
+                    return
+                self.refill_calls[reason] = self.refill_calls.get(reason, 0) + 1
+                reply = await self.generate(persona, key[1], [entry[1]["message"] for entry in fresh])
+                if any(entry[1]["message"] == reply.message for entry in fresh):
+                    self.duplicates += 1
+                    continue
+
+                def append(record: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+                    record = record or {"entries": [], "requested_at": None}
+                    entries = self._fresh(record, time.time())
+                    if len(entries) < self.depth:
+                        entries.append([time.time(), reply.model_dump(mode="json")])
+                    return {"entries": entries, "requested_at": record.get("requested_at")}
+
+                record = await self.backend.update(self.PREFIX + storage_key, append, self.ttl * 2)
+                self._depths[key] = len(record["entries"])
+                self.generated += 1
+        finally:
+            await self.backend.delete(self.LEASE_PREFIX + storage_key)
+
+    async def _sweep(self) -> None:
+        while True:
+            await asyncio.sleep(self.ttl / 2)
+            now = time.time()
+            for key in list(self._personas):
+                try:
+                    record = await self.backend.get(self.PREFIX + self._storage_key(key))
+                except Exception:
+                    self.failures += 1
+                    continue
+                requested_at = (record or {}).get("requested_at")
+                if requested_at is None or now - requested_at > self.demand_window:
+                    # 誰も使っていないキーは期限切れに任せ、アイドル中に生成し続けない
+                    self.idle_skips += 1
+                    continue
+                # 次の巡回までに期限切れになるものがあれば先に補充する
+                if len(self._fresh(record, now, horizon=self.ttl / 2)) < self.depth:
+                    self._schedule(key, "sweep")
+
+    def get_stats(self) -> Dict[str, Any]:
+        served = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "keys": len(self._personas),
+            "target_depth": self.depth,
+            "ttl_s": self.ttl,
+            "demand_window_s": self.demand_window,
+            # 共有ステートを最後に読み書きした時点の件数
+            "entries": sum(self._depths.values()),
+            "empty_keys": sum(1 for depth in self._depths.values() if not depth),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / served, 3) if served else None,
+            "unpooled": self.unpooled,
+            "learned_keys": self.learned_keys,
+            "expired": self.expired,
+            "generated": self.generated,
+            "duplicates": self.duplicates,
+            "failures": self.failures,
+            "refill_calls": dict(self.refill_calls),
+            "lease_skips": self.lease_skips,
+            "idle_skips": self.idle_skips,
+            "refills_pending": len(self._queued),
+            "evicted_keys": self.evicted_keys,
+        }
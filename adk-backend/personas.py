@@ -0,0 +1,61 @@
+from typing import Any, Dict, List, Optional
+
+# Sample personas - in production, these might come from a database
+BOSS_PERSONAS: List[Dict[str, Any]] = [
+    {
+        "id": "supportive_mentor",
+        "name": "佐藤部長",
+        "description": "サポート的で理解のある上司。新人の成長を重視する。",
+        "difficulty": 3,
+        "stress_triggers": ["遅刻", "準備不足"],
+        "communication_style": "優しく指導的",
+        "avatar_url": None,
+    },
+    {
+        "id": "demanding_perfectionist",
+        "name": "田中課長",
+        "description": "完璧主義で要求が厳しい上司。高い成果を期待する。",
+        "difficulty": 7,
+        "stress_triggers": ["ミス", "効率の悪さ", "言い訳"],
+        "communication_style": "直接的で厳格",
+        "avatar_url": None,
+    },
+    {
+        "id": "micromanager",
+        "name": "山田マネージャー",
+        "description": "細かいことまで管理したがるマイクロマネージャー。",
+        "difficulty": 8,
+        "stress_triggers": ["自主性", "報告の遅れ", "独断行動"],
+        "communication_style": "詳細指向で管理的",
+        "avatar_url": None,
+    },
+    {
+        "id": "visionary_leader",
+        "name": "鈴木役員",
+        "description": "ビジョナリーなリーダー。大局的な視点を重視する。",
+        "difficulty": 5,
+        "stress_triggers": ["短期思考", "創造性の欠如"],
+        "communication_style": "戦略的で鼓舞的",
+        "avatar_url": None,
+    },
+]
+
+
+def get_persona(persona_id: str) -> Optional[Dict[str, Any]]:
+    """Look up a registered persona by id"""
+    for persona in BOSS_PERSONAS:
+        if persona["id"] == persona_id:
+            return persona
+    return None
+
+
+# 会話開始の定番シーン (上司の最初の一言を事前生成しておく対象)
+OPENING_SCENARIOS: List[str] = [
+    "新しい会話の開始",
+    "月次進捗会議での報告",
+    "人事評価面談",
+    "急な締切変更への対応",
+    "チーム内紛争の解決",
+    "予算計画会議",
+    "四半期目標設定",
+]
@@ -0,0 +1,179 @@
+import os
+import time
+import random
+import asyncio
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+from scheduler import CallPreemptedError
+
+
+class ProbeStatus:
+    UNKNOWN = "unknown"
+    OK = "ok"
+    DEGRADED = "degraded"
+    FAILED = "failed"
+
+
+class ProbeResult:
+    __slots__ = ("checked_at", "ok", "latency_ms", "error")
+
+    def __init__(self, ok: bool, latency_ms: float, error: str = None):
+        self.checked_at = time.time()
+        self.ok = ok
+        self.latency_ms = latency_ms
+        self.error = error
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "checked_at": self.checked_at,
+            "ok": self.ok,
+            "latency_ms": round(self.latency_ms, 2),
+            "error": self.error,
+        }
+
+
+class ConnectivityProber:
+    """Checks each agent's model connectivity in the background and caches the results
+
+    Each target is probed every ``interval`` seconds with +/- ``jitter``
+    (a fraction of the interval) so workers do not probe in lockstep.
+    Health endpoints read the cached history; ``probe(force=True)`` runs
+    a fresh round, but at most once per ``min_force_interval`` seconds and
+    shared by concurrent callers.
+    """
+
+    def __init__(self, targets: Dict[str, Callable[[], Awaitable[Any]]], enabled: bool = None,
+                 interval: float = None, jitter: float = None, timeout: float = None,
+                 history: int = None, min_force_interval: float = None):
+        self.targets = targets
+        self.enabled = enabled if enabled is not None else (
+            os.getenv("PROBE_ENABLED", "true").lower() == "true"
+        )
+        self.interval = interval or float(os.getenv("PROBE_INTERVAL_SECONDS", "60"))
+        self.jitter = jitter if jitter is not None else float(os.getenv("PROBE_JITTER", "0.2"))
+        self.timeout = timeout or float(os.getenv("PROBE_TIMEOUT_SECONDS", "10"))
+        self.min_force_interval = min_force_interval if min_force_interval is not None else float(
+            os.getenv("PROBE_MIN_FORCE_INTERVAL_SECONDS", "5")
+        )
+        size = history or int(os.getenv("PROBE_HISTORY", "50"))
+        self.history: Dict[str, Deque[ProbeResult]] = {name: deque(maxlen=size) for name in targets}
+        self._loops: List[asyncio.Task] = []
+        self._round: Optional[asyncio.Task] = None
+        self._last_round = 0.0
+
+        self.probes = 0
+        self.failures = 0
+        self.forced = 0
+        self.preempted = 0
+        self.force_served_from_cache = 0
+
+    def start(self) -> None:
+        if not self.enabled or self._loops:
+            return
+        self._loops = [
+            asyncio.create_task(self._loop(name), name=f"probe-{name}") for name in self.targets
+        ]
+
+    async def stop(self) -> None:
+        for task in self._loops:
+            task.cancel()
+        await asyncio.gather(*self._loops, return_exceptions=True)
+        self._loops = []
+
+    async def _loop(self, name: str) -> None:
+        # 起動直後の一斉プローブを避けるため最初の実行もずらす
+        await asyncio.sleep(random.uniform(0, self.interval * max(self.jitter, 0.05)))
+        while True:
+            await self._probe_one(name)
+            await asyncio.sleep(self.interval * (1 + random.uniform(-self.jitter, self.jitter)))
+
+    async def _probe_one(self, name: str) -> Optional[ProbeResult]:
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(self.targets[name](), timeout=self.timeout)
+            result = ProbeResult(True, (time.perf_counter() - started) * 1000)
+        except CallPreemptedError:
+            # 負荷が高くて後回しにされただけで、接続の失敗ではないので記録しない
+            self.preempted += 1
+            return None
+        except asyncio.TimeoutError:
+            result = ProbeResult(False, (time.perf_counter() - started) * 1000, "timeout")
+        except Exception as e:
+            result = ProbeResult(False, (time.perf_counter() - started) * 1000, f"{type(e).__name__}: {e}")
+        self.history[name].append(result)
+        self.probes += 1
+        if not result.ok:
+            self.failures += 1
+        return result
+
+    async def probe(self, force: bool = False) -> Dict[str, Any]:
+        """Cached snapshot, or a fresh round of probes when ``force`` is set"""
+        if force:
+            self.forced += 1
+            if self._round is None and time.monotonic() - self._last_round < self.min_force_interval:
+                # 強制プローブの連打でモデルの割り当てを消費しない
+                self.force_served_from_cache += 1
+            else:
+                if self._round is None:
+                    self._round = asyncio.create_task(self._run_round())
+                await asyncio.shield(self._round)
+        return self.snapshot()
+
+    async def _run_round(self) -> None:
+        try:
+            await asyncio.gather(*(self._probe_one(name) for name in self.targets))
+        finally:
+            self._last_round = time.monotonic()
+            self._round = None
+
+    def _target_status(self, results: Deque[ProbeResult]) -> str:
+        if not results:
+            return ProbeStatus.UNKNOWN
+        if results[-1].ok:
+            return ProbeStatus.OK
+        # 直前に成功していれば一時的な失敗とみなす
+        return ProbeStatus.DEGRADED if len(results) > 1 and results[-2].ok else ProbeStatus.FAILED
+
+    def snapshot(self) -> Dict[str, Any]:
+        targets = {}
+        for name, results in self.history.items():
+            latencies = sorted(result.latency_ms for result in results if result.ok)
+            targets[name] = {
+                "status": self._target_status(results),
+                "last": results[-1].to_dict() if results else None,
+                "success_rate": round(sum(result.ok for result in results) / len(results), 3) if results else None,
+                "latency_ms": {
+                    "p50": round(latencies[len(latencies) // 2], 2),
+                    "p95": round(latencies[max(0, int(len(latencies) * 0.95) - 1)], 2),
+                    "p99": round(latencies[max(0, int(len(latencies) * 0.99) - 1)], 2),
+                } if latencies else None,
+            }
+
+        statuses = {target["status"] for target in targets.values()}
+        if not statuses or statuses == {ProbeStatus.UNKNOWN}:
+            status = ProbeStatus.UNKNOWN
+        elif statuses <= {ProbeStatus.OK, ProbeStatus.UNKNOWN}:
+            status = ProbeStatus.OK
+        elif ProbeStatus.FAILED in statuses:
+            status = ProbeStatus.FAILED
+        else:
+            status = ProbeStatus.DEGRADED
+        checked = [result.checked_at for results in self.history.values() for result in results]
+        return {
+            "status": status,
+            "enabled": self.enabled,
+            "interval_s": self.interval,
+            "last_checked_at": max(checked) if checked else None,
+            "targets": targets,
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "probes": self.probes,
+            "failures": self.failures,
+            "forced": self.forced,
+            "preempted": self.preempted,
+            "force_served_from_cache": self.force_served_from_cache,
+        }
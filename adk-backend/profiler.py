@@ -0,0 +1,207 @@
+import os
+import sys
+import time
+import asyncio
+import threading
+from collections import Counter
+from typing import Any, Dict, Optional
+
+
+class ProfilerBusyError(Exception):
+    """Raised when a capture is requested while another one is running"""
+
+
+class ProfileSession:
+    """Samples one thread's stack at a fixed interval into collapsed stacks
+
+    Samples are aggregated as ``frame;frame;frame -> count`` (outermost
+    frame first), the input format of flamegraph.pl and speedscope. With a
+    ``route`` the session only samples while a request on that route is in
+    flight and finishes after ``max_requests`` of them.
+    """
+
+    def __init__(
+        self,
+        thread_id: int,
+        interval: float,
+        max_stacks: int = 5000,
+        max_depth: int = 128,
+        route: str = None,
+        max_requests: int = 0,
+    ):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.max_stacks = max_stacks
+        self.max_depth = max_depth
+        self.route = route
+        self.remaining_requests = max_requests
+        self.active_requests = 0
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.started_at = time.time()
+        self.finished_at: Optional[float] = None
+        self._labels: Dict[Any, str] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler-sampler", daemon=True)
+        self._finished: Optional[asyncio.Event] = None
+
+    def start(self) -> "ProfileSession":
+        if self.route is not None:
+            self._finished = asyncio.Event()
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread.is_alive() and threading.current_thread() is not self._thread:
+            self._thread.join(timeout=1)
+        if self.finished_at is None:
+            self.finished_at = time.time()
+
+    async def wait_for_requests(self, timeout: float) -> None:
+        try:
+            await asyncio.wait_for(self._finished.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    def request_started(self, path: str) -> bool:
+        if path != self.route or self.remaining_requests <= 0:
+            return False
+        self.remaining_requests -= 1
+        self.active_requests += 1
+        return True
+
+    def request_finished(self) -> None:
+        self.active_requests -= 1
+        if self.remaining_requests <= 0 and self.active_requests == 0:
+            self._finished.set()
+
+    def _label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            label = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+            self._labels[code] = label
+        return label
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            if self.route is not None and self.active_requests == 0:
+                continue
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            labels = []
+            while frame is not None and len(labels) < self.max_depth:
+                labels.append(self._label(frame.f_code))
+                frame = frame.f_back
+            stack = ";".join(reversed(labels))
+            with self._lock:
+                # 異なるスタックの数に上限を設けてメモリを抑える
+                if stack not in self.stacks and len(self.stacks) >= self.max_stacks:
+                    stack = "[other]"
+                self.stacks[stack] += 1
+                self.samples += 1
+
+    def collapsed(self) -> str:
+        with self._lock:
+            stacks = self.stacks.most_common()
+        return "".join(f"{stack} {count}\n" for stack, count in stacks)
+
+    def to_dict(self, top: int = 20) -> Dict[str, Any]:
+        # 関数ごとの自己時間 (スタックの末尾) の上位
+        self_counts: Counter = Counter()
+        with self._lock:
+            stacks = list(self.stacks.items())
+        for stack, count in stacks:
+            self_counts[stack.rsplit(";", 1)[-1]] += count
+        finished_at = self.finished_at or time.time()
+        return {
+            "samples": self.samples,
+            "interval_ms": round(self.interval * 1000, 3),
+            "duration_s": round(finished_at - self.started_at, 3),
+            "route": self.route,
+            "distinct_stacks": len(self.stacks),
+            "top_self": [
+                {"frame": frame, "samples": count, "percent": round(count / self.samples * 100, 1)}
+                for frame, count in self_counts.most_common(top)
+            ] if self.samples else [],
+        }
+
+
+class Profiler:
+    """Continuous low-rate sampling plus on-demand captures of the event loop thread
+
+    Continuous sampling is enabled with ``PROFILER_ENABLED``; captures are
+    limited to one at a time, ``PROFILER_MAX_SECONDS`` long and at least
+    ``PROFILER_MIN_INTERVAL_MS`` apart per sample.
+    """
+
+    def __init__(self):
+        self.continuous_enabled = os.getenv("PROFILER_ENABLED", "false").lower() == "true"
+        self.continuous_interval = float(os.getenv("PROFILER_INTERVAL_MS", "100")) / 1000
+        self.capture_interval = float(os.getenv("PROFILER_CAPTURE_INTERVAL_MS", "5")) / 1000
+        self.min_interval = float(os.getenv("PROFILER_MIN_INTERVAL_MS", "1")) / 1000
+        self.max_seconds = float(os.getenv("PROFILER_MAX_SECONDS", "60"))
+        self.max_stacks = int(os.getenv("PROFILER_MAX_STACKS", "5000"))
+        self.continuous: Optional[ProfileSession] = None
+        self.capture: Optional[ProfileSession] = None
+        self.captures = 0
+
+    def start_continuous(self) -> None:
+        """Start background sampling of the calling (event loop) thread"""
+        if self.continuous_enabled and self.continuous is None:
+            self.continuous = ProfileSession(
+                threading.get_ident(), self.continuous_interval, self.max_stacks
+            ).start()
+
+    def reset_continuous(self) -> Optional[ProfileSession]:
+        """Return the continuous profile collected so far and start a new one"""
+        previous = self.continuous
+        if previous is not None:
+            previous.stop()
+            self.continuous = None
+            self.start_continuous()
+        return previous
+
+    def stop(self) -> None:
+        for session in (self.continuous, self.capture):
+            if session is not None:
+                session.stop()
+
+    async def capture_profile(
+        self, seconds: float = None, route: str = None, requests: int = 0, interval_ms: float = None
+    ) -> ProfileSession:
+        """Sample for ``seconds``, or during the next ``requests`` requests on ``route``"""
+        if self.capture is not None:
+            raise ProfilerBusyError("A profile capture is already running")
+        interval = max(self.min_interval, (interval_ms / 1000) if interval_ms else self.capture_interval)
+        timeout = min(seconds or self.max_seconds, self.max_seconds)
+        session = ProfileSession(
+            threading.get_ident(), interval, self.max_stacks,
+            route=route if requests > 0 else None, max_requests=requests
+        )
+        self.capture = session.start()
+        self.captures += 1
+        try:
+            if session.route is not None:
+                await session.wait_for_requests(timeout)
+            else:
+                await asyncio.sleep(timeout)
+        finally:
+            session.stop()
+            self.capture = None
+        return session
+
+    def request_started(self, path: str) -> Optional[ProfileSession]:
+        session = self.capture
+        if session is not None and session.route is not None and session.request_started(path):
+            return session
+        return None
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "continuous": self.continuous.to_dict(top=5) if self.continuous else None,
+            "capture_running": self.capture is not None,
+            "captures": self.captures,
+        }
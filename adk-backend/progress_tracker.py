@@ -0,0 +1,213 @@
+import os
+import time
+from array import array
+from typing import Dict, Any, List, Optional
+
+from models import AnalysisResult, StressLevel
+from shared_state import StateBackend, MemoryStateBackend
+
+# ストレスレベル → 遷移行列のインデックス
+STRESS_INDEX = {
+    StressLevel.LOW: 0,
+    StressLevel.MEDIUM: 1,
+    StressLevel.HIGH: 2,
+}
+STRESS_LABELS = [StressLevel.LOW.value, StressLevel.MEDIUM.value, StressLevel.HIGH.value]
+
+# 上限を超えたペルソナ id をまとめる集計キー
+OTHER_PERSONAS = "other"
+
+
+class RunningStats:
+    """Streaming statistics (Welford mean/variance, EWMA, min/max) for one score"""
+
+    __slots__ = ("count", "mean", "m2", "ewma", "minimum", "maximum")
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.ewma = 0.0
+        self.minimum = None
+        self.maximum = None
+
+    def update(self, value: float, alpha: float) -> None:
+        """Add one observation in O(1)"""
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+        # 最初の観測値でEWMAを初期化する
+        self.ewma = value if self.count == 1 else alpha * value + (1 - alpha) * self.ewma
+
+        if self.minimum is None or value < self.minimum:
+            self.minimum = value
+        if self.maximum is None or value > self.maximum:
+            self.maximum = value
+
+    @property
+    def variance(self) -> float:
+        """Sample variance of the observations so far"""
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    def to_state(self) -> List[Any]:
+        return [self.count, self.mean, self.m2, self.ewma, self.minimum, self.maximum]
+
+    @classmethod
+    def from_state(cls, state: List[Any]) -> "RunningStats":
+        stats = cls()
+        (stats.count, stats.mean, stats.m2, stats.ewma,
+         stats.minimum, stats.maximum) = state
+        return stats
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "mean": round(self.mean, 2),
+            "variance": round(self.variance, 2),
+            "stddev": round(self.variance ** 0.5, 2),
+            "ewma": round(self.ewma, 2),
+            "min": self.minimum,
+            "max": self.maximum,
+        }
+
+
+class UserProgress:
+    """Constant-size progress record for a single user"""
+
+    __slots__ = (
+        "performance",
+        "communication",
+        "stress_management",
+        "persona_counts",
+        "stress_transitions",
+        "turns",
+        "sessions",
+        "last_session_id",
+        "first_seen",
+        "last_seen",
+    )
+
+    def __init__(self):
+        self.performance = RunningStats()
+        self.communication = RunningStats()
+        self.stress_management = RunningStats()
+        # ペルソナ id はクライアント指定なので、種類数は ProgressTracker.max_personas までに制限する
+        self.persona_counts: Dict[str, int] = {}
+        # 3x3 のストレスレベル遷移行列 (行: 遷移前, 列: 遷移後)
+        self.stress_transitions = array("l", [0] * 9)
+        self.turns = 0
+        self.sessions = 0
+        self.last_session_id: Optional[str] = None
+        self.first_seen = time.time()
+        self.last_seen = self.first_seen
+
+    def to_state(self) -> List[Any]:
+        """Compact JSON-serializable form for the shared state backend"""
+        return [
+            self.performance.to_state(),
+            self.communication.to_state(),
+            self.stress_management.to_state(),
+            self.persona_counts,
+            list(self.stress_transitions),
+            self.turns,
+            self.sessions,
+            self.last_session_id,
+            self.first_seen,
+            self.last_seen,
+        ]
+
+    @classmethod
+    def from_state(cls, state: List[Any]) -> "UserProgress":
+        progress = cls()
+        progress.performance = RunningStats.from_state(state[0])
+        progress.communication = RunningStats.from_state(state[1])
+        progress.stress_management = RunningStats.from_state(state[2])
+        progress.persona_counts = dict(state[3])
+        progress.stress_transitions = array("l", state[4])
+        (progress.turns, progress.sessions, progress.last_session_id,
+         progress.first_seen, progress.last_seen) = state[5:]
+        return progress
+
+    def to_dict(self) -> Dict[str, Any]:
+        matrix = {
+            before: {
+                after: self.stress_transitions[i * 3 + j]
+                for j, after in enumerate(STRESS_LABELS)
+            }
+            for i, before in enumerate(STRESS_LABELS)
+        }
+        return {
+            "turns": self.turns,
+            "sessions": self.sessions,
+            "user_performance_score": self.performance.to_dict(),
+            "communication_effectiveness": self.communication.to_dict(),
+            "stress_management": self.stress_management.to_dict(),
+            "persona_counts": dict(self.persona_counts),
+            "stress_transitions": matrix,
+            "first_seen": self.first_seen,
+            "last_seen": self.last_seen,
+        }
+
+
+class ProgressTracker:
+    """Per-user incremental progress statistics
+
+    Records live in the shared state backend so every worker sees the same
+    statistics. Each update is a single atomic read-modify-write of a
+    constant-size record, so concurrent turns of one user are not lost.
+    """
+
+    KEY_PREFIX = "progress:"
+
+    def __init__(self, ewma_alpha: float = None, backend: StateBackend = None):
+        if ewma_alpha is None:
+            ewma_alpha = float(os.getenv("PROGRESS_EWMA_ALPHA", "0.3"))
+        self.ewma_alpha = ewma_alpha
+        self.max_personas = int(os.getenv("PROGRESS_MAX_PERSONAS", "20"))
+        self.backend = backend or MemoryStateBackend()
+
+    async def record(
+        self,
+        user_id: str,
+        persona_id: str,
+        analysis: AnalysisResult,
+        stress_before: StressLevel,
+        stress_after: StressLevel,
+        session_id: str = None,
+    ) -> UserProgress:
+        """Fold one training turn into the user's statistics in O(1)"""
+        alpha = self.ewma_alpha
+
+        def apply(state: Optional[List[Any]]) -> List[Any]:
+            progress = UserProgress.from_state(state) if state else UserProgress()
+            progress.performance.update(analysis.user_performance_score, alpha)
+            progress.communication.update(analysis.communication_effectiveness, alpha)
+            progress.stress_management.update(analysis.stress_management, alpha)
+
+            counted = persona_id
+            if counted not in progress.persona_counts and len(progress.persona_counts) >= self.max_personas:
+                counted = OTHER_PERSONAS
+            progress.persona_counts[counted] = progress.persona_counts.get(counted, 0) + 1
+
+            before = STRESS_INDEX.get(stress_before, 1)
+            after = STRESS_INDEX.get(stress_after, 1)
+            progress.stress_transitions[before * 3 + after] += 1
+
+            progress.turns += 1
+            if session_id is not None and session_id != progress.last_session_id:
+                progress.sessions += 1
+                progress.last_session_id = session_id
+            progress.last_seen = time.time()
+            return progress.to_state()
+
+        state = await self.backend.update(self.KEY_PREFIX + user_id, apply)
+        return UserProgress.from_state(state)
+
+    async def get_progress(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """Return the user's statistics without scanning any history"""
+        state = await self.backend.get(self.KEY_PREFIX + user_id)
+        if state is None:
+            return None
+        return {"user_id": user_id, **UserProgress.from_state(state).to_dict()}
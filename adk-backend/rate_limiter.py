@@ -0,0 +1,169 @@
+import os
+import time
+import math
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from shared_state import StateBackend
+
+DEFAULT_RATE_LIMITS = "/api/training/process=60/60,/api/training/analyze=5/60,/api/training/test=10/60"
+# X-User-Id / X-Session-Id ごとの追加の (より厳しい) 制限。クライアント識別 (APIキー/IP) の制限は置き換えない
+DEFAULT_USER_RATE_LIMITS = "/api/training/process=30/60,/api/training/analyze=3/60,/api/training/test=5/60"
+
+
+class RateLimitRule:
+    """``limit`` requests per ``period`` seconds, as a token bucket"""
+
+    __slots__ = ("path", "limit", "period")
+
+    def __init__(self, path: str, limit: int, period: float):
+        self.path = path
+        self.limit = limit
+        self.period = period
+
+    @property
+    def refill_rate(self) -> float:
+        return self.limit / self.period
+
+
+class RateLimitDecision:
+    __slots__ = ("allowed", "limit", "remaining", "reset_seconds", "retry_after")
+
+    def __init__(self, allowed: bool, limit: int, remaining: int, reset_seconds: int, retry_after: int):
+        self.allowed = allowed
+        self.limit = limit
+        self.remaining = remaining
+        self.reset_seconds = reset_seconds
+        self.retry_after = retry_after
+
+    def headers(self) -> Dict[str, str]:
+        headers = {
+            "RateLimit-Limit": str(self.limit),
+            "RateLimit-Remaining": str(self.remaining),
+            "RateLimit-Reset": str(self.reset_seconds),
+        }
+        if not self.allowed:
+            headers["Retry-After"] = str(self.retry_after)
+        return headers
+
+
+def parse_rate_limits(spec: str) -> List[RateLimitRule]:
+    """Parse ``"/path=limit/period,..."`` into rules"""
+    rules = []
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        path, rate = item.split("=", 1)
+        limit, period = rate.split("/", 1)
+        rules.append(RateLimitRule(path.strip(), int(limit), float(period)))
+    return rules
+
+
+class MemoryBucketStore:
+    """Bucket state for a single worker process"""
+
+    def __init__(self):
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+
+    async def update(self, key: str, fn: Callable[[Optional[Tuple[float, float]]], Tuple[float, float]],
+                     ttl: float) -> Tuple[float, float]:
+        """Replace the bucket with ``fn(current)`` (None if absent) and return it"""
+        # await を挟まないので同じプロセス内では不可分
+        state = fn(self._buckets.get(key))
+        self._buckets[key] = state
+        # period 以上更新のないバケットは満タンなので削除してメモリを抑える
+        if len(self._buckets) > 10000:
+            now = time.time()
+            self._buckets = {
+                k: v for k, v in self._buckets.items() if now - v[1] < ttl
+            }
+        return state
+
+
+class SharedBucketStore:
+    """Bucket state in the shared state backend for multi-worker deployments
+
+    The refill and the take happen in one atomic ``backend.update``, so
+    concurrent requests on any worker cannot spend the same token twice.
+    """
+
+    PREFIX = "ratelimit:"
+
+    def __init__(self, backend: StateBackend):
+        self.backend = backend
+
+    async def update(self, key: str, fn: Callable[[Optional[Tuple[float, float]]], Tuple[float, float]],
+                     ttl: float) -> Tuple[float, float]:
+        state = await self.backend.update(
+            self.PREFIX + key, lambda current: list(fn(tuple(current) if current else None)), ttl
+        )
+        return tuple(state)
+
+
+class RateLimiter:
+    """Token-bucket rate limiting per endpoint and client key"""
+
+    def __init__(self, rules: List[RateLimitRule] = None, store=None, max_tracked_keys: int = 1000,
+                 user_rules: List[RateLimitRule] = None):
+        if rules is None:
+            rules = parse_rate_limits(os.getenv("RATE_LIMITS", DEFAULT_RATE_LIMITS))
+        if user_rules is None:
+            user_rules = parse_rate_limits(os.getenv("USER_RATE_LIMITS", DEFAULT_USER_RATE_LIMITS))
+        self.rules = {rule.path: rule for rule in rules}
+        self.user_rules = {rule.path: rule for rule in user_rules}
+        self.store = store or MemoryBucketStore()
+        self.max_tracked_keys = max_tracked_keys
+
+        self.allowed: Dict[str, int] = {}
+        self.throttled: Dict[str, int] = {}
+        self.throttled_by_key: Dict[str, int] = {}
+
+    def rule_for(self, path: str) -> Optional[RateLimitRule]:
+        return self.rules.get(path)
+
+    def user_rule_for(self, path: str) -> Optional[RateLimitRule]:
+        return self.user_rules.get(path)
+
+    async def check(self, rule: RateLimitRule, client_key: str) -> RateLimitDecision:
+        """Consume one token for ``client_key`` on ``rule`` if available"""
+        now = time.time()
+        allowed = False
+
+        def take(state: Optional[Tuple[float, float]]) -> Tuple[float, float]:
+            # 競合時に再実行されることがあるので、判定は最後に適用された結果を使う
+            nonlocal allowed
+            if state is None:
+                tokens, updated_at = float(rule.limit), now
+            else:
+                # 他のワーカーが少し後の時刻で更新していても時刻を巻き戻さない
+                updated_at = max(now, state[1])
+                tokens = min(rule.limit, state[0] + (updated_at - state[1]) * rule.refill_rate)
+            allowed = tokens >= 1
+            return (tokens - 1 if allowed else tokens, updated_at)
+
+        tokens, _ = await self.store.update(f"{rule.path}:{client_key}", take, rule.period)
+
+        # 満タンまでの秒数 / 次の1トークンまでの秒数
+        reset_seconds = math.ceil((rule.limit - tokens) / rule.refill_rate)
+        retry_after = 0 if allowed else math.ceil((1 - tokens) / rule.refill_rate)
+        self._count(rule.path, client_key, allowed)
+        return RateLimitDecision(allowed, rule.limit, int(tokens), reset_seconds, retry_after)
+
+    def _count(self, path: str, client_key: str, allowed: bool) -> None:
+        if allowed:
+            self.allowed[path] = self.allowed.get(path, 0) + 1
+            return
+        self.throttled[path] = self.throttled.get(path, 0) + 1
+        if client_key not in self.throttled_by_key and len(self.throttled_by_key) >= self.max_tracked_keys:
+            client_key = "other"
+        self.throttled_by_key[client_key] = self.throttled_by_key.get(client_key, 0) + 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        top_keys = sorted(self.throttled_by_key.items(), key=lambda item: item[1], reverse=True)[:20]
+        return {
+            "rules": {path: f"{rule.limit}/{int(rule.period)}s" for path, rule in self.rules.items()},
+            "user_rules": {path: f"{rule.limit}/{int(rule.period)}s" for path, rule in self.user_rules.items()},
+            "allowed": dict(self.allowed),
+            "throttled": dict(self.throttled),
+            "throttled_by_key": dict(top_keys),
+        }
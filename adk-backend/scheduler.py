@@ -0,0 +1,246 @@
+import os
+import math
+import time
+import heapq
+import asyncio
+import itertools
+from enum import IntEnum
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+
+
+class Priority(IntEnum):
+    INTERACTIVE = 0
+    ANALYTICS = 1
+    BACKGROUND = 2
+
+
+# 呼び出し元のタスクから引き継がれる優先度クラスと公平性のキー
+current_priority: ContextVar[Priority] = ContextVar("call_priority", default=Priority.INTERACTIVE)
+current_user: ContextVar[str] = ContextVar("call_user", default="anonymous")
+# 退避されたバックグラウンド呼び出しを失敗させず、負荷が引いた後に再投入するか
+current_requeue: ContextVar[bool] = ContextVar("call_requeue", default=False)
+
+
+@contextmanager
+def scheduling(priority: Priority = None, user: str = None, requeue: bool = None):
+    """Set the priority class and fairness key for agent calls in this context
+
+    A nested block can only lower the priority, so background work that
+    reaches an analytics code path stays background. With ``requeue``,
+    preempted background calls wait out the burst instead of failing.
+    """
+    tokens = []
+    if priority is not None:
+        tokens.append((current_priority, current_priority.set(max(current_priority.get(), priority))))
+    if user:
+        tokens.append((current_user, current_user.set(user)))
+    if requeue is not None:
+        tokens.append((current_requeue, current_requeue.set(requeue)))
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+
+class CallPreemptedError(Exception):
+    """A queued background call was dropped to make room for higher-priority work"""
+
+
+class _Waiter:
+    __slots__ = ("tag", "seq", "user", "future", "enqueued_at", "requeue")
+
+    def __init__(self, tag: float, seq: int, user: str, future: asyncio.Future, requeue: bool = False):
+        self.tag = tag
+        self.seq = seq
+        self.user = user
+        self.future = future
+        self.enqueued_at = time.perf_counter()
+        self.requeue = requeue
+
+    def __lt__(self, other: "_Waiter") -> bool:
+        return (self.tag, self.seq) < (other.tag, other.seq)
+
+
+class _ClassQueue:
+    """Weighted fair queue across users within one priority class"""
+
+    def __init__(self):
+        self.heap: List[_Waiter] = []
+        self.virtual_time = 0.0
+        self.last_finish: Dict[str, float] = {}
+        self.running = 0
+        self.admitted = 0
+        self.preempted = 0
+        self.requeued = 0
+        self.waits = deque(maxlen=1000)
+
+    def push(self, waiter: _Waiter) -> None:
+        heapq.heappush(self.heap, waiter)
+
+    def next_tag(self, user: str, weight: float) -> float:
+        # 仮想終了時刻: ユーザーごとに直前の要求の後ろに並べる
+        tag = max(self.virtual_time, self.last_finish.get(user, 0.0)) + 1.0 / weight
+        self.last_finish[user] = tag
+        return tag
+
+    def pop(self) -> Optional[_Waiter]:
+        while self.heap:
+            waiter = heapq.heappop(self.heap)
+            if waiter.future.done():
+                continue
+            self.virtual_time = waiter.tag
+            if not self.heap:
+                self.last_finish.clear()
+            return waiter
+        self.last_finish.clear()
+        return None
+
+    @property
+    def queued(self) -> int:
+        return sum(1 for waiter in self.heap if not waiter.future.done())
+
+
+class PriorityScheduler:
+    """Admission control for agent calls by priority class
+
+    At most ``capacity`` calls run at once. Queued calls are admitted
+    strictly by class (interactive > analytics > background) and by
+    weighted fair queuing across users inside a class. Background calls
+    may use at most ``background_share`` of the capacity, and queued
+    background calls are preempted when ``preempt_depth`` higher-priority
+    calls are waiting. Preempted calls made with ``requeue`` are set aside
+    and queued again once no higher-priority call is waiting; the others
+    fail with ``CallPreemptedError``.
+    """
+
+    def __init__(self, capacity: int = None, background_share: float = None,
+                 preempt_depth: int = None, user_weights: Dict[str, float] = None):
+        self.capacity = capacity or int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+        share = background_share if background_share is not None else float(
+            os.getenv("SCHEDULER_BACKGROUND_SHARE", "0.5")
+        )
+        self.background_limit = max(1, math.floor(self.capacity * share))
+        self.preempt_depth = preempt_depth or int(
+            os.getenv("SCHEDULER_PREEMPT_QUEUE_DEPTH", str(self.capacity))
+        )
+        self.user_weights = user_weights or {}
+        self.queues = {priority: _ClassQueue() for priority in Priority}
+        self.running = 0
+        self._seq = itertools.count()
+        self._deferred: List[_Waiter] = []
+
+    def _can_run(self, priority: Priority) -> bool:
+        if self.running >= self.capacity:
+            return False
+        return priority != Priority.BACKGROUND or self.queues[priority].running < self.background_limit
+
+    def _admit(self, priority: Priority, wait: float) -> None:
+        queue = self.queues[priority]
+        self.running += 1
+        queue.running += 1
+        queue.admitted += 1
+        queue.waits.append(wait)
+
+    @asynccontextmanager
+    async def slot(self):
+        """Hold one unit of model capacity for the duration of the block"""
+        priority = current_priority.get()
+        await self._acquire(priority, current_user.get())
+        try:
+            yield
+        finally:
+            self.running -= 1
+            self.queues[priority].running -= 1
+            self._dispatch()
+
+    async def _acquire(self, priority: Priority, user: str) -> None:
+        queue = self.queues[priority]
+        # 同等以上の優先度の待ちがなければ即座に実行する
+        if self._can_run(priority) and not any(self.queues[p].queued for p in Priority if p <= priority):
+            self._admit(priority, 0.0)
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        waiter = _Waiter(
+            queue.next_tag(user, self.user_weights.get(user, 1.0)), next(self._seq), user, future,
+            requeue=current_requeue.get()
+        )
+        queue.push(waiter)
+        if priority != Priority.BACKGROUND:
+            self._maybe_preempt()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # 実行枠を割り当てられた直後にキャンセルされた場合は枠を返す
+                self.running -= 1
+                queue.running -= 1
+                self._dispatch()
+            raise
+
+    def _dispatch(self) -> None:
+        if self._deferred and not (
+            self.queues[Priority.INTERACTIVE].queued or self.queues[Priority.ANALYTICS].queued
+        ):
+            # 優先度の高い待ちが捌けたので、退避していた呼び出しを元の順序で戻す
+            background = self.queues[Priority.BACKGROUND]
+            for waiter in self._deferred:
+                if not waiter.future.done():
+                    background.push(waiter)
+                    background.requeued += 1
+            self._deferred = []
+        while self.running < self.capacity:
+            for priority in Priority:
+                if not self._can_run(priority):
+                    continue
+                waiter = self.queues[priority].pop()
+                if waiter is not None:
+                    self._admit(priority, time.perf_counter() - waiter.enqueued_at)
+                    waiter.future.set_result(None)
+                    break
+            else:
+                return
+
+    def _maybe_preempt(self) -> None:
+        pressure = self.queues[Priority.INTERACTIVE].queued + self.queues[Priority.ANALYTICS].queued
+        if pressure < self.preempt_depth:
+            return
+        background = self.queues[Priority.BACKGROUND]
+        for waiter in background.heap:
+            if not waiter.future.done():
+                if waiter.requeue:
+                    self._deferred.append(waiter)
+                else:
+                    waiter.future.set_exception(CallPreemptedError("Background call preempted under load"))
+                background.preempted += 1
+        background.heap.clear()
+        background.last_finish.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        classes = {}
+        for priority, queue in self.queues.items():
+            waits = sorted(queue.waits)
+            classes[priority.name.lower()] = {
+                "queued": queue.queued,
+                "running": queue.running,
+                "admitted": queue.admitted,
+                "preempted": queue.preempted,
+                "requeued": queue.requeued,
+                "wait_ms": {
+                    "mean": round(sum(waits) / len(waits) * 1000, 3),
+                    "p50": round(waits[len(waits) // 2] * 1000, 3),
+                    "p99": round(waits[max(0, int(len(waits) * 0.99) - 1)] * 1000, 3),
+                    "max": round(waits[-1] * 1000, 3),
+                } if waits else None,
+            }
+        return {
+            "capacity": self.capacity,
+            "running": self.running,
+            "background_limit": self.background_limit,
+            "deferred": sum(1 for waiter in self._deferred if not waiter.future.done()),
+            "classes": classes,
+        }
@@ -0,0 +1,305 @@
+import os
+import json
+import time
+import asyncio
+import sqlite3
+import tempfile
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple
+
+try:
+    from redis.exceptions import WatchError
+except ImportError:
+    # redis は任意の依存 (未導入でも互換クライアントを渡せば RedisStateBackend を使える)
+    class WatchError(Exception):
+        """Stand-in for ``redis.exceptions.WatchError`` when redis is not installed"""
+
+
+class StateBackend:
+    """Key/value store for state that must be shared between worker processes
+
+    Values must be JSON-serializable. ``ttl`` is in seconds; ``None`` means
+    the entry never expires.
+    """
+
+    name = "abstract"
+
+    async def get(self, key: str) -> Optional[Any]:
+        raise NotImplementedError
+
+    async def set(self, key: str, value: Any, ttl: float = None) -> None:
+        raise NotImplementedError
+
+    async def add(self, key: str, value: Any, ttl: float = None) -> bool:
+        """Set the key only if it is absent; return True if it was stored"""
+        raise NotImplementedError
+
+    async def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    async def update(self, key: str, fn: Callable[[Optional[Any]], Any], ttl: float = None) -> Any:
+        """Atomically replace the value with ``fn(current)`` (None if absent) and return it
+
+        ``fn`` may run more than once if another worker writes the key concurrently.
+        """
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        pass
+
+
+class MemoryStateBackend(StateBackend):
+    """Process-local backend (single worker only)
+
+    Values are stored by reference, so callers must not mutate what they get back.
+    Expired entries are dropped when read and swept every ``PURGE_EVERY`` writes.
+    """
+
+    name = "memory"
+
+    # 期限切れエントリの掃除を行う書き込み間隔 (SQLiteStateBackend と同じ)
+    PURGE_EVERY = 500
+
+    def __init__(self):
+        self._data: Dict[str, Tuple[Any, Optional[float]]] = {}
+        self._writes = 0
+
+    def _live(self, key: str) -> Optional[Tuple[Any, Optional[float]]]:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        if entry[1] is not None and entry[1] <= time.time():
+            del self._data[key]
+            return None
+        return entry
+
+    async def get(self, key: str) -> Optional[Any]:
+        entry = self._live(key)
+        return entry[0] if entry else None
+
+    async def set(self, key: str, value: Any, ttl: float = None) -> None:
+        self._data[key] = (value, time.time() + ttl if ttl else None)
+        self._writes += 1
+        if self._writes % self.PURGE_EVERY == 0:
+            self._purge_expired()
+
+    def _purge_expired(self) -> None:
+        now = time.time()
+        expired = [key for key, (_, expires_at) in self._data.items()
+                   if expires_at is not None and expires_at <= now]
+        for key in expired:
+            del self._data[key]
+
+    async def add(self, key: str, value: Any, ttl: float = None) -> bool:
+        if self._live(key) is not None:
+            return False
+        await self.set(key, value, ttl)
+        return True
+
+    async def delete(self, key: str) -> None:
+        self._data.pop(key, None)
+
+    async def update(self, key: str, fn: Callable[[Optional[Any]], Any], ttl: float = None) -> Any:
+        # await を挟まないので同じプロセス内では不可分
+        entry = self._live(key)
+        value = fn(entry[0] if entry else None)
+        await self.set(key, value, ttl)
+        return value
+
+
+class SQLiteStateBackend(StateBackend):
+    """Single-node backend shared by all workers through one SQLite file (WAL mode)
+
+    Queries run in a thread so a locked database (up to the 5s busy
+    timeout) does not stall the event loop.
+    """
+
+    name = "sqlite"
+
+    # 期限切れ行の掃除を行う書き込み間隔
+    PURGE_EVERY = 500
+
+    def __init__(self, path: str = None):
+        self.path = path or os.getenv(
+            "STATE_SQLITE_PATH", os.path.join(tempfile.gettempdir(), "boss-agent-state.db")
+        )
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._conn = sqlite3.connect(
+            self.path, isolation_level=None, check_same_thread=False, timeout=5.0
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS kv ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)"
+        )
+
+    async def get(self, key: str) -> Optional[Any]:
+        return await asyncio.to_thread(self._get, key)
+
+    async def set(self, key: str, value: Any, ttl: float = None) -> None:
+        await asyncio.to_thread(self._set, key, value, ttl)
+
+    async def add(self, key: str, value: Any, ttl: float = None) -> bool:
+        return await asyncio.to_thread(self._add, key, value, ttl)
+
+    async def delete(self, key: str) -> None:
+        await asyncio.to_thread(self._delete, key)
+
+    async def update(self, key: str, fn: Callable[[Optional[Any]], Any], ttl: float = None) -> Any:
+        return await asyncio.to_thread(self._update, key, fn, ttl)
+
+    async def close(self) -> None:
+        await asyncio.to_thread(self._close)
+
+    def _get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM kv WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+                (key, time.time()),
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _set(self, key: str, value: Any, ttl: float = None) -> None:
+        expires_at = time.time() + ttl if ttl else None
+        payload = json.dumps(value, ensure_ascii=False)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, payload, expires_at),
+            )
+            self._maybe_purge()
+
+    def _add(self, key: str, value: Any, ttl: float = None) -> bool:
+        now = time.time()
+        expires_at = now + ttl if ttl else None
+        payload = json.dumps(value, ensure_ascii=False)
+        with self._lock:
+            # 既存の行が期限切れの場合のみ上書きする
+            cursor = self._conn.execute(
+                "INSERT INTO kv (key, value, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = excluded.value, "
+                "expires_at = excluded.expires_at "
+                "WHERE kv.expires_at IS NOT NULL AND kv.expires_at <= ?",
+                (key, payload, expires_at, now),
+            )
+            self._maybe_purge()
+            return cursor.rowcount == 1
+
+    def _delete(self, key: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM kv WHERE key = ?", (key,))
+
+    def _update(self, key: str, fn: Callable[[Optional[Any]], Any], ttl: float = None) -> Any:
+        with self._lock:
+            # 書き込みロックを先に取り、他ワーカーとの読み書きの競合を防ぐ
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                row = self._conn.execute(
+                    "SELECT value FROM kv WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+                    (key, now),
+                ).fetchone()
+                value = fn(json.loads(row[0]) if row else None)
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)",
+                    (key, json.dumps(value, ensure_ascii=False), now + ttl if ttl else None),
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._maybe_purge()
+            return value
+
+    def _close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def _maybe_purge(self) -> None:
+        self._writes += 1
+        if self._writes % self.PURGE_EVERY == 0:
+            self._conn.execute(
+                "DELETE FROM kv WHERE expires_at IS NOT NULL AND expires_at <= ?",
+                (time.time(),),
+            )
+
+
+class RedisStateBackend(StateBackend):
+    """Backend for any Redis-compatible server (Redis, Valkey, KeyDB, ...)
+
+    Requires the optional ``redis`` package. A pre-built async client (for
+    example ``fakeredis.aioredis.FakeRedis()`` in local tests) can be passed
+    instead of a URL; its transactions must raise this module's ``WatchError``.
+    """
+
+    name = "redis"
+
+    def __init__(self, url: str = None, client: Any = None, prefix: str = None):
+        self.prefix = prefix if prefix is not None else os.getenv("STATE_KEY_PREFIX", "boss-agent:")
+        if client is None:
+            try:
+                import redis.asyncio as redis_asyncio
+            except ImportError as e:
+                raise RuntimeError(
+                    "STATE_BACKEND=redis requires the 'redis' package (pip install redis)"
+                ) from e
+            client = redis_asyncio.from_url(
+                url or os.getenv("STATE_REDIS_URL", "redis://localhost:6379/0")
+            )
+        self._client = client
+
+    async def get(self, key: str) -> Optional[Any]:
+        raw = await self._client.get(self.prefix + key)
+        return json.loads(raw) if raw is not None else None
+
+    async def set(self, key: str, value: Any, ttl: float = None) -> None:
+        await self._client.set(
+            self.prefix + key,
+            json.dumps(value, ensure_ascii=False),
+            px=int(ttl * 1000) if ttl else None,
+        )
+
+    async def add(self, key: str, value: Any, ttl: float = None) -> bool:
+        stored = await self._client.set(
+            self.prefix + key,
+            json.dumps(value, ensure_ascii=False),
+            px=int(ttl * 1000) if ttl else None,
+            nx=True,
+        )
+        return bool(stored)
+
+    async def delete(self, key: str) -> None:
+        await self._client.delete(self.prefix + key)
+
+    async def update(self, key: str, fn: Callable[[Optional[Any]], Any], ttl: float = None) -> Any:
+        name = self.prefix + key
+        async with self._client.pipeline(transaction=True) as pipe:
+            while True:
+                try:
+                    # 楽観的ロック: 読んでから書くまでに変更されたらやり直す
+                    await pipe.watch(name)
+                    raw = await pipe.get(name)
+                    value = fn(json.loads(raw) if raw is not None else None)
+                    pipe.multi()
+                    pipe.set(name, json.dumps(value, ensure_ascii=False), px=int(ttl * 1000) if ttl else None)
+                    await pipe.execute()
+                    return value
+                except WatchError:
+                    continue
+
+    async def close(self) -> None:
+        await self._client.close()
+
+
+def create_state_backend(kind: str = None) -> StateBackend:
+    """Create the backend selected by ``STATE_BACKEND`` (memory / sqlite / redis)"""
+    kind = (kind or os.getenv("STATE_BACKEND", "memory")).lower()
+    if kind == "memory":
+        return MemoryStateBackend()
+    if kind == "sqlite":
+        return SQLiteStateBackend()
+    if kind == "redis":
+        return RedisStateBackend()
+    raise ValueError(f"Unknown STATE_BACKEND: {kind}")
@@ -0,0 +1,260 @@
+"""Vectorized Monte Carlo simulation of trainee state dynamics
+
+Reimplements the update rules of ``VirtualBossADKSystem._update_user_state``
+(and therefore ``_update_user_state_frontend_format``, which applies the
+same rules) as NumPy operations over whole populations of simulated
+trainees, to study long-run behaviour when tuning persona difficulty.
+
+Usage:
+    python simulation.py --trainees 100000 --turns 50
+    python simulation.py --parity 100000
+"""
+import time
+import argparse
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+from local_replies import difficulty_level
+from personas import BOSS_PERSONAS
+
+# ストレスレベルのコード (StressLevel.LOW / MEDIUM / HIGH)
+LOW, MEDIUM, HIGH = 0, 1, 2
+STRESS_CODES = ("低", "中", "高")
+# フロントエンド形式 (stressLevel 0-100) で返す各コードの値 (_update_user_state_frontend_format と同じ)
+FRONTEND_STRESS = np.array([20, 50, 80], dtype=np.int32)
+
+
+def stress_code_from_frontend(stress_level: np.ndarray) -> np.ndarray:
+    """Frontend ``stressLevel`` (0-100) to stress codes, as ``_normalize_user_state`` does"""
+    return np.where(stress_level <= 30, LOW, np.where(stress_level <= 70, MEDIUM, HIGH)).astype(np.int32)
+
+
+def step_state(
+    stress: np.ndarray,
+    confidence: np.ndarray,
+    engagement: np.ndarray,
+    performance: np.ndarray,
+    communication: np.ndarray,
+    stress_management: np.ndarray,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """One turn of ``_update_user_state`` applied element-wise"""
+    # Python の // と同じく負の方向に切り捨てる
+    new_confidence = np.clip(confidence + (performance - 70) // 10, 1, 100)
+    new_engagement = np.clip(engagement + (communication - 70) // 15, 1, 100)
+
+    new_stress = stress.copy()
+    calm = stress_management > 80
+    strained = stress_management < 40
+    new_stress[calm] = np.maximum(stress[calm] - 1, LOW)
+    new_stress[strained] = np.minimum(stress[strained] + 1, HIGH)
+    return new_stress, new_confidence, new_engagement
+
+
+class PersonaScoreModel:
+    """Distribution of per-turn analysis scores for one persona
+
+    The performance score is normal around ``mean``, shifted by the
+    trainee's confidence and stress; communication and stress-management
+    scores scatter around it, mirroring how ``MockLlmAgent`` derives them.
+    """
+
+    def __init__(
+        self,
+        persona_id: str,
+        mean: float,
+        std: float = 8.0,
+        communication_noise: float = 6.0,
+        stress_noise: float = 9.0,
+        confidence_gain: float = 0.1,
+        stress_penalty: float = 4.0,
+    ):
+        self.persona_id = persona_id
+        self.mean = mean
+        self.std = std
+        self.communication_noise = communication_noise
+        self.stress_noise = stress_noise
+        self.confidence_gain = confidence_gain
+        self.stress_penalty = stress_penalty
+
+    @classmethod
+    def from_persona(cls, persona: Dict[str, Any]) -> "PersonaScoreModel":
+        # 難易度が高いほど平均スコアが下がる
+        return cls(persona["id"], mean=85 - 3 * difficulty_level(persona["difficulty"]))
+
+    def draw(
+        self, rng: np.random.Generator, stress: np.ndarray, confidence: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        size = stress.shape[0]
+        centre = self.mean + self.confidence_gain * (confidence - 50) - self.stress_penalty * stress
+        performance = np.rint(rng.normal(centre, self.std, size))
+        communication = np.rint(performance + rng.normal(0, self.communication_noise, size))
+        stress_management = np.rint(performance + rng.normal(0, self.stress_noise, size))
+        return (
+            np.clip(performance, 1, 100).astype(np.int32),
+            np.clip(communication, 1, 100).astype(np.int32),
+            np.clip(stress_management, 1, 100).astype(np.int32),
+        )
+
+
+def stationary_distribution(transitions: np.ndarray) -> np.ndarray:
+    """Stationary distribution of a 3x3 transition count matrix"""
+    totals = transitions.sum(axis=1, keepdims=True)
+    probabilities = np.divide(transitions, totals, out=np.eye(3), where=totals > 0)
+    eigenvalues, eigenvectors = np.linalg.eig(probabilities.T)
+    vector = np.real(eigenvectors[:, np.argmin(np.abs(eigenvalues - 1))])
+    return vector / vector.sum()
+
+
+def simulate(
+    model: PersonaScoreModel,
+    trainees: int = 10000,
+    turns: int = 50,
+    seed: Optional[int] = None,
+    initial_stress: int = MEDIUM,
+    initial_confidence: int = 50,
+    initial_engagement: int = 50,
+    keep_paths: bool = False,
+) -> Dict[str, Any]:
+    """Simulate ``trainees`` trainees for ``turns`` turns against one persona"""
+    rng = np.random.default_rng(seed)
+    stress = np.full(trainees, initial_stress, dtype=np.int32)
+    confidence = np.full(trainees, initial_confidence, dtype=np.int32)
+    engagement = np.full(trainees, initial_engagement, dtype=np.int32)
+
+    mean_confidence = np.empty(turns + 1)
+    mean_engagement = np.empty(turns + 1)
+    stress_occupancy = np.empty((turns + 1, 3))
+    transitions = np.zeros((3, 3), dtype=np.int64)
+    first_high = np.where(stress == HIGH, 0, -1)
+    paths = np.empty((3, turns + 1, trainees), dtype=np.int16) if keep_paths else None
+
+    def observe(turn: int) -> None:
+        mean_confidence[turn] = confidence.mean()
+        mean_engagement[turn] = engagement.mean()
+        stress_occupancy[turn] = np.bincount(stress, minlength=3) / trainees
+        if keep_paths:
+            paths[0, turn], paths[1, turn], paths[2, turn] = stress, confidence, engagement
+
+    observe(0)
+    for turn in range(1, turns + 1):
+        scores = model.draw(rng, stress, confidence)
+        new_stress, confidence, engagement = step_state(stress, confidence, engagement, *scores)
+        transitions += np.bincount(stress * 3 + new_stress, minlength=9).reshape(3, 3)
+        first_high[(first_high < 0) & (new_stress == HIGH)] = turn
+        stress = new_stress
+        observe(turn)
+
+    reached = first_high[first_high > 0]
+    burn_in = turns // 2
+    result = {
+        "persona_id": model.persona_id,
+        "trainees": trainees,
+        "turns": turns,
+        "mean_confidence": mean_confidence,
+        "mean_engagement": mean_engagement,
+        "stress_occupancy": stress_occupancy,
+        "transition_counts": transitions,
+        # 後半のターンの滞在割合 (経験的定常分布) と遷移行列から求めた定常分布
+        "empirical_stationary": stress_occupancy[burn_in:].mean(axis=0),
+        "markov_stationary": stationary_distribution(transitions),
+        "time_to_high": {
+            "reached_fraction": float((first_high >= 0).mean()),
+            "mean": float(reached.mean()) if reached.size else None,
+            "median": float(np.median(reached)) if reached.size else None,
+            "p90": float(np.percentile(reached, 90)) if reached.size else None,
+        },
+    }
+    if keep_paths:
+        result["paths"] = {"stress": paths[0], "confidence": paths[1], "engagement": paths[2]}
+    return result
+
+
+def check_parity(cases: int = 10000, seed: int = 0, frontend: bool = False) -> int:
+    """Compare ``step_state`` with the scalar update; returns mismatches
+
+    With ``frontend`` the inputs and outputs are in the frontend format and
+    the reference is ``_update_user_state_frontend_format``, the path the
+    API actually returns.
+    """
+    from adk_system import VirtualBossADKSystem
+    from models import AnalysisResult, StressLevel, UserState
+
+    levels = [StressLevel.LOW, StressLevel.MEDIUM, StressLevel.HIGH]
+    rng = np.random.default_rng(seed)
+    frontend_stress = rng.integers(0, 101, cases).astype(np.int32)
+    stress = stress_code_from_frontend(frontend_stress) if frontend else rng.integers(0, 3, cases).astype(np.int32)
+    confidence = rng.integers(1, 101, cases).astype(np.int32)
+    engagement = rng.integers(1, 101, cases).astype(np.int32)
+    performance = rng.integers(1, 101, cases).astype(np.int32)
+    communication = rng.integers(1, 101, cases).astype(np.int32)
+    stress_management = rng.integers(1, 101, cases).astype(np.int32)
+    new_stress, new_confidence, new_engagement = step_state(
+        stress, confidence, engagement, performance, communication, stress_management
+    )
+
+    # 更新処理は self の状態を使わないので、初期化せずに作ったインスタンスで呼び出す
+    system = VirtualBossADKSystem.__new__(VirtualBossADKSystem)
+    mismatches = 0
+    for i in range(cases):
+        analysis = AnalysisResult(
+            user_performance_score=int(performance[i]),
+            communication_effectiveness=int(communication[i]),
+            stress_management=int(stress_management[i]),
+            suggestions=[], improvement_areas=[],
+        )
+        if frontend:
+            expected = system._update_user_state_frontend_format(
+                UserState(stressLevel=int(frontend_stress[i]), confidenceLevel=int(confidence[i]),
+                          engagementLevel=int(engagement[i])),
+                analysis,
+            )
+            actual = (expected.stressLevel, expected.confidenceLevel, expected.engagementLevel)
+            wanted = (FRONTEND_STRESS[new_stress[i]], new_confidence[i], new_engagement[i])
+        else:
+            expected = system._update_user_state(
+                UserState(stress_level=levels[stress[i]], confidence=int(confidence[i]),
+                          engagement=int(engagement[i])),
+                analysis,
+            )
+            actual = (expected.stress_level, expected.confidence, expected.engagement)
+            wanted = (levels[new_stress[i]], new_confidence[i], new_engagement[i])
+        if actual != wanted:
+            mismatches += 1
+    return mismatches
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--trainees", type=int, default=100000)
+    parser.add_argument("--turns", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--parity", type=int, metavar="CASES",
+                        help="only check parity with the scalar implementation")
+    args = parser.parse_args()
+
+    if args.parity:
+        failed = False
+        for name, frontend in (("backend", False), ("frontend", True)):
+            mismatches = check_parity(args.parity, frontend=frontend)
+            print(f"parity ({name} format): {args.parity - mismatches}/{args.parity} cases match")
+            failed = failed or mismatches > 0
+        raise SystemExit(1 if failed else 0)
+
+    for persona in BOSS_PERSONAS:
+        started = time.perf_counter()
+        result = simulate(PersonaScoreModel.from_persona(persona), args.trainees, args.turns, args.seed)
+        elapsed = time.perf_counter() - started
+        stationary = ", ".join(
+            f"{code}={share:.2f}" for code, share in zip(STRESS_CODES, result["empirical_stationary"])
+        )
+        high = result["time_to_high"]
+        print(
+            f"{persona['id']:<24} {args.trainees * args.turns / elapsed / 1e6:6.1f}M turns/s | "
+            f"confidence {result['mean_confidence'][-1]:5.1f} | stress {stationary} | "
+            f"reached 高 {high['reached_fraction']:.0%} (median turn {high['median']})"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+import os
+import time
+import asyncio
+import unicodedata
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from usage import RequestUsage, usage_scope
+
+
+def normalize_draft(text: str) -> str:
+    """Width-fold and collapse whitespace; drafts equal after this share a reply"""
+    return " ".join(unicodedata.normalize("NFKC", text).split())
+
+
+class Speculation:
+    __slots__ = ("key", "draft", "task", "usage", "created_at")
+
+    def __init__(self, key: str, draft: str, task: asyncio.Task, usage: RequestUsage):
+        self.key = key
+        self.draft = draft
+        self.task = task
+        self.usage = usage
+        self.created_at = time.time()
+
+
+class SpeculativeReplies:
+    """Boss replies generated ahead of submit from drafts that stopped changing
+
+    One speculation is kept per session. ``take`` returns it when the
+    submitted message equals the speculated draft after normalization and
+    the conversation ``key`` (persona, trainee state, context) is
+    unchanged; otherwise it is cancelled or counted as wasted. Spend is
+    capped by concurrent speculations and tokens per minute.
+    """
+
+    def __init__(self, enabled: bool = None, min_chars: int = None, max_in_flight: int = None,
+                 max_tokens_per_minute: int = None, ttl: float = None):
+        self.enabled = enabled if enabled is not None else (
+            os.getenv("SPECULATION_ENABLED", "true").lower() == "true"
+        )
+        self.stable_seconds = float(os.getenv("SPECULATION_STABLE_MS", "600")) / 1000
+        self.min_chars = min_chars or int(os.getenv("SPECULATION_MIN_CHARS", "10"))
+        self.max_in_flight = max_in_flight or int(os.getenv("SPECULATION_MAX_IN_FLIGHT", "8"))
+        self.max_tokens_per_minute = max_tokens_per_minute or int(
+            os.getenv("SPECULATION_MAX_TOKENS_PER_MINUTE", "20000")
+        )
+        self.ttl = ttl or float(os.getenv("SPECULATION_TTL_SECONDS", "120"))
+        self._entries: Dict[str, Speculation] = {}
+        self._spent = deque()
+
+        self.started = 0
+        self.rejected_by_cap = 0
+        self.hits = 0
+        self.late_hits = 0
+        self.mismatches = 0
+        self.failed = 0
+        self.cancelled_in_flight = 0
+        self.wasted = 0
+        self.used_tokens = 0
+        self.wasted_tokens = 0
+
+    def _tokens_last_minute(self) -> int:
+        cutoff = time.time() - 60
+        while self._spent and self._spent[0][0] < cutoff:
+            self._spent.popleft()
+        return sum(tokens for _, tokens in self._spent)
+
+    def speculate(self, session_id: str, key: str, draft: str,
+                  generate: Callable[[], Awaitable[Any]]) -> bool:
+        """Start generating for a stable draft; returns False when skipped"""
+        draft = normalize_draft(draft)
+        entry = self._entries.get(session_id)
+        if entry is not None and entry.key == key and entry.draft == draft:
+            return False
+        self.discard(session_id)
+        if len(draft) < self.min_chars:
+            return False
+        in_flight = sum(1 for entry in self._entries.values() if not entry.task.done())
+        if in_flight >= self.max_in_flight or self._tokens_last_minute() >= self.max_tokens_per_minute:
+            self.rejected_by_cap += 1
+            return False
+
+        usage = RequestUsage()
+
+        async def run():
+            # この投機で使ったトークンを個別に数える
+            try:
+                with usage_scope(request=usage):
+                    return await generate()
+            finally:
+                self._spent.append((time.time(), usage.total_tokens))
+
+        self._entries[session_id] = Speculation(key, draft, asyncio.create_task(run()), usage)
+        self.started += 1
+        if self.started % 100 == 0:
+            self._evict_expired()
+        return True
+
+    def in_flight(self, session_id: str) -> bool:
+        entry = self._entries.get(session_id)
+        return entry is not None and not entry.task.done()
+
+    def discard(self, session_id: str) -> None:
+        entry = self._entries.pop(session_id, None)
+        if entry is None:
+            return
+        if not entry.task.done():
+            entry.task.cancel()
+            self.cancelled_in_flight += 1
+        elif entry.task.cancelled() or entry.task.exception() is not None:
+            return
+        else:
+            self.wasted += 1
+            self.wasted_tokens += entry.usage.total_tokens
+
+    async def take(self, session_id: str, key: str, message: str) -> Optional[Any]:
+        """The speculated reply if it was generated for this exact message and state
+
+        None when there is no matching speculation or its generation failed,
+        so the caller generates the reply itself.
+        """
+        entry = self._entries.get(session_id)
+        if entry is None:
+            return None
+        if entry.key != key or entry.draft != normalize_draft(message):
+            self.mismatches += 1
+            self.discard(session_id)
+            return None
+
+        del self._entries[session_id]
+        late = not entry.task.done()
+        try:
+            # 生成中なら最初から呼び出すより早いので完了を待つ
+            result = await asyncio.shield(entry.task)
+        except asyncio.CancelledError:
+            if entry.task.cancelled():
+                return None
+            if not entry.task.done():
+                # 待っていたリクエストが取り消されたら生成も止める
+                entry.task.cancel()
+                self.cancelled_in_flight += 1
+            raise
+        except Exception:
+            self.failed += 1
+            self.wasted_tokens += entry.usage.total_tokens
+            return None
+        if late:
+            self.late_hits += 1
+        else:
+            self.hits += 1
+        self.used_tokens += entry.usage.total_tokens
+        return result
+
+    def _evict_expired(self) -> None:
+        cutoff = time.time() - self.ttl
+        for session_id in [sid for sid, entry in self._entries.items() if entry.created_at < cutoff]:
+            self.discard(session_id)
+
+    def get_stats(self) -> Dict[str, Any]:
+        served = self.hits + self.late_hits
+        return {
+            "enabled": self.enabled,
+            "started": self.started,
+            "rejected_by_cap": self.rejected_by_cap,
+            "hits": self.hits,
+            "late_hits": self.late_hits,
+            "mismatches": self.mismatches,
+            "failed": self.failed,
+            "hit_rate": round(served / (served + self.mismatches), 3) if served + self.mismatches else None,
+            "cancelled_in_flight": self.cancelled_in_flight,
+            "wasted": self.wasted,
+            "used_tokens": self.used_tokens,
+            "wasted_tokens": self.wasted_tokens,
+            "tokens_last_minute": self._tokens_last_minute(),
+            "in_flight": sum(1 for entry in self._entries.values() if not entry.task.done()),
+        }
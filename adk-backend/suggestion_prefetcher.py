@@ -0,0 +1,163 @@
+import os
+import time
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from shared_state import StateBackend, MemoryStateBackend
+from scheduler import Priority, scheduling
+
+
+class PrefetchEntry:
+    __slots__ = ("turn", "task", "created_at", "served")
+
+    def __init__(self, turn: int, task: asyncio.Task):
+        self.turn = turn
+        self.task = task
+        self.created_at = time.time()
+        self.served = False
+
+
+class SuggestionPrefetcher:
+    """Speculatively generates suggested replies right after each boss turn
+
+    One entry is kept per session (the latest boss turn). When the trainee
+    answers before asking for suggestions, the prefetch is cancelled or
+    counted as wasted.
+    """
+
+    PREFIX = "suggestions:"
+
+    def __init__(
+        self,
+        generate: Callable[[str], Awaitable[List[str]]],
+        backend: StateBackend = None,
+        ttl: float = None,
+    ):
+        self.generate = generate
+        self.backend = backend or MemoryStateBackend()
+        self.ttl = ttl or float(os.getenv("SUGGESTION_TTL_SECONDS", "300"))
+        self._entries: Dict[str, PrefetchEntry] = {}
+        self._turns: Dict[str, int] = {}
+        # 共有ステートへの削除で完了待ちのもの (セッションごとに最新の1件)
+        self._deletes: Dict[str, asyncio.Task] = {}
+
+        self.scheduled = 0
+        self.hits = 0
+        self.late_hits = 0
+        self.misses = 0
+        self.cancelled_in_flight = 0
+        self.unused = 0
+
+    def schedule(self, session_id: str, prompt: str) -> int:
+        """Start generating suggestions for the session's new boss turn"""
+        # 共有ステートの前のターンの候補は discard で削除済みで、新しい結果で上書きされる
+        self._drop(session_id)
+        turn = self._turns.get(session_id, 0) + 1
+        self._turns[session_id] = turn
+        task = asyncio.create_task(self._run(session_id, turn, prompt))
+        self._entries[session_id] = PrefetchEntry(turn, task)
+        self.scheduled += 1
+        if self.scheduled % 100 == 0:
+            self._evict_expired()
+        return turn
+
+    def discard(self, session_id: str) -> None:
+        """The trainee responded: drop the previous turn's prefetch"""
+        # 他のワーカーが前のターンの候補を共有ステートから返さないように消す
+        task = asyncio.create_task(self._delete(session_id, self._deletes.get(session_id)))
+        self._deletes[session_id] = task
+
+        def forget(done: asyncio.Task) -> None:
+            if self._deletes.get(session_id) is done:
+                del self._deletes[session_id]
+
+        task.add_done_callback(forget)
+        self._drop(session_id)
+
+    async def _delete(self, session_id: str, previous: Optional[asyncio.Task]) -> None:
+        # 同じセッションの削除は順に行い、最新の削除の完了 = それ以前の削除の完了とする
+        if previous is not None:
+            await asyncio.wait({previous})
+        await self.backend.delete(self.PREFIX + session_id)
+
+    def _drop(self, session_id: str) -> None:
+        entry = self._entries.pop(session_id, None)
+        if entry is None:
+            return
+        if not entry.task.done():
+            entry.task.cancel()
+            self.cancelled_in_flight += 1
+        elif not entry.served:
+            self.unused += 1
+
+    async def get(self, session_id: str, wait: float = 0.0) -> Dict[str, Any]:
+        """Serve prefetched suggestions, waiting up to ``wait`` seconds if still in flight"""
+        entry = self._entries.get(session_id)
+        if entry is None:
+            # 他のワーカーで生成された結果を共有ステートから探す
+            stored = await self.backend.get(self.PREFIX + session_id)
+            if stored is None:
+                self.misses += 1
+                return {"status": "miss", "suggestions": []}
+            self.hits += 1
+            return {"status": "hit", **stored}
+
+        if not entry.task.done():
+            try:
+                await asyncio.wait_for(asyncio.shield(entry.task), timeout=wait)
+            except asyncio.TimeoutError:
+                return {"status": "pending", "turn": entry.turn, "suggestions": []}
+            except asyncio.CancelledError:
+                # プリフェッチ側のキャンセルは miss 扱い、呼び出し元のキャンセルは伝播させる
+                if not entry.task.cancelled():
+                    raise
+            else:
+                if entry.task.result() is not None:
+                    self.late_hits += 1
+                    entry.served = True
+                    return {"status": "hit", "turn": entry.turn, "suggestions": entry.task.result()}
+
+        if entry.task.cancelled() or entry.task.result() is None:
+            self.misses += 1
+            return {"status": "error", "turn": entry.turn, "suggestions": []}
+
+        self.hits += 1
+        entry.served = True
+        return {"status": "hit", "turn": entry.turn, "suggestions": entry.task.result()}
+
+    async def _run(self, session_id: str, turn: int, prompt: str) -> Optional[List[str]]:
+        try:
+            with scheduling(Priority.BACKGROUND):
+                suggestions = await self.generate(prompt)
+        except Exception:
+            return None
+        pending_delete = self._deletes.get(session_id)
+        if pending_delete is not None:
+            # 前のターンの削除が後から届いてこの結果を消さないように、削除の完了を待ってから保存する
+            await asyncio.wait({pending_delete})
+        await self.backend.set(
+            self.PREFIX + session_id, {"turn": turn, "suggestions": suggestions}, self.ttl
+        )
+        return suggestions
+
+    def _evict_expired(self) -> None:
+        cutoff = time.time() - self.ttl
+        for session_id in [sid for sid, entry in self._entries.items() if entry.created_at < cutoff]:
+            self.discard(session_id)
+            self._turns.pop(session_id, None)
+
+    def get_stats(self) -> Dict[str, Any]:
+        served = self.hits + self.late_hits
+        requested = served + self.misses
+        return {
+            "scheduled": self.scheduled,
+            "hits": self.hits,
+            "late_hits": self.late_hits,
+            "misses": self.misses,
+            "hit_rate": round(served / requested, 3) if requested else None,
+            "cancelled_in_flight": self.cancelled_in_flight,
+            "unused": self.unused,
+            # 利用されなかった生成呼び出し (キャンセル + 未使用)
+            "wasted_calls": self.cancelled_in_flight + self.unused,
+            "in_flight": sum(1 for entry in self._entries.values() if not entry.task.done()),
+        }
@@ -0,0 +1,62 @@
+import asyncio
+import itertools
+
+from models import BossPersona, BossResponse
+from opening_pool import OpeningPool
+from personas import BOSS_PERSONAS
+from shared_state import SQLiteStateBackend
+
+PERSONAS = [BossPersona(**persona) for persona in BOSS_PERSONAS[:2]]
+SCENARIOS = ["月次進捗会議での報告"]
+
+
+def run_pools(path, scenario_work):
+    """Two workers' pools on one SQLite state file; returns the generate calls"""
+    counter = itertools.count()
+    calls = []
+
+    async def generate(persona, scenario, avoid):
+        calls.append((persona.id, scenario))
+        await asyncio.sleep(0.01)
+        return BossResponse(message=f"opening {next(counter)}", emotional_state="冷静", stress_level="低")
+
+    async def run():
+        pools = [
+            OpeningPool(generate, backend=SQLiteStateBackend(path), enabled=True, depth=2, ttl=0.4)
+            for _ in range(2)
+        ]
+        for pool in pools:
+            pool.start(PERSONAS, SCENARIOS)
+        try:
+            return await scenario_work(pools)
+        finally:
+            for pool in pools:
+                await pool.stop()
+
+    return asyncio.run(run()), calls
+
+
+def test_workers_fill_one_shared_pool(tmp_path):
+    async def work(pools):
+        await asyncio.sleep(0.2)
+        served = await pools[1].take(PERSONAS[0], SCENARIOS[0])
+        await asyncio.sleep(0.1)
+        return served
+
+    served, calls = run_pools(str(tmp_path / "state.db"), work)
+
+    assert served is not None
+    # 2 キー × 2 件を 1 回ずつ (ワーカーの数だけ増えない) + 取り出し後の補充 1 回
+    assert len(calls) == 5
+
+
+def test_idle_pool_is_not_regenerated(tmp_path):
+    async def work(pools):
+        await asyncio.sleep(1.5)
+        return [pool.get_stats() for pool in pools]
+
+    stats, calls = run_pools(str(tmp_path / "state.db"), work)
+
+    assert len(calls) == 4
+    assert all("sweep" not in s["refill_calls"] for s in stats)
+    assert sum(s["idle_skips"] for s in stats) > 0
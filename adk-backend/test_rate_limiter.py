@@ -0,0 +1,61 @@
+import asyncio
+
+from fastapi.testclient import TestClient
+
+import main
+from rate_limiter import RateLimiter, RateLimitRule, SharedBucketStore
+from shared_state import RedisStateBackend, SQLiteStateBackend
+from test_shared_state import FakeRedis, FakeRedisServer
+
+FRONTEND_ORIGIN = "http://localhost:3000"
+
+
+def test_throttled_response_carries_cors_headers(monkeypatch):
+    monkeypatch.setattr(
+        main, "rate_limiter", RateLimiter(rules=[RateLimitRule("/live", 1, 60)], user_rules=[])
+    )
+    client = TestClient(main.app)
+
+    assert client.get("/live", headers={"Origin": FRONTEND_ORIGIN}).status_code == 200
+    response = client.get("/live", headers={"Origin": FRONTEND_ORIGIN})
+
+    assert response.status_code == 429
+    assert response.headers["access-control-allow-origin"] == FRONTEND_ORIGIN
+    # ブラウザから 429 の Retry-After を読めること
+    assert "Retry-After" in response.headers["access-control-expose-headers"]
+    assert int(response.headers["retry-after"]) > 0
+
+
+def admitted_concurrently(limiters, requests_per_limiter=10):
+    """Requests admitted when several workers hit one bucket at the same time"""
+    rule = RateLimitRule("/api/training/process", 5, 60)
+
+    async def run():
+        decisions = await asyncio.gather(*(
+            limiter.check(rule, "ip:1.2.3.4")
+            for limiter in limiters for _ in range(requests_per_limiter)
+        ))
+        return sum(decision.allowed for decision in decisions)
+
+    return asyncio.run(run())
+
+
+def test_shared_buckets_admit_exactly_the_limit_on_sqlite(tmp_path):
+    path = str(tmp_path / "state.db")
+    backends = [SQLiteStateBackend(path), SQLiteStateBackend(path)]
+    limiters = [RateLimiter(rules=[], user_rules=[], store=SharedBucketStore(backend)) for backend in backends]
+
+    assert admitted_concurrently(limiters) == 5
+
+
+def test_shared_buckets_admit_exactly_the_limit_on_redis():
+    server = FakeRedisServer()
+    limiters = [
+        RateLimiter(rules=[], user_rules=[], store=SharedBucketStore(
+            RedisStateBackend(client=FakeRedis(server), prefix="t:")
+        ))
+        for _ in range(2)
+    ]
+
+    assert admitted_concurrently(limiters) == 5
+    assert server.conflicts > 0
@@ -0,0 +1,145 @@
+import asyncio
+import time
+
+from shared_state import (
+    MemoryStateBackend,
+    RedisStateBackend,
+    SQLiteStateBackend,
+    WatchError,
+)
+
+
+class FakeRedisServer:
+    """In-process stand-in for the few Redis commands RedisStateBackend uses"""
+
+    def __init__(self):
+        self.data = {}
+        self.versions = {}
+        self.conflicts = 0
+
+    def read(self, name):
+        entry = self.data.get(name)
+        if entry is None or (entry[1] is not None and entry[1] <= time.monotonic()):
+            return None
+        return entry[0]
+
+    def write(self, name, raw, px=None):
+        self.data[name] = (raw.encode(), time.monotonic() + px / 1000 if px else None)
+        self.versions[name] = self.versions.get(name, 0) + 1
+
+
+class FakePipeline:
+    def __init__(self, server):
+        self.server = server
+        self.watched = {}
+        self.commands = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.watched, self.commands = {}, []
+
+    async def watch(self, name):
+        self.watched[name] = self.server.versions.get(name, 0)
+
+    async def get(self, name):
+        # 別の接続の書き込みが割り込めるように一度制御を返す
+        await asyncio.sleep(0)
+        return self.server.read(name)
+
+    def multi(self):
+        self.commands = []
+
+    def set(self, name, raw, px=None):
+        self.commands.append((name, raw, px))
+        return self
+
+    async def execute(self):
+        await asyncio.sleep(0)
+        watched, commands = self.watched, self.commands
+        self.watched, self.commands = {}, []
+        if any(self.server.versions.get(name, 0) != version for name, version in watched.items()):
+            self.server.conflicts += 1
+            raise WatchError("watched key changed")
+        for name, raw, px in commands:
+            self.server.write(name, raw, px)
+        return [True] * len(commands)
+
+
+class FakeRedis:
+    def __init__(self, server):
+        self.server = server
+
+    async def get(self, name):
+        return self.server.read(name)
+
+    async def set(self, name, raw, px=None, nx=False):
+        if nx and self.server.read(name) is not None:
+            return None
+        self.server.write(name, raw, px)
+        return True
+
+    async def delete(self, name):
+        self.server.data.pop(name, None)
+        self.server.versions[name] = self.server.versions.get(name, 0) + 1
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self.server)
+
+    async def close(self):
+        pass
+
+
+def increment(value):
+    return {"count": (value or {"count": 0})["count"] + 1}
+
+
+async def contend(backends, per_backend=25):
+    """Increment one key concurrently from several backends (= workers)"""
+    await asyncio.gather(*(
+        backend.update("counter", increment, ttl=60)
+        for backend in backends for _ in range(per_backend)
+    ))
+    return await backends[0].get("counter")
+
+
+def test_memory_update_is_atomic():
+    backend = MemoryStateBackend()
+    assert asyncio.run(contend([backend])) == {"count": 25}
+
+
+def test_sqlite_update_is_atomic_across_connections(tmp_path):
+    path = str(tmp_path / "state.db")
+
+    async def run():
+        backends = [SQLiteStateBackend(path), SQLiteStateBackend(path)]
+        try:
+            return await contend(backends)
+        finally:
+            for backend in backends:
+                await backend.close()
+
+    assert asyncio.run(run()) == {"count": 50}
+
+
+def test_redis_update_retries_on_conflict():
+    server = FakeRedisServer()
+    backends = [RedisStateBackend(client=FakeRedis(server), prefix="t:") for _ in range(2)]
+
+    assert asyncio.run(contend(backends)) == {"count": 50}
+    # 競合が実際に起き、やり直しで解消されたこと
+    assert server.conflicts > 0
+
+
+def test_redis_add_and_ttl():
+    backend = RedisStateBackend(client=FakeRedis(FakeRedisServer()), prefix="t:")
+
+    async def run():
+        assert await backend.add("k", {"v": 1}, ttl=0.05)
+        assert not await backend.add("k", {"v": 2})
+        assert await backend.get("k") == {"v": 1}
+        await asyncio.sleep(0.06)
+        return await backend.get("k")
+
+    assert asyncio.run(run()) is None
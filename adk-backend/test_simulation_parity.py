@@ -0,0 +1,9 @@
+import pytest
+
+from simulation import check_parity
+
+
+@pytest.mark.parametrize("frontend", [False, True], ids=["backend_format", "frontend_format"])
+def test_step_state_matches_scalar_update(frontend):
+    # 5000 件あれば境界値 (stressLevel 30/31, 70/71、スコア 40/80 など) も含まれる
+    assert check_parity(5000, seed=1, frontend=frontend) == 0
@@ -0,0 +1,20 @@
+def estimate_tokens(text: str) -> int:
+    """Rough token count when the provider reports no usage metadata
+
+    Japanese text is roughly one token per character; ASCII text is
+    roughly four characters per token.
+    """
+    if not text:
+        return 0
+    ascii_chars = sum(1 for char in text if char.isascii())
+    return (len(text) - ascii_chars) + (ascii_chars + 3) // 4
+
+
+class AgentText(str):
+    """Agent response text carrying the provider-reported token usage"""
+
+    def __new__(cls, text: str, input_tokens: int, output_tokens: int):
+        instance = super().__new__(cls, text)
+        instance.input_tokens = input_tokens
+        instance.output_tokens = output_tokens
+        return instance
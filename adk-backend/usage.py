@@ -0,0 +1,251 @@
+import os
+import logging
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class UsageCounter:
+    __slots__ = ("calls", "input_tokens", "output_tokens", "cost_usd")
+
+    def __init__(self):
+        self.calls = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.cost_usd = 0.0
+
+    def add(self, input_tokens: int, output_tokens: int, cost_usd: float) -> None:
+        self.calls += 1
+        self.input_tokens += input_tokens
+        self.output_tokens += output_tokens
+        self.cost_usd += cost_usd
+
+    @property
+    def total_tokens(self) -> int:
+        return self.input_tokens + self.output_tokens
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "input_tokens": self.input_tokens,
+            "output_tokens": self.output_tokens,
+            "total_tokens": self.total_tokens,
+            "cost_usd": round(self.cost_usd, 6),
+        }
+
+
+class RequestUsage(UsageCounter):
+    """Usage of a single HTTP request, returned in the X-Token-Usage header"""
+
+    __slots__ = ("budget_exceeded",)
+
+    def __init__(self):
+        super().__init__()
+        self.budget_exceeded = False
+
+    def header(self) -> str:
+        return (
+            f"input={self.input_tokens}, output={self.output_tokens}, "
+            f"calls={self.calls}, cost_usd={self.cost_usd:.6f}"
+        )
+
+
+class UsageScope:
+    __slots__ = ("endpoint", "persona_id", "session_id", "request")
+
+    def __init__(self, endpoint: str = None, persona_id: str = None,
+                 session_id: str = None, request: RequestUsage = None):
+        self.endpoint = endpoint
+        self.persona_id = persona_id
+        self.session_id = session_id
+        self.request = request
+
+
+_current_scope: ContextVar[Optional[UsageScope]] = ContextVar("usage_scope", default=None)
+# まとめて送った呼び出し (分析のバッチ) の使用量を各依頼元に按分するための (スコープ, 重み)
+_split_scopes: ContextVar[Optional[List[Tuple[UsageScope, float]]]] = ContextVar("usage_split", default=None)
+
+
+def current_usage_scope() -> UsageScope:
+    return _current_scope.get() or UsageScope()
+
+
+@contextmanager
+def usage_split(shares: List[Tuple[UsageScope, float]]):
+    """Divide the usage of agent calls in this context across several scopes by weight"""
+    token = _split_scopes.set(shares)
+    try:
+        yield
+    finally:
+        _split_scopes.reset(token)
+
+
+@contextmanager
+def usage_scope(endpoint: str = None, persona_id: str = None,
+                session_id: str = None, request: RequestUsage = None, background: bool = False):
+    """Label agent calls in this context; unset labels are inherited from the outer scope
+
+    With ``background`` the outer request is not inherited: work started
+    while serving a request (prefetches, probes, pool refills) is not
+    billed to that request's ``X-Token-Usage``.
+    """
+    outer = _current_scope.get() or UsageScope()
+    scope = UsageScope(
+        endpoint or outer.endpoint,
+        persona_id or outer.persona_id,
+        session_id or outer.session_id,
+        request or (None if background else outer.request),
+    )
+    token = _current_scope.set(scope)
+    try:
+        yield scope
+    finally:
+        _current_scope.reset(token)
+
+
+class UsageTracker:
+    """Token and cost totals by agent, persona, endpoint and session
+
+    Costs use ``TOKEN_COST_INPUT_PER_1K`` / ``TOKEN_COST_OUTPUT_PER_1K``
+    (USD). A warning is logged once per session when it exceeds
+    ``SESSION_TOKEN_BUDGET`` tokens. Totals are per worker process.
+    Persona and endpoint labels come from clients, so like sessions only
+    the most recently used ``USAGE_MAX_LABELS`` of each are kept.
+    """
+
+    def __init__(self, input_cost_per_1k: float = None, output_cost_per_1k: float = None,
+                 session_budget: int = None, max_sessions: int = None):
+        self.input_cost_per_1k = input_cost_per_1k if input_cost_per_1k is not None else float(
+            os.getenv("TOKEN_COST_INPUT_PER_1K", "0.000075")
+        )
+        self.output_cost_per_1k = output_cost_per_1k if output_cost_per_1k is not None else float(
+            os.getenv("TOKEN_COST_OUTPUT_PER_1K", "0.0003")
+        )
+        self.session_budget = session_budget if session_budget is not None else int(
+            os.getenv("SESSION_TOKEN_BUDGET", "0")
+        )
+        self.max_sessions = max_sessions or int(os.getenv("USAGE_MAX_SESSIONS", "10000"))
+        self.max_labels = int(os.getenv("USAGE_MAX_LABELS", "1000"))
+
+        self.total = UsageCounter()
+        self.by_agent: Dict[str, UsageCounter] = {}
+        self.by_persona: "OrderedDict[str, UsageCounter]" = OrderedDict()
+        self.by_endpoint: "OrderedDict[str, UsageCounter]" = OrderedDict()
+        self.by_session: "OrderedDict[str, UsageCounter]" = OrderedDict()
+        self.over_budget: "OrderedDict[str, int]" = OrderedDict()
+        self.budget_alerts = 0
+        self.cancelled_output_estimate = int(os.getenv("CANCELLED_OUTPUT_TOKENS_ESTIMATE", "200"))
+        self.cancelled: Dict[str, Dict[str, Any]] = {}
+
+    def cost(self, input_tokens: int, output_tokens: int) -> float:
+        return (input_tokens * self.input_cost_per_1k + output_tokens * self.output_cost_per_1k) / 1000
+
+    @staticmethod
+    def _counter(table: Dict[str, UsageCounter], key: str) -> UsageCounter:
+        counter = table.get(key)
+        if counter is None:
+            counter = table[key] = UsageCounter()
+        return counter
+
+    def _label_counter(self, table: "OrderedDict[str, UsageCounter]", key: str) -> UsageCounter:
+        counter = table.pop(key, None) or UsageCounter()
+        # 最近使われたラベルを末尾に保ち、古いものから削除する
+        table[key] = counter
+        if len(table) > self.max_labels:
+            table.popitem(last=False)
+        return counter
+
+    def record(self, agent_id: str, input_tokens: int, output_tokens: int) -> None:
+        """Add one agent call, labelled with the current usage scope (or split across ``usage_split``)"""
+        cost = self.cost(input_tokens, output_tokens)
+        self.total.add(input_tokens, output_tokens, cost)
+        self._counter(self.by_agent, agent_id).add(input_tokens, output_tokens, cost)
+
+        shares = _split_scopes.get() or [(current_usage_scope(), 1.0)]
+        total_weight = sum(weight for _, weight in shares)
+        for scope, weight in shares:
+            fraction = weight / total_weight if total_weight else 1 / len(shares)
+            self._record_scope(
+                scope, round(input_tokens * fraction), round(output_tokens * fraction), cost * fraction
+            )
+
+    def _record_scope(self, scope: UsageScope, input_tokens: int, output_tokens: int, cost: float) -> None:
+        self._label_counter(self.by_persona, scope.persona_id or "none").add(input_tokens, output_tokens, cost)
+        self._label_counter(self.by_endpoint, scope.endpoint or "internal").add(input_tokens, output_tokens, cost)
+        if scope.request is not None:
+            scope.request.add(input_tokens, output_tokens, cost)
+        if scope.session_id:
+            self._record_session(scope, input_tokens, output_tokens, cost)
+
+    def _record_session(self, scope: UsageScope, input_tokens: int, output_tokens: int, cost: float) -> None:
+        session = self.by_session.pop(scope.session_id, None) or UsageCounter()
+        session.add(input_tokens, output_tokens, cost)
+        # 最近使われたセッションを末尾に保ち、古いものから削除する
+        self.by_session[scope.session_id] = session
+        if len(self.by_session) > self.max_sessions:
+            self.by_session.popitem(last=False)
+
+        if not self.session_budget or session.total_tokens <= self.session_budget:
+            return
+        if scope.request is not None:
+            scope.request.budget_exceeded = True
+        if scope.session_id not in self.over_budget:
+            self.budget_alerts += 1
+            self.over_budget[scope.session_id] = session.total_tokens
+            if len(self.over_budget) > 100:
+                self.over_budget.popitem(last=False)
+            logger.warning(
+                "Session %s exceeded its token budget: %d > %d tokens (%.4f USD)",
+                scope.session_id, session.total_tokens, self.session_budget, session.cost_usd
+            )
+
+    def record_cancelled(self, agent_id: str, input_tokens: int, sent: bool) -> None:
+        """Count an agent call cancelled before it returned and the tokens it did not spend
+
+        The output is estimated from the agent's mean output so far; the
+        input is saved only when the call was still queued and never sent.
+        """
+        agent = self.by_agent.get(agent_id)
+        output_tokens = (
+            agent.output_tokens // agent.calls if agent and agent.calls else self.cancelled_output_estimate
+        )
+        saved_input = 0 if sent else input_tokens
+        counts = self.cancelled.setdefault(agent_id, {
+            "calls": 0, "queued": 0, "estimated_tokens_saved": 0, "estimated_cost_saved_usd": 0.0
+        })
+        counts["calls"] += 1
+        counts["queued"] += 0 if sent else 1
+        counts["estimated_tokens_saved"] += saved_input + output_tokens
+        counts["estimated_cost_saved_usd"] += self.cost(saved_input, output_tokens)
+
+    def get_session(self, session_id: str) -> Optional[Dict[str, Any]]:
+        session = self.by_session.get(session_id)
+        if session is None:
+            return None
+        return {
+            "session_id": session_id,
+            **session.to_dict(),
+            "budget_tokens": self.session_budget or None,
+            "over_budget": bool(self.session_budget) and session.total_tokens > self.session_budget,
+        }
+
+    def get_stats(self, top_sessions: int = 20) -> Dict[str, Any]:
+        top = sorted(self.by_session.items(), key=lambda item: item[1].total_tokens, reverse=True)
+        return {
+            "total": self.total.to_dict(),
+            "by_agent": {key: counter.to_dict() for key, counter in self.by_agent.items()},
+            "by_persona": {key: counter.to_dict() for key, counter in self.by_persona.items()},
+            "by_endpoint": {key: counter.to_dict() for key, counter in self.by_endpoint.items()},
+            "top_sessions": {key: counter.to_dict() for key, counter in top[:top_sessions]},
+            "sessions_tracked": len(self.by_session),
+            "session_budget_tokens": self.session_budget or None,
+            "budget_alerts": self.budget_alerts,
+            "sessions_over_budget": dict(self.over_budget),
+            "cancelled": {
+                agent_id: {**counts, "estimated_cost_saved_usd": round(counts["estimated_cost_saved_usd"], 6)}
+                for agent_id, counts in self.cancelled.items()
+            },
+        }